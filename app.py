@@ -8,10 +8,12 @@ import re
 import sys
 import requests
 import shutil
-from flask import Flask, request, jsonify, render_template, redirect, send_file
+from flask import Flask, request, jsonify, render_template, redirect, send_file, session
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
+from werkzeug.middleware.proxy_fix import ProxyFix
 from datetime import datetime
+from sqlalchemy.exc import IntegrityError
 import openai  # 旧版本openai库
 import config
 import PyPDF2
@@ -27,14 +29,41 @@ from pptx.util import Inches  # 设置PPT元素尺寸
 from docx import Document
 from pptx import Presentation
 from models import db, Student, Assignment, QuestionBank, QuestionSubmission, VideoNote, Conversation, \
-    ConversationMessage  # 新增QuestionBank
+    ConversationMessage, SubmissionArtifact, AutogradeConfig, QuestionExposure, QuestionItemStats, \
+    LectureLibraryEntry, CodeReviewSession  # 新增QuestionBank
+from utils.artifact_store import store_artifact, get_artifact_path
+from utils.code_summary import build_condensed_submission
+from utils.similarity_index import index_artifact, find_similar_artifacts, estimate_similarity, lsh_bucket_keys
+from utils.answer_matching import match_answer
+from utils.item_analysis import update_item_stats, item_report
+from utils.quiz_assembly import assemble_quiz, next_adaptive_question, normalize_mix
+from utils.code_fingerprint import explanation_cache_key, find_cached_explanation, save_cached_explanation
+from utils.review_session import load_session, plan_review, save_session, SUMMARY_INSTRUCTION
+from utils.media_transcript import (SUBTITLE_EXTENSIONS, load_transcript, chunk_cues, transcript_text,
+                                    map_reduce_summarize, transcript_input_hash)
+from utils.lecture_library import (source_text_hash, file_stream_hash, url_hash, find_lecture, save_lecture,
+                                   list_visible_lectures)
+from utils.question_bank import (source_fingerprint, select_unseen_questions, record_exposures,
+                                 save_generated_questions)
+from utils.autograder import (
+    detect_language, run_test_suite, run_test_suites, format_test_report, public_test_results, public_test_cases,
+    sandbox_unavailable_reason, MIN_TIME_LIMIT, MAX_TIME_LIMIT
+)
 from models_membership import User, MembershipTier, UserMembership, PaymentTransaction, UsageLog
 from models_order import Order, OrderRefund
 from utils.security import (
     validate_password_strength, validate_username, validate_email, sanitize_input,
-    record_login_attempt, is_account_locked, get_remaining_attempts
+    record_login_attempt, is_account_locked, get_ip_throttle, get_remaining_attempts
 )
-from membership_utils import feature_limit, check_feature_access, log_feature_usage, get_usage_stats
+from membership_utils import feature_limit, skip_feature_usage, check_feature_access, log_feature_usage, get_usage_stats
+from utils.usage_counters import get_usage_summary, summary_count
+from utils.membership_cache import invalidate_membership
+from utils.write_behind import log_buffer, record_admin_log
+from utils.usage_rollups import apply_usage_rollups, rollup_series, bucket_range
+from utils.tier_inventory import reserve_for_payment
+from utils.tier_catalog import get_tier_catalog, tier_dict, invalidate_tier_catalog
+from utils.membership_expiry import expiry_job, get_expiry_metrics
+from utils.entitlements import get_entitlements, validate_permissions, save_entitlements
 from config import DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL
 from flask_migrate import Migrate
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
@@ -42,6 +71,8 @@ from flask_mail import Mail
 from datetime import datetime, timedelta
 # 导入自定义认证装饰器
 from utils.auth_decorators import require_login_api, require_membership
+from utils.admin_decorators import api_admin_required
+from models_admin import Admin
 # 导入验证码模型和邮件服务
 from models_verification import VerificationCode
 from utils.email_service import EmailService
@@ -79,8 +110,16 @@ except (OSError, PermissionError):
     # Vercel等无服务器环境是只读文件系统，跳过目录创建
     pass
 
+# 部署在反向代理之后时从 X-Forwarded-* 取真实客户端IP和协议
+if app.config.get('TRUSTED_PROXY_COUNT', 0) > 0:
+    _proxies = app.config['TRUSTED_PROXY_COUNT']
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=_proxies, x_proto=_proxies, x_host=_proxies)
+
 # 初始化数据库
 db.init_app(app)
+log_buffer.init_app(app)  # 使用日志/管理员日志批量写入
+log_buffer.after_insert(UsageLog, apply_usage_rollups)  # 同步累加后台图表用的汇总
+expiry_job.init_app(app)  # 到期会员定时失效
 migrate = Migrate(app, db)
 
 # 初始化邮件服务
@@ -419,10 +458,10 @@ def api_init_database():
 def api_unlock_account(username):
     """解锁被锁定的账户"""
     try:
-        from models import LoginAttempt
-        # 删除该用户的所有登录尝试记录
-        LoginAttempt.query.filter_by(username=username).delete()
-        db.session.commit()
+        from utils.security import unlock_account
+        # 清除该用户及相关IP的失败计数（登录记录保留用于审计）
+        if not unlock_account(username, clear_ips=True):
+            return jsonify({'success': False, 'error': '解锁失败'}), 500
         return jsonify({
             'success': True,
             'message': f'账户 {username} 已解锁'
@@ -1051,6 +1090,202 @@ def get_k12_grades(stage):
         return jsonify({'error': f'获取年级失败: {str(e)}'}), 500
 
 
+# 作业批改通用的AI调用，返回 {'score': ..., 'feedback': ...}
+def request_ai_grading(user_prompt):
+    response = openai.ChatCompletion.create(
+        model=config.DEEPSEEK_MODEL,
+        messages=[
+            {"role": "system", "content": "你是一位精通编程的助手，负责批改学生提交的编程作业。"},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0.3,
+        max_tokens=4096,
+        stream=False
+    )
+
+    ai_response = response.choices[0].message.content.strip()
+    try:
+        grading_result = json.loads(ai_response)
+        if not isinstance(grading_result,
+                          dict) or 'score' not in grading_result or 'feedback' not in grading_result:
+            raise ValueError('AI返回的结果格式不正确')
+    except json.JSONDecodeError:
+        score_match = re.search(r'score["\s:]+(\d+)', ai_response)
+        score = float(score_match.group(1)) if score_match else None
+        feedback_match = re.search(r'feedback["\s:]+(.+?)(?:}|$)', ai_response, re.DOTALL)
+        feedback = feedback_match.group(1).strip().strip('"\'') if feedback_match else ai_response
+        grading_result = {'score': score, 'feedback': feedback}
+    return grading_result
+
+
+# 解析提交文件为 {文件名: 文本内容}
+def extract_submission_contents(file_path, filename, work_dir):
+    file_contents = {}
+    file_extension = filename.rsplit('.', 1)[1].lower()
+    if file_extension == 'zip':
+        extract_path = os.path.join(work_dir, 'extracted')
+        os.makedirs(extract_path, exist_ok=True)
+        with zipfile.ZipFile(file_path, 'r') as zip_ref:
+            zip_ref.extractall(extract_path)
+        for root, _, files in os.walk(extract_path):
+            for file_name in files:
+                if file_name.endswith(('.c', '.py', '.cpp', '.java')):
+                    current_file_path = os.path.join(root, file_name)
+                    relative_path = os.path.relpath(current_file_path, extract_path)
+                    with open(current_file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                        file_contents[relative_path] = f.read()
+    elif file_extension == 'pdf':
+        file_contents[filename] = parse_pdf(file_path)
+    elif file_extension == 'docx':
+        file_contents[filename] = parse_docx(file_path)
+    elif file_extension == 'pptx':
+        file_contents[filename] = parse_pptx(file_path)
+    else:
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            file_contents[filename] = f.read()
+    return file_contents
+
+
+# 查找作业的自动评测配置（优先匹配科目）
+def get_autograde_config(assignment_name, subject=None):
+    if not assignment_name:
+        return None
+    query = AutogradeConfig.query.filter_by(assignment_name=assignment_name)
+    if subject:
+        matched = query.filter_by(subject=subject).first()
+        if matched:
+            return matched
+    return query.first()
+
+
+# 根据测试结果批改：tests_only 模式直接出分，否则只请AI基于测试结果写简短反馈
+# 评测沙箱不可用时返回 None，由调用方改用AI批改（不能把 0 分保存为成绩）
+def grade_with_tests(autograde_config, file_contents, assignment_name, test_result=None):
+    if test_result is None:
+        test_result = run_test_suite(
+            file_contents,
+            autograde_config.test_cases_data,
+            language=autograde_config.language,
+            time_limit=autograde_config.time_limit,
+            memory_limit_mb=autograde_config.memory_limit_mb
+        )
+    if test_result.get('sandbox_unavailable'):
+        app.logger.warning(f"{assignment_name} 未能运行测试用例，改用AI批改: {test_result['compile_error']}")
+        return None
+    report = format_test_report(test_result)
+    grading_result = {'score': test_result['score'], 'feedback': report, 'test_results': test_result}
+    if autograde_config.grading_mode == 'tests_only':
+        return grading_result
+
+    code = format_submission_content(file_contents)
+    feedback_prompt = f"""
+    作业: {assignment_name}
+    自动评测结果:
+    {report}
+    学生代码:
+    {code}
+    分数已由测试用例确定，请不要重新打分。请结合评测结果，用不超过300字指出主要问题和改进建议。
+    """
+    try:
+        response = openai.ChatCompletion.create(
+            model=config.DEEPSEEK_MODEL,
+            messages=[
+                {"role": "system", "content": "你是一位编程助教，根据自动评测结果给学生简短的改进建议。"},
+                {"role": "user", "content": feedback_prompt}
+            ],
+            temperature=0.3,
+            max_tokens=600,
+            stream=False
+        )
+        ai_feedback = sanitize_ai_response(response.choices[0].message.content)
+        grading_result['feedback'] = f"{report}\n\n{ai_feedback}"
+    except Exception as e:
+        # AI反馈失败时仍保留测试结果
+        app.logger.warning(f"生成评测反馈失败: {str(e)}")
+    return grading_result
+
+
+# 生成提示词中的提交内容，代码文件先做静态分析并替换为精简表示
+def format_submission_content(file_contents):
+    if not getattr(config.Config, 'CODE_SUMMARY_ENABLED', True):
+        submission_content = ""
+        for file_name, content in file_contents.items():
+            submission_content += f"文件: {file_name}\n\n{content}\n\n---\n\n"
+        return submission_content
+    submission_content, stats = build_condensed_submission(
+        file_contents, getattr(config.Config, 'CODE_SUMMARY_MAX_CHARS', 6000)
+    )
+    app.logger.debug(f"提交内容精简: {stats['original_tokens']} -> {stats['condensed_tokens']} tokens")
+    return submission_content
+
+
+# 保存提交文件及其提取文本，失败时不影响批改
+# 在保存点中执行，失败只回滚这一步，不影响同一会话中之后的作业记录提交
+def archive_submission(file_path, filename, file_contents):
+    for attempt in range(2):
+        try:
+            with db.session.begin_nested():
+                artifact = store_artifact(file_path, filename)
+                if not artifact.extracted_text:
+                    artifact.extracted_text = json.dumps(file_contents, ensure_ascii=False)
+            return artifact
+        except IntegrityError:
+            # 其它请求同时保存了相同内容的文件，重试一次即可复用已入库的记录
+            if attempt:
+                app.logger.warning(f"保存提交文件失败: {filename} 并发写入冲突")
+        except Exception as e:
+            app.logger.warning(f"保存提交文件失败: {str(e)}")
+            return None
+    return None
+
+
+# 为提交建立相似度索引，失败时不影响批改
+def index_submission(artifact, file_contents):
+    if artifact is None:
+        return None
+    try:
+        return index_artifact(artifact, file_contents)
+    except Exception as e:
+        app.logger.warning(f"建立相似度索引失败: {str(e)}")
+        return None
+
+
+# 查找其他学生的相似提交；batch_owners 为本批次中尚未入库的 {artifact_id: Student}
+def find_similar_submissions(signature, student_id, batch_owners=None, threshold=None):
+    if not signature:
+        return []
+    if threshold is None:
+        threshold = config.Config.SIMILARITY_PLAGIARISM_THRESHOLD
+    matches = dict(find_similar_artifacts(signature, threshold))
+    if not matches:
+        return []
+
+    similar = {}
+    for other_id, other in (batch_owners or {}).items():
+        if other_id in matches and other.student_id != student_id:
+            similar[(other.student_id, None)] = {
+                'student_id': other.student_id,
+                'student_name': other.name,
+                'assignment_id': None,
+                'assignment_name': None,
+                'similarity': round(matches[other_id], 3)
+            }
+    others = Assignment.query.filter(
+        Assignment.artifact_id.in_(list(matches.keys())),
+        Assignment.student_id != student_id
+    ).all()
+    for other in others:
+        similar.pop((other.student_id, None), None)
+        similar[(other.student_id, other.assignment_name)] = {
+            'student_id': other.student_id,
+            'student_name': other.student.name if other.student else None,
+            'assignment_id': other.id,
+            'assignment_name': other.assignment_name,
+            'similarity': round(matches[other.artifact_id], 3)
+        }
+    return sorted(similar.values(), key=lambda item: item['similarity'], reverse=True)
+
+
 @app.route('/api/submit', methods=['POST'])
 @csrf.exempt
 def submit_assignment():
@@ -1072,92 +1307,59 @@ def submit_assignment():
     temp_dir = tempfile.mkdtemp()
     file_path = os.path.join(temp_dir, secure_filename(file.filename))
     file.save(file_path)
-    file_contents = {}
-    file_extension = file.filename.rsplit('.', 1)[1].lower()
 
     # 处理不同文件类型
-    if file_extension == 'zip':
-        extract_path = os.path.join(temp_dir, 'extracted')
-        os.makedirs(extract_path, exist_ok=True)
-        try:
-            with zipfile.ZipFile(file_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_path)
-            for root, _, files in os.walk(extract_path):
-                for file_name in files:
-                    if file_name.endswith(('.c', '.py', '.cpp', '.java')):
-                        current_file_path = os.path.join(root, file_name)
-                        relative_path = os.path.relpath(current_file_path, extract_path)
-                        with open(current_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                            file_contents[relative_path] = f.read()
-        except zipfile.BadZipFile:
-            return jsonify({'error': '无效的zip文件'}), 400
-    elif file_extension == 'pdf':
-        file_contents[file.filename] = parse_pdf(file_path)
-    elif file_extension == 'docx':
-        file_contents[file.filename] = parse_docx(file_path)
-    elif file_extension == 'pptx':
-        file_contents[file.filename] = parse_pptx(file_path)
-    else:
-        try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                file_contents[file.filename] = f.read()
-        except Exception as e:
-            return jsonify({'error': f'读取文件错误: {str(e)}'}), 500
     try:
-        submission_content = ""
-        for file_name, content in file_contents.items():
-            submission_content += f"文件: {file_name}\n\n{content}\n\n---\n\n"
-        user_prompt = f"""
-        [作业批改助手]
-        作业名称: {assignment_name}
-        学科: {subject}
-        章节: {chapter}
-        学生ID: {student_id}
-        学生提交的内容:
-        {submission_content}
-        评分标准:
-        针对{subject}学科的{chapter}章节内容，按照以下标准评分:
-        1. 知识掌握程度 (40分)
-           - 是否符合本章节核心概念
-        2. 应用能力 (30分)
-           - 是否能正确应用本章节所学
-        3. 创新性 (20分)
-           - 是否有超出本章节的深入思考
-        4. 表达清晰度 (10分)
-           - 逻辑是否清晰，表述是否准确
-        请提供具体的改进建议，特别是针对{subject}学科{chapter}章节的知识点。
-        返回以下格式的 JSON:
-        {{
-            "score": 分数,
-            "feedback": "详细的反馈内容"
-        }}
-        仅输出JSON格式，不要有其他文本。
-        """
-
-        response = openai.ChatCompletion.create(
-            model=config.DEEPSEEK_MODEL,
-            messages=[
-                {"role": "system", "content": "你是一位精通编程的助手，负责批改学生提交的编程作业。"},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.3,
-            max_tokens=4096,
-            stream=False
-        )
+        file_contents = extract_submission_contents(file_path, file.filename, temp_dir)
+    except zipfile.BadZipFile:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return jsonify({'error': '无效的zip文件'}), 400
+    except Exception as e:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return jsonify({'error': f'读取文件错误: {str(e)}'}), 500
+    try:
+        # 在删除临时目录前保存文件，便于日后重新批改
+        artifact = archive_submission(file_path, file.filename, file_contents)
+        signature = index_submission(artifact, file_contents)
+
+        autograde_config = get_autograde_config(assignment_name, subject)
+        grading_result = None
+        if autograde_config and detect_language(file_contents):
+            # 配置了测试用例的编程作业：先本地跑测试，再按需生成简短反馈
+            grading_result = grade_with_tests(autograde_config, file_contents, assignment_name)
+        if grading_result is None:
+            submission_content = format_submission_content(file_contents)
+            user_prompt = f"""
+            [作业批改助手]
+            作业名称: {assignment_name}
+            学科: {subject}
+            章节: {chapter}
+            学生ID: {student_id}
+            学生提交的内容:
+            {submission_content}
+            评分标准:
+            针对{subject}学科的{chapter}章节内容，按照以下标准评分:
+            1. 知识掌握程度 (40分)
+               - 是否符合本章节核心概念
+            2. 应用能力 (30分)
+               - 是否能正确应用本章节所学
+            3. 创新性 (20分)
+               - 是否有超出本章节的深入思考
+            4. 表达清晰度 (10分)
+               - 逻辑是否清晰，表述是否准确
+            请提供具体的改进建议，特别是针对{subject}学科{chapter}章节的知识点。
+            返回以下格式的 JSON:
+            {{
+                "score": 分数,
+                "feedback": "详细的反馈内容"
+            }}
+            仅输出JSON格式，不要有其他文本。
+            """
 
-        ai_response = response.choices[0].message.content.strip()
-        try:
-            grading_result = json.loads(ai_response)
-            if not isinstance(grading_result,
-                              dict) or 'score' not in grading_result or 'feedback' not in grading_result:
-                return jsonify({'error': 'AI返回的结果格式不正确'}), 500
-        except json.JSONDecodeError:
-            import re
-            score_match = re.search(r'score["\s:]+(\d+)', ai_response)
-            score = float(score_match.group(1)) if score_match else None
-            feedback_match = re.search(r'feedback["\s:]+(.+?)(?:}|$)', ai_response, re.DOTALL)
-            feedback = feedback_match.group(1).strip().strip('"\'') if feedback_match else ai_response
-            grading_result = {'score': score, 'feedback': feedback}
+            try:
+                grading_result = request_ai_grading(user_prompt)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 500
 
         assignment = Assignment(
             student_id=student_id,
@@ -1166,11 +1368,20 @@ def submit_assignment():
             chapter=chapter,  # 保存章节
             score=grading_result.get('score'),
             feedback=grading_result.get('feedback'),
-            submission_time=datetime.utcnow()
+            submission_time=datetime.utcnow(),
+            graded_at=datetime.utcnow(),
+            artifact_id=artifact.id if artifact else None
         )
         db.session.add(assignment)
         db.session.commit()
-        return jsonify(assignment.to_dict()), 201
+        response_data = assignment.to_dict()
+        if 'test_results' in grading_result:
+            response_data['test_results'] = public_test_results(grading_result['test_results'])
+        similar = find_similar_submissions(signature, student_id)
+        if similar:
+            response_data['plagiarism_suspected'] = True
+            response_data['similar_submissions'] = similar[:5]
+        return jsonify(response_data), 201
     except Exception as e:
         return jsonify({'error': f'批改过程中出错: {str(e)}'}), 500
     finally:
@@ -1207,6 +1418,8 @@ def batch_submit_assignments():
     results = []
     temp_dirs = []
     try:
+        # 第一步：保存并解析所有文件
+        pending = []
         for file in files:
             if not allowed_file(file.filename):
                 continue
@@ -1244,14 +1457,79 @@ def batch_submit_assignments():
                 })
                 continue
 
-            assignment_name = f"{batch_name} - {student.name}"
-            user_prompt = f"""
+            artifact = archive_submission(file_path, file.filename, {file.filename: file_content})
+            pending.append({
+                'file': file,
+                'student': student,
+                'file_content': file_content,
+                'artifact': artifact,
+                'signature': index_submission(artifact, {file.filename: file_content})
+            })
+        batch_owners = {item['artifact'].id: item['student'] for item in pending if item['artifact']}
+
+        # 第二步：配置了测试用例时，所有提交并行跑测试（每份提交独立子进程）
+        autograde_config = get_autograde_config(batch_name, subject)
+        test_results = {}
+        sandbox_error = sandbox_unavailable_reason() if autograde_config else None
+        if sandbox_error:
+            app.logger.warning(f"{batch_name} 未能运行测试用例，改用AI批改: {sandbox_error}")
+        elif autograde_config:
+            runnable = {
+                index: {item['file'].filename: item['file_content']}
+                for index, item in enumerate(pending)
+                if detect_language({item['file'].filename: item['file_content']})
+            }
+            test_results = run_test_suites(
+                runnable,
+                autograde_config.test_cases_data,
+                language=autograde_config.language,
+                time_limit=autograde_config.time_limit,
+                memory_limit_mb=autograde_config.memory_limit_mb
+            )
+
+        # 第三步：逐份批改并保存成绩，与本批次已批改提交几乎相同时直接复用成绩
+        reuse_threshold = config.Config.SIMILARITY_REUSE_THRESHOLD
+        graded_in_batch = {}  # {artifact_id: (signature, grading_result, filename)}
+        batch_buckets = {}  # 本批次已批改提交的 LSH 分桶 {桶键: [artifact_id]}
+        for index, item in enumerate(pending):
+            file = item['file']
+            student = item['student']
+            file_content = item['file_content']
+            artifact = item['artifact']
+            signature = item['signature']
+            bucket_keys = lsh_bucket_keys(signature) if signature else []
+
+            grading_result = None
+            reused_from = None
+            if index not in test_results and artifact:
+                if artifact.id in graded_in_batch:
+                    _, grading_result, reused_from = graded_in_batch[artifact.id]
+                else:
+                    # 只和同桶的候选比较签名，不逐一比较本批次全部提交
+                    candidate_ids = {graded_id for key in bucket_keys for graded_id in batch_buckets.get(key, ())}
+                    best_similarity = reuse_threshold
+                    for graded_id in candidate_ids:
+                        graded_signature, graded_result, graded_filename = graded_in_batch[graded_id]
+                        similarity = estimate_similarity(signature, graded_signature)
+                        if similarity >= best_similarity:
+                            best_similarity = similarity
+                            grading_result = graded_result
+                            reused_from = graded_filename
+
+            if reused_from:
+                app.logger.info(f"{file.filename} 与 {reused_from} 几乎相同，复用成绩")
+            elif index in test_results:
+                grading_result = grade_with_tests(
+                    autograde_config, {file.filename: file_content}, batch_name, test_results[index]
+                )
+            if grading_result is None:
+                assignment_name = f"{batch_name} - {student.name}"
+                user_prompt = f"""
             [作业批改助手]
             作业名称: {assignment_name}
             学生ID: {student.student_id}
             学生提交的代码:
-            文件: {file.filename}
-            {file_content}
+            {format_submission_content({file.filename: file_content})}
             评分标准:
             1. 本次作业满分为100分。
             2. 评分时请综合考虑代码的质量、可读性和功能性：
@@ -1268,35 +1546,15 @@ def batch_submit_assignments():
             仅输出JSON格式，不要有其他文本。
             """
 
-            response = openai.ChatCompletion.create(
-                model=config.DEEPSEEK_MODEL,
-                messages=[
-                    {"role": "system", "content": "你是一位精通编程的助手，负责批改学生提交的编程作业。"},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.3,
-                max_tokens=4096,
-                stream=False
-            )
-
-            ai_response = response.choices[0].message.content.strip()
-            try:
-                grading_result = json.loads(ai_response)
-                if not isinstance(grading_result,
-                                  dict) or 'score' not in grading_result or 'feedback' not in grading_result:
+                try:
+                    grading_result = request_ai_grading(user_prompt)
+                except ValueError as e:
                     results.append({
                         'filename': file.filename,
                         'status': 'error',
-                        'message': 'AI返回的结果格式不正确'
+                        'message': str(e)
                     })
                     continue
-            except json.JSONDecodeError:
-                import re
-                score_match = re.search(r'score["\s:]+(\d+)', ai_response)
-                score = float(score_match.group(1)) if score_match else None
-                feedback_match = re.search(r'feedback["\s:]+(.+?)(?:}|$)', ai_response, re.DOTALL)
-                feedback = feedback_match.group(1).strip().strip('"\'') if feedback_match else ai_response
-                grading_result = {'score': score, 'feedback': feedback}
 
             assignment = Assignment(
                 student_id=student.student_id,
@@ -1305,19 +1563,36 @@ def batch_submit_assignments():
                 chapter=chapter,  # 新增
                 score=grading_result.get('score'),
                 feedback=grading_result.get('feedback'),
-                submission_time=datetime.utcnow()
+                submission_time=datetime.utcnow(),
+                graded_at=datetime.utcnow(),
+                artifact_id=artifact.id if artifact else None
             )
             db.session.add(assignment)
             db.session.commit()
 
-            results.append({
+            if artifact and not reused_from:
+                graded_in_batch[artifact.id] = (signature, grading_result, file.filename)
+                for key in bucket_keys:
+                    batch_buckets.setdefault(key, []).append(artifact.id)
+
+            result_item = {
                 'filename': file.filename,
                 'status': 'success',
                 'student_id': student.student_id,
                 'student_name': student.name,
                 'assignment_name': batch_name,
                 'score': grading_result.get('score')
-            })
+            }
+            if 'test_results' in grading_result:
+                result_item['tests_passed'] = grading_result['test_results']['passed']
+                result_item['tests_total'] = grading_result['test_results']['total']
+            if reused_from:
+                result_item['grade_reused_from'] = reused_from
+            similar = find_similar_submissions(signature, student.student_id, batch_owners)
+            if similar:
+                result_item['plagiarism_suspected'] = True
+                result_item['similar_submissions'] = similar[:5]
+            results.append(result_item)
 
     except Exception as e:
         return jsonify({'error': f'批量上传处理出错: {str(e)}'}), 500
@@ -1333,6 +1608,236 @@ def batch_submit_assignments():
     }), 201
 
 
+# 当前会话中已登录且未被禁用的后台管理员，没有时返回 None
+def session_admin():
+    admin = db.session.get(Admin, session['admin_id']) if 'admin_id' in session else None
+    return admin if admin and admin.is_active else None
+
+
+# 编程作业自动评测配置
+@app.route('/api/autograde/config', methods=['GET'])
+@csrf.exempt
+def get_autograde_settings():
+    assignment_name = request.args.get('assignment_name')
+    subject = request.args.get('subject')
+    if not assignment_name:
+        return jsonify({'error': '请提供作业名称'}), 400
+    autograde_config = get_autograde_config(assignment_name, subject)
+    if not autograde_config:
+        return jsonify({'error': '该作业未配置自动评测'}), 404
+    result = autograde_config.to_dict()
+    # 隐藏用例的输入和期望输出只对已登录的管理员可见
+    if session_admin() is None:
+        result['test_cases'] = public_test_cases(result['test_cases'])
+    return jsonify(result)
+
+
+@app.route('/api/autograde/config', methods=['PUT'])
+@csrf.exempt
+@api_admin_required
+def save_autograde_settings(current_admin):
+    data = request.get_json() or {}
+    assignment_name = data.get('assignment_name')
+    subject = data.get('subject', '未分类')
+    test_cases = data.get('test_cases')
+    grading_mode = data.get('grading_mode', 'tests_and_ai')
+    language = data.get('language')
+    if not assignment_name:
+        return jsonify({'error': '请提供作业名称'}), 400
+    if not isinstance(test_cases, list) or not test_cases:
+        return jsonify({'error': '请提供至少一个测试用例'}), 400
+    if any(not isinstance(case, dict) or 'expected_output' not in case for case in test_cases):
+        return jsonify({'error': '每个测试用例都需要包含 expected_output'}), 400
+    if grading_mode not in ('tests_only', 'tests_and_ai'):
+        return jsonify({'error': '不支持的评测模式'}), 400
+    if language and language not in ('python', 'c', 'cpp', 'java'):
+        return jsonify({'error': '不支持的语言'}), 400
+
+    try:
+        autograde_config = AutogradeConfig.query.filter_by(
+            assignment_name=assignment_name, subject=subject
+        ).first()
+        if not autograde_config:
+            autograde_config = AutogradeConfig(assignment_name=assignment_name, subject=subject)
+            db.session.add(autograde_config)
+        autograde_config.language = language
+        autograde_config.test_cases = json.dumps(test_cases, ensure_ascii=False)
+        autograde_config.grading_mode = grading_mode
+        autograde_config.time_limit = max(MIN_TIME_LIMIT, min(int(data.get('time_limit', 2)), MAX_TIME_LIMIT))
+        autograde_config.memory_limit_mb = max(64, min(int(data.get('memory_limit_mb', 256)), 1024))
+        db.session.commit()
+        record_admin_log(
+            admin_id=current_admin.id,
+            action='update_autograde_config',
+            module='autograde',
+            target_type='autograde_config',
+            target_id=autograde_config.id,
+            description=f'更新自动评测配置: {assignment_name} ({subject})',
+            ip_address=request.remote_addr
+        )
+        return jsonify(autograde_config.to_dict()), 200
+    except (TypeError, ValueError):
+        db.session.rollback()
+        return jsonify({'error': '时间或内存限制格式错误'}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'保存评测配置失败: {str(e)}'}), 500
+
+
+# 查询与某次提交相似的其他学生提交（抄袭检测）
+@app.route('/api/assignments/<int:assignment_id>/similar', methods=['GET'])
+@csrf.exempt
+def get_similar_assignments(assignment_id):
+    assignment = Assignment.query.get(assignment_id)
+    if not assignment:
+        return jsonify({'error': '未找到作业记录'}), 404
+    if not assignment.artifact:
+        return jsonify({'error': '该作业没有保存提交文件，无法比对'}), 400
+    try:
+        threshold = float(request.args.get('threshold', config.Config.SIMILARITY_PLAGIARISM_THRESHOLD))
+    except ValueError:
+        return jsonify({'error': '相似度阈值格式错误'}), 400
+
+    # 历史提交在首次查询时补建索引
+    signature = index_submission(assignment.artifact, assignment.artifact.file_contents)
+    db.session.commit()
+    similar = find_similar_submissions(signature, assignment.student_id, threshold=threshold)
+    return jsonify({
+        'assignment': assignment.to_dict(),
+        'threshold': threshold,
+        'similar_submissions': similar
+    })
+
+
+# 使用新的评分标准重新批改整批作业（复用已存储的提交文件和提取文本）
+# 会批量调用AI，只允许管理员使用；配置了测试用例的编程作业按测试用例重新评测
+@app.route('/api/assignments/regrade', methods=['POST'])
+@csrf.exempt
+@require_login_api
+def regrade_assignments():
+    if not current_user.is_admin and session_admin() is None:
+        return jsonify({'error': '只有教师或管理员可以重新批改作业'}), 403
+    data = request.get_json() or {}
+    assignment_name = data.get('assignment_name')
+    prompt = data.get('prompt')
+    subject = data.get('subject')
+    student_ids = data.get('student_ids')
+    if not assignment_name:
+        return jsonify({'error': '请提供作业名称'}), 400
+    if not prompt:
+        return jsonify({'error': '请提供新的批改提示词'}), 400
+
+    query = Assignment.query.filter(Assignment.assignment_name == assignment_name)
+    if subject:
+        query = query.filter(Assignment.subject == subject)
+    if student_ids:
+        query = query.filter(Assignment.student_id.in_(student_ids))
+    assignments = query.all()
+    if not assignments:
+        return jsonify({'error': '未找到对应的作业记录'}), 404
+
+    results = []
+    graded_by_sha = {}  # 同一批次中内容完全相同的提交只批改一次
+    autograde_configs = {}
+    ai_calls = 0
+    try:
+        for assignment in assignments:
+            artifact = assignment.artifact
+            if artifact is None:
+                results.append({
+                    'assignment_id': assignment.id,
+                    'student_id': assignment.student_id,
+                    'status': 'skipped',
+                    'message': '该作业没有保存提交文件，需要重新上传'
+                })
+                continue
+
+            file_contents = artifact.file_contents
+            if not file_contents:
+                stored_path = get_artifact_path(artifact)
+                if not stored_path:
+                    results.append({
+                        'assignment_id': assignment.id,
+                        'student_id': assignment.student_id,
+                        'status': 'skipped',
+                        'message': '提交文件已过保留期被清理'
+                    })
+                    continue
+                work_dir = tempfile.mkdtemp()
+                try:
+                    file_contents = extract_submission_contents(
+                        stored_path, artifact.original_filename or f"submission.{artifact.file_extension}", work_dir
+                    )
+                finally:
+                    shutil.rmtree(work_dir, ignore_errors=True)
+                artifact.extracted_text = json.dumps(file_contents, ensure_ascii=False)
+
+            grading_result = graded_by_sha.get(artifact.sha256)
+            config_key = (assignment.assignment_name, assignment.subject)
+            if config_key not in autograde_configs:
+                autograde_configs[config_key] = get_autograde_config(*config_key)
+            autograde_config = autograde_configs[config_key]
+            if grading_result is None and autograde_config and detect_language(file_contents):
+                grading_result = grade_with_tests(autograde_config, file_contents, assignment.assignment_name)
+            if grading_result is None:
+                submission_content = format_submission_content(file_contents)
+                user_prompt = f"""
+                [作业批改助手]
+                作业名称: {assignment.assignment_name}
+                学科: {assignment.subject}
+                章节: {assignment.chapter}
+                学生ID: {assignment.student_id}
+                学生提交的内容:
+                {submission_content}
+                评分标准:
+                {prompt}
+                返回以下格式的 JSON:
+                {{
+                    "score": 分数,
+                    "feedback": "详细的反馈内容"
+                }}
+                仅输出JSON格式，不要有其他文本。
+                """
+                try:
+                    ai_calls += 1
+                    grading_result = request_ai_grading(user_prompt)
+                except ValueError as e:
+                    results.append({
+                        'assignment_id': assignment.id,
+                        'student_id': assignment.student_id,
+                        'status': 'error',
+                        'message': str(e)
+                    })
+                    continue
+            graded_by_sha[artifact.sha256] = grading_result
+
+            previous_score = assignment.score
+            assignment.score = grading_result.get('score')
+            assignment.feedback = grading_result.get('feedback')
+            assignment.graded_at = datetime.utcnow()
+            artifact.last_used_at = datetime.utcnow()
+            db.session.commit()
+
+            results.append({
+                'assignment_id': assignment.id,
+                'student_id': assignment.student_id,
+                'status': 'success',
+                'previous_score': previous_score,
+                'score': assignment.score
+            })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'重新批改过程中出错: {str(e)}'}), 500
+
+    return jsonify({
+        'assignment_name': assignment_name,
+        'total': len(assignments),
+        'regraded': sum(1 for r in results if r['status'] == 'success'),
+        'ai_calls': ai_calls,
+        'results': results
+    }), 200
+
+
 @app.route('/api/scores/<student_id>/<assignment_name>', methods=['GET'])
 @csrf.exempt
 def get_assignment_score(student_id, assignment_name):
@@ -1668,6 +2173,19 @@ def get_conversations():
         return jsonify({'error': f'获取会话列表失败: {str(e)}'}), 500
 
 
+# 代码讲解深度，作为缓存键的一部分
+EXPLANATION_LEVELS = {
+    'beginner': '面向编程初学者，避免术语，多用类比',
+    'intermediate': '面向有一定基础的学生',
+    'advanced': '面向进阶学习者，可深入讨论复杂度和设计取舍',
+}
+
+
+def get_explanation_level(data):
+    level = data.get('level', 'intermediate')
+    return level if level in EXPLANATION_LEVELS else 'intermediate'
+
+
 # 辅助编程API
 @app.route('/api/ai/programming-help', methods=['POST'])
 @limiter.limit("15 per minute")  # API限流保护
@@ -1686,6 +2204,20 @@ def programming_help():
         
         if not code and not question:
             return jsonify({'error': '请提供代码或问题描述'}), 400
+
+        # 同一段代码（忽略空白、注释和变量名差异）+ 同一问题 + 同一深度直接返回缓存
+        level = get_explanation_level(data)
+        fingerprint, identifiers = explanation_cache_key(code, language, question)
+        cached = find_cached_explanation('programming_help', fingerprint, level, identifiers)
+        if cached is not None:
+            # 缓存命中没有调用AI，不计使用次数
+            skip_feature_usage()
+            return jsonify({
+                'success': True,
+                'response': cached,
+                'session_id': session_id,
+                'cached': True
+            }), 200
         
         # 构建编程助手的提示词
         system_prompt = f"""你是一位专业的编程助手，专门帮助学生解决编程问题。
@@ -1696,6 +2228,7 @@ def programming_help():
 3. 如果发现代码错误，请指出并提供修正方案
 4. 提供最佳实践建议
 5. 保持回答简洁明了但详细
+6. {EXPLANATION_LEVELS[level]}
 
 当前编程语言：{language}
 """
@@ -1722,11 +2255,13 @@ def programming_help():
         
         # 清理响应内容
         sanitized_response = sanitize_ai_response(ai_response)
+        save_cached_explanation('programming_help', fingerprint, level, language, identifiers, sanitized_response)
         
         return jsonify({
             'success': True,
             'response': sanitized_response,
-            'session_id': session_id
+            'session_id': session_id,
+            'cached': False
         }), 200
         
     except Exception as e:
@@ -1744,7 +2279,10 @@ def programming_help():
 @require_membership
 @feature_limit('code_review')
 def code_review():
-    """代码审查API"""
+    """代码审查API
+
+    传入上一次返回的 review_session_id 时进入增量模式：只发送与上一版的 diff 和上一轮要点摘要
+    """
     try:
         data = request.json
         code = data.get('code', '')
@@ -1752,9 +2290,40 @@ def code_review():
         
         if not code:
             return jsonify({'error': '请提供要审查的代码'}), 400
-        
-        # 构建代码审查提示词
-        review_prompt = f"""请对以下{language}代码进行专业的代码审查：
+
+        review_session = load_session('code_review', current_user.id, data.get('review_session_id'))
+        plan = plan_review(review_session, code, language)
+        if plan['mode'] == 'unchanged':
+            # 代码没有变化，直接返回上一轮结论（没有调用AI，不计使用次数）
+            skip_feature_usage()
+            return jsonify({
+                'success': True,
+                'review': review_session.last_review,
+                'review_session_id': review_session.session_id,
+                'revision': review_session.revision,
+                'review_mode': 'unchanged'
+            }), 200
+
+        if plan['mode'] == 'incremental':
+            review_prompt = f"""这是同一段{language}代码的修改版本，请基于上一轮审查继续审查。
+
+上一轮审查的要点：
+{review_session.findings_summary}
+
+本次修改（统一diff格式）：
+```diff
+{plan['diff']}
+```
+
+请说明：
+1. 上一轮指出的问题哪些已解决、哪些仍然存在
+2. 本次修改是否引入了新的问题
+3. 针对修改部分的改进建议
+
+请用中文回答，只讨论与修改相关的内容。""" + SUMMARY_INSTRUCTION
+        else:
+            # 构建代码审查提示词
+            review_prompt = f"""请对以下{language}代码进行专业的代码审查：
 
 ```{language}
 {code}
@@ -1768,7 +2337,7 @@ def code_review():
 5. 潜在的bug或错误
 6. 最佳实践建议
 
-请用中文回答，提供具体的改进建议和示例代码。"""
+请用中文回答，提供具体的改进建议和示例代码。""" + SUMMARY_INSTRUCTION
         
         # 使用DeepSeek API
         response = openai.ChatCompletion.create(
@@ -1784,10 +2353,17 @@ def code_review():
         ai_response = response.choices[0].message.content
         
         sanitized_response = sanitize_ai_response(ai_response)
+        review_session = save_session(
+            review_session, 'code_review', current_user.id, language, code, sanitized_response
+        )
+        db.session.commit()
         
         return jsonify({
             'success': True,
-            'review': sanitized_response
+            'review': sanitized_response,
+            'review_session_id': review_session.session_id,
+            'revision': review_session.revision,
+            'review_mode': plan['mode']
         }), 200
         
     except Exception as e:
@@ -1813,6 +2389,19 @@ def code_explain():
         
         if not code:
             return jsonify({'error': '请提供要解释的代码'}), 400
+
+        # 同一段代码（忽略空白、注释和变量名差异）+ 同一深度直接返回缓存
+        level = get_explanation_level(data)
+        fingerprint, identifiers = explanation_cache_key(code, language)
+        cached = find_cached_explanation('code_explain', fingerprint, level, identifiers)
+        if cached is not None:
+            # 缓存命中没有调用AI，不计使用次数
+            skip_feature_usage()
+            return jsonify({
+                'success': True,
+                'explanation': cached,
+                'cached': True
+            }), 200
         
         explain_prompt = f"""请详细解释以下{language}代码的功能和工作原理：
 
@@ -1827,7 +2416,7 @@ def code_explain():
 4. 代码的执行流程
 5. 关键概念的解释
 
-请用中文回答，使用通俗易懂的语言。"""
+请用中文回答，使用通俗易懂的语言，{EXPLANATION_LEVELS[level]}。"""
         
         # 使用DeepSeek API
         response = openai.ChatCompletion.create(
@@ -1843,10 +2432,12 @@ def code_explain():
         ai_response = response.choices[0].message.content
         
         sanitized_response = sanitize_ai_response(ai_response)
+        save_cached_explanation('code_explain', fingerprint, level, language, identifiers, sanitized_response)
         
         return jsonify({
             'success': True,
-            'explanation': sanitized_response
+            'explanation': sanitized_response,
+            'cached': False
         }), 200
         
     except Exception as e:
@@ -1864,7 +2455,10 @@ def code_explain():
 @require_membership
 @feature_limit('debug_help')
 def debug_help():
-    """调试帮助API"""
+    """调试帮助API
+
+    传入上一次返回的 review_session_id 时进入增量模式：只发送与上一版的 diff 和上一轮要点摘要
+    """
     try:
         data = request.json
         code = data.get('code', '')
@@ -1873,12 +2467,30 @@ def debug_help():
         
         if not code and not error_message:
             return jsonify({'error': '请提供代码或错误信息'}), 400
+
+        review_session = load_session('debug_help', current_user.id, data.get('review_session_id')) if code else None
+        plan = plan_review(review_session, code, language) if code else {'mode': 'full', 'diff': None}
+        if plan['mode'] == 'unchanged' and review_session.findings_summary and not error_message:
+            # 代码没有变化，直接返回上一轮结论（没有调用AI，不计使用次数）
+            skip_feature_usage()
+            return jsonify({
+                'success': True,
+                'debug_help': review_session.last_review,
+                'review_session_id': review_session.session_id,
+                'revision': review_session.revision,
+                'review_mode': 'unchanged'
+            }), 200
         
         debug_prompt = f"""请帮助调试以下{language}代码问题：
 
 """
         
-        if code:
+        if plan['mode'] == 'incremental':
+            debug_prompt += f"上一轮调试的要点：\n{review_session.findings_summary}\n\n"
+            debug_prompt += f"学生根据建议修改了代码（统一diff格式）：\n```diff\n{plan['diff']}\n```\n\n"
+        elif plan['mode'] == 'unchanged' and review_session.findings_summary:
+            debug_prompt += f"上一轮调试的要点：\n{review_session.findings_summary}\n\n代码与上一轮相同，出现了新的错误信息。\n\n"
+        elif code:
             debug_prompt += f"代码：\n```{language}\n{code}\n```\n\n"
         
         if error_message:
@@ -1890,7 +2502,7 @@ def debug_help():
 3. 修正后的代码示例
 4. 预防类似错误的建议
 
-请用中文回答。"""
+请用中文回答。""" + SUMMARY_INSTRUCTION
         
         # 使用DeepSeek API
         response = openai.ChatCompletion.create(
@@ -1906,11 +2518,20 @@ def debug_help():
         ai_response = response.choices[0].message.content
         
         sanitized_response = sanitize_ai_response(ai_response)
-        
-        return jsonify({
+        result = {
             'success': True,
-            'debug_help': sanitized_response
-        }), 200
+            'debug_help': sanitized_response,
+            'review_mode': plan['mode']
+        }
+        if code:
+            review_session = save_session(
+                review_session, 'debug_help', current_user.id, language, code, sanitized_response
+            )
+            db.session.commit()
+            result['review_session_id'] = review_session.session_id
+            result['revision'] = review_session.revision
+        
+        return jsonify(result), 200
         
     except Exception as e:
         app.logger.error(f"调试帮助错误: {str(e)}")
@@ -1922,6 +2543,148 @@ def debug_help():
 
 
 
+def summarize_transcript_chunk(text, time_range):
+    """map 阶段：总结一个时间窗口内的字幕"""
+    response = openai.ChatCompletion.create(
+        model=config.DEEPSEEK_MODEL,
+        messages=[
+            {"role": "system", "content": "你是一个专业的教育助手，负责提炼教学视频字幕中的知识点。"},
+            {"role": "user", "content": f"以下是教学视频 {time_range} 片段的字幕，请用3-6条要点概括这一段讲了什么，"
+                                        f"只依据字幕内容，不要补充字幕中没有的信息：\n\n{text}"}
+        ],
+        temperature=0.3,
+        max_tokens=500,
+        stream=False
+    )
+    return response.choices[0].message.content.strip()
+
+
+def combine_transcript_summaries(partials):
+    """reduce 阶段：把各片段要点汇总为结构化的视频总结"""
+    response = openai.ChatCompletion.create(
+        model=config.DEEPSEEK_MODEL,
+        messages=[
+            {"role": "system", "content": "你是一个专业的教育助手，擅长分析和总结教育视频内容，为学生提供有价值的学习指导。"},
+            {"role": "user", "content": f"""
+            以下是一个教学视频按时间顺序分段提炼的要点（方括号内为时间范围）：
+
+            {chr(10).join(partials)}
+
+            请据此生成完整的视频总结，包括：
+            1. 视频主题
+            2. 分段内容梳理（保留时间范围，便于回看）
+            3. 主要知识点和重要概念
+            4. 学习建议
+
+            只依据上述要点，不要编造视频中没有的内容。请用中文回答，格式清晰，适合学生学习使用。
+            """}
+        ],
+        temperature=0.5,
+        max_tokens=1500,
+        stream=False
+    )
+    return response.choices[0].message.content
+
+
+def save_video_note(user_id, note_type, video_source, content, media_hash=None, video_title=None, **extra):
+    """保存一条视频笔记（总结/讲义/手写笔记）并提交"""
+    note = VideoNote(
+        user_id=user_id,
+        note_type=note_type,
+        video_source=video_source,
+        video_title=video_title or video_source,
+        content=content,
+        media_hash=media_hash,
+        **extra
+    )
+    db.session.add(note)
+    db.session.commit()
+    return note
+
+
+def subtitle_input_hash(subtitle_files, pasted_text=None):
+    """用户上传的字幕文件和粘贴文本的指纹，都没有时为 None"""
+    return transcript_input_hash([file_stream_hash(f) for f in subtitle_files or []], pasted_text)
+
+
+def get_video_transcript_summary(user_id, video_file, video_url, subtitle_files, pasted_text=None, refresh=False,
+                                 video_title=None):
+    """
+    获取视频字幕总结：同一视频（按内容指纹）配同样的字幕输入已总结过时直接返回已保存的 VideoNote，
+    否则提取字幕、分段 map-reduce 总结后保存
+
+    Args:
+        user_id (int): 当前用户
+        video_file (FileStorage): 上传的视频文件，可为 None
+        video_url (str): 视频链接，可为 None
+        subtitle_files (list): 上传的外挂字幕文件
+        pasted_text (str): 用户粘贴的字幕/文稿
+        refresh (bool): 忽略已保存的总结重新生成
+        video_title (str): 视频标题
+
+    Returns:
+        tuple: (VideoNote 或 None（没有可用字幕）, 是否命中缓存)
+    """
+    if video_file:
+        media_hash = file_stream_hash(video_file)
+        video_source = secure_filename(video_file.filename)
+    else:
+        media_hash = url_hash(video_url)
+        video_source = video_url
+    # 上传的字幕或粘贴的文稿不同，总结也不同
+    transcript_hash = subtitle_input_hash(subtitle_files, pasted_text)
+
+    if not refresh:
+        notes = VideoNote.query.filter(
+            VideoNote.media_hash == media_hash,
+            VideoNote.transcript_hash == transcript_hash,
+            VideoNote.note_type == 'summary'
+        ).order_by(VideoNote.timestamp.desc()).all()
+        own = next((n for n in notes if n.user_id == user_id), None)
+        if own is not None:
+            return own, True
+        shared = next((n for n in notes if n.transcript is not None), None)
+        if shared is not None:
+            # 其他用户总结过同一视频：为当前用户保存一份总结（不重复保存字幕），便于在笔记列表中找到
+            return save_video_note(
+                user_id, 'summary', video_source, shared.content, media_hash, video_title,
+                transcript_hash=transcript_hash,
+                transcript_source=shared.transcript_source
+            ), True
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        video_path = None
+        if video_file:
+            video_path = os.path.join(work_dir, video_source)
+            video_file.save(video_path)
+            video_file.stream.seek(0)
+        subtitle_paths = []
+        for index, subtitle in enumerate(subtitle_files or []):
+            name = secure_filename(subtitle.filename) or f'subtitle_{index}.srt'
+            if not name.lower().endswith(SUBTITLE_EXTENSIONS):
+                continue
+            path = os.path.join(work_dir, f'{index}_{name}')
+            subtitle.save(path)
+            subtitle_paths.append(path)
+        cues, transcript_source = load_transcript(video_path, subtitle_paths, pasted_text)
+
+    if not cues:
+        return None, False
+
+    chunks = chunk_cues(cues, window_seconds=config.Config.VIDEO_TRANSCRIPT_WINDOW_SECONDS)
+    summary, _ = map_reduce_summarize(
+        chunks, summarize_transcript_chunk, combine_transcript_summaries,
+        max_workers=config.Config.VIDEO_SUMMARY_MAX_WORKERS
+    )
+    note = save_video_note(
+        user_id, 'summary', video_source, sanitize_ai_response(summary), media_hash, video_title,
+        transcript=transcript_text(cues),
+        transcript_hash=transcript_hash,
+        transcript_source=transcript_source
+    )
+    return note, False
+
+
 @app.route('/api/ai/summarize-video', methods=['POST'])
 @limiter.limit("5 per minute")  # API限流保护
 @csrf.exempt
@@ -1929,6 +2692,16 @@ def debug_help():
 @require_membership
 @feature_limit('video_summary')
 def ai_summarize_video():
+    """总结视频内容
+
+    参数：
+        - file: 视频文件（可选，内嵌字幕轨需服务器安装 ffmpeg）
+        - url: 视频链接（可选）
+        - subtitles: 外挂字幕文件 SRT/ASS/WebVTT（可选，可多个）
+        - transcript: 粘贴的字幕或文稿文本（可选）
+        - refresh: 忽略已保存的总结重新生成（默认false）
+        - title: 视频标题（可选）
+    """
     if 'file' not in request.files and 'url' not in request.form:
         return jsonify({'error': '未提供视频文件或链接'}), 400
 
@@ -1947,59 +2720,33 @@ def ai_summarize_video():
             secure_name = secure_filename(video_file.filename)
             if not secure_name:
                 return jsonify({'error': '文件名无效'}), 400
-            
-            # 由于DeepSeek API无法直接处理视频文件，我们基于文件名生成一个教育性的总结
-            summary_prompt = f"""
-            请根据视频文件名"{secure_name}"，生成一个教育性的视频总结。假设这是一个教育视频，请：
-
-            1. 根据文件名推测视频可能的内容主题
-            2. 提供一个结构化的学习总结，包括：
-               - 主要知识点
-               - 重要概念
-               - 学习建议
-               - 可能的应用场景
-
-            请用中文回答，格式清晰，适合学生学习使用。
-            """
-            
         else:
             # URL处理
             if not video_url.startswith(('http://', 'https://')):
                 return jsonify({'error': '无效的视频链接'}), 400
-            
-            # 基于视频URL生成总结
-            summary_prompt = f"""
-            请根据视频链接"{video_url}"，生成一个教育性的视频总结。请：
-
-            1. 根据链接URL推测视频可能的内容和主题
-            2. 如果是Bilibili、YouTube等平台的链接，说明这类平台的教育价值
-            3. 提供一个结构化的学习指导，包括：
-               - 预期学习内容
-               - 观看建议
-               - 笔记要点
-               - 扩展学习方向
-
-            请用中文回答，格式清晰，适合教育场景使用。
-            """
 
-        # 使用DeepSeek API生成总结
-        response = openai.ChatCompletion.create(
-            model=config.DEEPSEEK_MODEL,
-            messages=[
-                {"role": "system", "content": "你是一个专业的教育助手，擅长分析和总结教育视频内容，为学生提供有价值的学习指导。"},
-                {"role": "user", "content": summary_prompt}
-            ],
-            temperature=0.7,
-            max_tokens=1500,
-            stream=False
+        # 总结只依据真实字幕内容，不再根据文件名或链接推测
+        note, cached = get_video_transcript_summary(
+            current_user.id, video_file, video_url,
+            request.files.getlist('subtitles') or request.files.getlist('subtitle'),
+            pasted_text=request.form.get('transcript'),
+            refresh=request.form.get('refresh', 'false').lower() == 'true',
+            video_title=request.form.get('title')
         )
-        
-        ai_summary = response.choices[0].message.content
-        sanitized_summary = sanitize_ai_response(ai_summary)
+        if note is None:
+            return jsonify({
+                'error': '未能获取视频字幕，请上传字幕文件（SRT/ASS/WebVTT）或粘贴字幕文本后重试'
+            }), 422
+        if cached:
+            # 返回已保存的总结，没有调用AI，不计使用次数
+            skip_feature_usage()
 
         return jsonify({
             'input': video_url or secure_name,
-            'summary': sanitized_summary
+            'summary': note.content,
+            'note_id': note.id,
+            'transcript_source': note.transcript_source,
+            'cached': cached
         }), 200
 
     except Exception as e:
@@ -2019,12 +2766,15 @@ def video_to_lecture():
     参数：
         - file: 视频文件（可选）
         - url: 视频链接（可选）
+        - subtitles: 外挂字幕文件（可选）
+        - transcript: 粘贴的字幕或文稿文本（可选）
         - course_info: 课程信息（JSON格式）
             - stage: 学段（小学/初中/高中）
             - grade: 年级
             - subject: 科目
             - chapter: 章节（可选）
         - generate_exercises: 是否生成配套练习题（布尔值，默认false）
+        - title: 视频标题（可选）
     """
     video_file = request.files.get('file')
     video_url = request.form.get('url')
@@ -2046,10 +2796,65 @@ def video_to_lecture():
         video_identifier = ''
         if video_file:
             video_identifier = secure_filename(video_file.filename)
+            source_hash = file_stream_hash(video_file)
         elif video_url:
             video_identifier = video_url
+            source_hash = url_hash(video_url)
+
+        # 相同视频在相同课程信息下直接返回讲义库中的结果，除非显式要求重新生成
+        lecture_params = {
+            'stage': stage, 'grade': grade, 'subject': subject, 'chapter': chapter,
+            'generate_exercises': generate_exercises, 'model': config.DEEPSEEK_MODEL
+        }
+        # 讲义依据字幕总结生成，上传字幕或粘贴文稿时同样区分（没有时不加入，保持原有指纹）
+        transcript_hash = subtitle_input_hash(
+            request.files.getlist('subtitles') or request.files.getlist('subtitle'),
+            request.form.get('transcript')
+        )
+        if transcript_hash:
+            lecture_params['transcript'] = transcript_hash
+        regenerate = request.form.get('regenerate', 'false').lower() == 'true'
+        video_title = request.form.get('title') or video_identifier
+        entry = None if regenerate else find_lecture('video', source_hash, lecture_params, current_user.id)
+        if entry is not None:
+            # 讲义库命中没有调用AI，不计生成次数
+            skip_feature_usage()
+            # 讲义库命中时同样保证当前用户的笔记列表中有这份讲义
+            note = VideoNote.query.filter_by(
+                user_id=current_user.id, media_hash=source_hash, note_type='lecture'
+            ).order_by(VideoNote.timestamp.desc()).first()
+            if note is None or note.content != entry.content:
+                note = save_video_note(current_user.id, 'lecture', video_url or video_identifier, entry.content,
+                                       source_hash, video_title)
+            return jsonify({
+                'success': True,
+                'lecture': entry.content,
+                'video_identifier': video_identifier,
+                'course_info': {
+                    'stage': stage,
+                    'grade': grade,
+                    'subject': subject,
+                    'chapter': chapter
+                },
+                'note_id': note.id,
+                'has_exercises': generate_exercises,
+                'library_id': entry.id,
+                'version': entry.version,
+                'cached': True
+            }), 200
         
-        # 2. 生成讲义内容
+        # 2. 生成讲义内容：有字幕时以字幕总结为依据，否则只能根据视频标识和课程信息生成
+        transcript_note, _ = get_video_transcript_summary(
+            current_user.id, video_file, video_url,
+            request.files.getlist('subtitles') or request.files.getlist('subtitle'),
+            pasted_text=request.form.get('transcript'),
+            video_title=video_title
+        )
+        if transcript_note is not None:
+            content_section = f"**视频内容（根据字幕整理）**：\n{transcript_note.content}\n\n请严格依据上述视频内容编写讲义。"
+        else:
+            content_section = "（未获取到视频字幕，请根据课程信息编写讲义。）"
+
         exercises_section = """
         ## 5. 配套练习
         - 基础题（2-3题）
@@ -2066,6 +2871,8 @@ def video_to_lecture():
         **科目**：{subject or '未指定'}
         **章节**：{chapter or '未指定'}
         
+        {content_section}
+        
         请生成一份完整的教学讲义，包括：
         
         ## 1. 课程概述
@@ -2105,28 +2912,14 @@ def video_to_lecture():
         
         lecture_content = response.choices[0].message.content
         sanitized_lecture = sanitize_ai_response(lecture_content)
+        entry = save_lecture(
+            'video', source_hash, lecture_params, sanitized_lecture, current_user.id,
+            source_name=video_identifier, visibility=request.form.get('visibility', 'private')
+        )
         
-        # 3. 保存到数据库（使用VideoNote表）
-        try:
-            video_note = VideoNote(
-                user_id=current_user.id,
-                video_url=video_url or f"file://{video_identifier}",
-                notes=sanitized_lecture,
-                created_at=datetime.utcnow()
-            )
-            db.session.add(video_note)
-            db.session.commit()
-            
-            note_id = video_note.id
-        except Exception as db_error:
-            app.logger.warning(f"保存讲义到数据库失败: {str(db_error)}")
-            note_id = None
-        
-        # 4. 记录功能使用（会员系统）
-        try:
-            log_feature_usage(current_user.id, 'generate_lecture')
-        except:
-            pass
+        # 3. 保存到用户的视频笔记（使用次数由 feature_limit 统一记录）
+        note = save_video_note(current_user.id, 'lecture', video_url or video_identifier, sanitized_lecture,
+                               source_hash, video_title)
         
         return jsonify({
             'success': True,
@@ -2138,8 +2931,12 @@ def video_to_lecture():
                 'subject': subject,
                 'chapter': chapter
             },
-            'note_id': note_id,
-            'has_exercises': generate_exercises
+            'note_id': note.id,
+            'has_exercises': generate_exercises,
+            'library_id': entry.id,
+            'version': entry.version,
+            'cached': False,
+            'transcript_source': transcript_note.transcript_source if transcript_note else None
         }), 200
     
     except json.JSONDecodeError:
@@ -2185,6 +2982,26 @@ def generate_lecture():
                 'allowed_types': ['pdf', 'docx', 'pptx']
             }), 400
 
+        # 相同课件在相同参数下直接返回讲义库中的结果，除非显式要求重新生成
+        source_hash = source_text_hash(text)
+        lecture_params = {'format_version': '1.1', 'model': config.DEEPSEEK_MODEL}
+        regenerate = request.form.get('regenerate', 'false').lower() == 'true'
+        if not regenerate:
+            entry = find_lecture('courseware', source_hash, lecture_params, current_user.id)
+            if entry is not None:
+                # 讲义库命中没有调用AI，不计生成次数
+                skip_feature_usage()
+                return jsonify({
+                    'status': 'success',
+                    'lecture': entry.content_data,
+                    'source_file': file.filename,
+                    'generated_at': entry.created_at.isoformat(),
+                    'format_version': '1.1',
+                    'library_id': entry.id,
+                    'version': entry.version,
+                    'cached': True
+                })
+
         # 使用DeepSeek API生成教案
         response = openai.ChatCompletion.create(
             model=config.DEEPSEEK_MODEL,
@@ -2246,12 +3063,21 @@ def generate_lecture():
 
             processed_result = process_structure(result)
 
+            entry = save_lecture(
+                'courseware', source_hash, lecture_params, processed_result, current_user.id,
+                source_name=file.filename, content_format='json',
+                visibility=request.form.get('visibility', 'private')
+            )
+
             return jsonify({
                 'status': 'success',
                 'lecture': processed_result,
                 'source_file': file.filename,
                 'generated_at': datetime.now().isoformat(),
-                'format_version': '1.1'  # 标识返回格式版本
+                'format_version': '1.1',  # 标识返回格式版本
+                'library_id': entry.id,
+                'version': entry.version,
+                'cached': False
             })
 
         except json.JSONDecodeError:
@@ -2270,6 +3096,45 @@ def generate_lecture():
         shutil.rmtree(temp_dir, ignore_errors=True)
 
 
+# 讲义库：列出当前用户可见的讲义
+@app.route('/api/lectures/library', methods=['GET'])
+@csrf.exempt
+@require_login_api
+def list_lecture_library():
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 20, type=int), 100)
+    pagination = list_visible_lectures(current_user.id, request.args.get('kind'), page, per_page)
+    return jsonify({
+        'success': True,
+        'lectures': [entry.to_dict() for entry in pagination.items],
+        'total': pagination.total,
+        'page': page,
+        'per_page': per_page
+    })
+
+
+# 讲义库：查看单个讲义，或由创建者修改可见范围
+@app.route('/api/lectures/library/<int:entry_id>', methods=['GET', 'PATCH'])
+@csrf.exempt
+@require_login_api
+def lecture_library_entry(entry_id):
+    entry = LectureLibraryEntry.query.get(entry_id)
+    if not entry or (entry.visibility != 'shared' and entry.owner_user_id != current_user.id):
+        return jsonify({'error': '讲义不存在'}), 404
+
+    if request.method == 'GET':
+        return jsonify({'success': True, 'lecture': entry.to_dict(include_content=True)})
+
+    if entry.owner_user_id != current_user.id:
+        return jsonify({'error': '只有创建者可以修改讲义可见范围'}), 403
+    visibility = (request.get_json() or {}).get('visibility')
+    if visibility not in ('shared', 'private'):
+        return jsonify({'error': '可见范围只能是 shared 或 private'}), 400
+    entry.visibility = visibility
+    db.session.commit()
+    return jsonify({'success': True, 'lecture': entry.to_dict()})
+
+
 # 智能出题
 # 智能出题系统路由
 @app.route('/api/ai/generate-question', methods=['POST'])
@@ -2291,6 +3156,8 @@ def generate_question():
 
     difficulty = request.form.get('difficulty', 'medium')
     num_questions = int(request.form.get('num_questions', 3))
+    subject = request.form.get('subject') or '未分类'
+    question_types = [t.strip() for t in request.form.get('question_types', '').split(',') if t.strip()]
 
     # 生成唯一的题目集ID
     question_set_id = str(uuid.uuid4())
@@ -2309,81 +3176,106 @@ def generate_question():
             text = parse_pptx(file_path)
         else:
             return jsonify({'error': '不支持的文件类型'}), 400
-        
-        # 使用DeepSeek API生成题目
-        response = openai.ChatCompletion.create(
-            model=config.DEEPSEEK_MODEL,
-            messages=[
-                {"role": "system", "content": "你是一个专业的题目生成助手，根据提供的材料生成考试题目。"},
-                {"role": "user", "content": f"""
-                根据以下材料生成{difficulty}难度的{num_questions}道题目:
-                {text}
 
-                要求:
-                1. 包含选择题、填空题和简答题
-                2. 题目考察核心知识点
-                3. 返回的JSON中必须包含correct_answer字段
-
-                返回格式:
-                {{
-                    "status": "success",
-                    "questions": [
-                        {{
-                            "type": "question_type",
-                            "question": "题目内容",
-                            "options": ["选项1", "选项2"] (仅选择题),
-                            "correct_answer": "正确答案"
-                        }}
-                    ],
-                    "source_file": "文件名",
-                    "generated_at": "生成时间"
-                }}
-                """}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.7
+    try:
+        # 先从题库中取当前用户未见过的题目，只有不足的部分才调用AI生成
+        source_hash = source_fingerprint(text)
+        reused = select_unseen_questions(
+            current_user.id, subject, difficulty, num_questions,
+            question_types=question_types or None, source_hash=source_hash
         )
-        ai_content = response.choices[0].message.content
-        result = parse_ai_response(ai_content)
-
-    try:
-
-            # 保存到题库，使用UUID作为question_id
-            questions_result = []
-            for q in result['questions']:
-                question_id = str(uuid.uuid4())  # 为每个题目生成唯一ID
-                new_question = QuestionBank(
-                    question_id=question_id,
-                    question_set_id=question_set_id,  # 记录题目集ID
-                    question_text=q['question'],
-                    question_type=q['type'],
-                    options=q.get('options', []),
-                    correct_answer=q.get('correct_answer', ''),
-                    created_at=datetime.utcnow()
-                )
-                db.session.add(new_question)
-
-                # 构建返回给前端的结果
-                questions_result.append({
-                    'id': question_id,
-                    'type': q['type'],
-                    'question': q['question'],
-                    'options': q.get('options', []),
-                    'correct_answer': q.get('correct_answer', '')
-                })
+        served = list(reused)
+        generated_count = 0
+        shortfall = num_questions - len(served)
 
-            db.session.commit()
+        if shortfall > 0:
+            type_requirement = f"题型限定为: {', '.join(question_types)}" if question_types else "包含选择题、填空题和简答题"
+            # 使用DeepSeek API生成题目
+            response = openai.ChatCompletion.create(
+                model=config.DEEPSEEK_MODEL,
+                messages=[
+                    {"role": "system", "content": "你是一个专业的题目生成助手，根据提供的材料生成考试题目。"},
+                    {"role": "user", "content": f"""
+                    根据以下材料生成{difficulty}难度的{shortfall}道题目:
+                    {text}
+
+                    要求:
+                    1. {type_requirement}
+                    2. 题目考察核心知识点
+                    3. 返回的JSON中必须包含correct_answer字段
+
+                    返回格式:
+                    {{
+                        "status": "success",
+                        "questions": [
+                            {{
+                                "type": "question_type",
+                                "question": "题目内容",
+                                "options": ["选项1", "选项2"] (仅选择题),
+                                "correct_answer": "正确答案",
+                                "accepted_answers": ["其他可接受的写法"] (仅填空题，可省略)
+                            }}
+                        ],
+                        "source_file": "文件名",
+                        "generated_at": "生成时间"
+                    }}
+                    """}
+                ],
+                response_format={"type": "json_object"},
+                temperature=0.7
+            )
+            ai_content = response.choices[0].message.content
+            result = parse_ai_response(ai_content)
 
-            return jsonify({
-                'status': 'success',
-                'questions': questions_result,
-                'question_set_id': question_set_id,  # 返回题目集ID给前端
-                'source_file': file.filename,
-                'generated_at': datetime.utcnow().isoformat()
-            })
+            # 入库时按题干指纹去重；与已有题目重复且用户未见过的直接复用
+            created, duplicates = save_generated_questions(
+                result.get('questions', []), question_set_id, subject, difficulty, source_hash
+            )
+            generated_count = len(created)
+            served_ids = {q.question_id for q in served}
+            seen_ids = {
+                row.question_id for row in QuestionExposure.query.with_entities(QuestionExposure.question_id)
+                .filter(QuestionExposure.user_id == current_user.id,
+                        QuestionExposure.question_id.in_([q.question_id for q in duplicates]))
+            } if duplicates else set()
+            for q in duplicates:
+                if q.question_id not in served_ids and q.question_id not in seen_ids:
+                    served.append(q)
+                    served_ids.add(q.question_id)
+            served.extend(created)
+
+        else:
+            # 全部来自题库，没有调用AI，不计出题次数
+            skip_feature_usage()
+
+        served = served[:num_questions]
+        record_exposures(current_user.id, [q.question_id for q in served])
+        db.session.commit()
+
+        # 构建返回给前端的结果
+        questions_result = [
+            {
+                'id': q.question_id,
+                'type': q.question_type,
+                'question': q.question_text,
+                'options': q.options_data,
+                'correct_answer': q.correct_answer
+            }
+            for q in served
+        ]
+
+        return jsonify({
+            'status': 'success',
+            'questions': questions_result,
+            'question_set_id': question_set_id,  # 返回题目集ID给前端
+            'reused_count': len(reused),
+            'generated_count': generated_count,
+            'source_file': file.filename,
+            'generated_at': datetime.utcnow().isoformat()
+        })
     except Exception as e:
-            db.session.rollback()
-            return jsonify({'error': str(e)}), 500
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
 
 
 # 新增的题目解答路由
@@ -2458,6 +3350,73 @@ def answer_questions():
         return jsonify({'error': f'解答题目过程中出错: {str(e)}'}), 500
 
 
+# 对单道题评分，返回 (是否正确, 得分, 反馈, 置信度)
+def score_question_answer(question, answer_text):
+    match = match_answer(
+        answer_text,
+        question.correct_answer,
+        question_type=question.question_type,
+        accepted_answers=question.accepted_answers_data
+    )
+    is_correct = match['is_correct']
+    score = 10 if is_correct else 0  # 假设每道题10分
+    if is_correct:
+        feedback = "回答正确"
+    elif question.question_type == 'choice':
+        feedback = f"正确答案是: {question.correct_answer}"
+    else:
+        feedback = f"参考答案: {question.correct_answer}"
+    return is_correct, score, feedback, match['confidence']
+
+
+# 本地匹配置信度不足的答案一次性交给AI复核，返回 {question_id: (是否正确, 反馈)}
+def review_answers_with_ai(items):
+    if not items:
+        return {}
+    review_list = [
+        {
+            'question_id': question.question_id,
+            'question': question.question_text,
+            'reference_answer': question.correct_answer,
+            'student_answer': answer_text
+        }
+        for question, answer_text in items
+    ]
+    user_prompt = f"""
+    请判断以下学生答案是否与参考答案意思一致（允许表述不同、同义替换和无关紧要的错别字）：
+    {json.dumps(review_list, ensure_ascii=False)}
+    返回以下格式的 JSON:
+    {{
+        "reviews": [
+            {{"question_id": "题目ID", "is_correct": true, "feedback": "一句话说明"}}
+        ]
+    }}
+    仅输出JSON格式，不要有其他文本。
+    """
+    try:
+        response = openai.ChatCompletion.create(
+            model=config.DEEPSEEK_MODEL,
+            messages=[
+                {"role": "system", "content": "你是一位严谨的阅卷老师，只判断答案是否正确。"},
+                {"role": "user", "content": user_prompt}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.0,
+            max_tokens=1500,
+            stream=False
+        )
+        parsed = parse_ai_response(response.choices[0].message.content)
+        return {
+            item['question_id']: (bool(item.get('is_correct')), item.get('feedback', ''))
+            for item in parsed.get('reviews', [])
+            if isinstance(item, dict) and item.get('question_id')
+        }
+    except Exception as e:
+        # 复核失败时保留本地判定结果
+        app.logger.warning(f"AI复核答案失败: {str(e)}")
+        return {}
+
+
 # 题目解答路由
 @app.route('/api/question/submit-answers', methods=['POST'])
 @csrf.exempt
@@ -2465,64 +3424,86 @@ def submit_answers():
     data = request.get_json()
     if not data or 'student_id' not in data or 'answers' not in data:
         return jsonify({'error': '缺少必要参数'}), 400
+    if not isinstance(data['answers'], list):
+        return jsonify({'error': '答案格式错误'}), 400
 
     try:
         student = Student.query.filter_by(student_id=data['student_id']).first()
         if not student:
             return jsonify({'error': '学生不存在'}), 404
 
+        # 一次 IN 查询取出本次涉及的所有题目，避免逐题查询
+        question_ids = {answer.get('question_id') for answer in data['answers'] if answer.get('question_id')}
+        questions = {
+            q.question_id: q
+            for q in QuestionBank.query.filter(QuestionBank.question_id.in_(question_ids)).all()
+        } if question_ids else {}
+
         results = []
+        submission_rows = []
         total_score = 0
+        submitted_at = datetime.utcnow()
+        attempt_id = str(uuid.uuid4())
+        confidence_threshold = config.Config.ANSWER_MATCH_CONFIDENCE_THRESHOLD
+        needs_review = []  # [(结果下标, 题目, 答案)]
 
         for answer in data['answers']:
-            question = QuestionBank.query.filter_by(question_id=answer['question_id']).first()
+            question = questions.get(answer.get('question_id'))
             if not question:
                 continue
-
-            is_correct = False
-            score = 0
-            feedback = ""
-
-            # 选择题直接比对答案
-            if question.question_type == 'choice':
-                is_correct = answer['answer'].strip().lower() == question.correct_answer.strip().lower()
-                score = 10 if is_correct else 0  # 假设每道选择题10分
-                feedback = "回答正确" if is_correct else f"正确答案是: {question.correct_answer}"
-            else:
-                # 对于非选择题（简答/填空），直接比较学生答案和标准答案
-                # 这里可以更严格地比较，比如忽略大小写、空格等
-                is_correct = answer['answer'].strip().casefold() == question.correct_answer.strip().casefold()
-                score = 10 if is_correct else 0  # 假设每道非选择题也是10分
-
-                # 如果不是完全匹配，提供标准答案作为反馈
-                if not is_correct:
-                    feedback = f"参考答案: {question.correct_answer}"
-                else:
-                    feedback = "回答正确"
-
-            # 记录答题结果
-            submission = QuestionSubmission(
-                student_id=data['student_id'],
-                question_id=answer['question_id'],
-                answer_text=answer['answer'],
-                is_correct=is_correct,
-                score=score,
-                feedback=feedback,
-                submission_time=datetime.utcnow()
-            )
-            db.session.add(submission)
+            answer_text = answer.get('answer') or ''
+
+            is_correct, score, feedback, confidence = score_question_answer(question, answer_text)
+            if confidence < confidence_threshold and question.question_type != 'choice':
+                needs_review.append((len(results), question, answer_text))
+            submission_rows.append({
+                'student_id': data['student_id'],
+                'question_id': question.question_id,
+                'answer_text': answer_text,
+                'is_correct': is_correct,
+                'score': score,
+                'feedback': feedback,
+                'submission_time': submitted_at,
+                'attempt_id': attempt_id
+            })
             total_score += score
 
             results.append({
-                'question_id': answer['question_id'],
+                'question_id': question.question_id,
                 'question': question.question_text,
-                'student_answer': answer['answer'],
+                'student_answer': answer_text,
                 'correct_answer': question.correct_answer,
                 'score': score,
                 'feedback': feedback,
-                'is_correct': is_correct
+                'is_correct': is_correct,
+                'confidence': confidence
             })
 
+        # 只有低置信度的答案才请求AI复核（一次调用）
+        if needs_review and config.Config.ANSWER_AI_REVIEW_ENABLED:
+            reviews = review_answers_with_ai([(question, answer_text) for _, question, answer_text in needs_review])
+            for index, question, _ in needs_review:
+                if question.question_id not in reviews:
+                    continue
+                is_correct, ai_feedback = reviews[question.question_id]
+                score = 10 if is_correct else 0
+                total_score += score - results[index]['score']
+                feedback = "回答正确" if is_correct else f"参考答案: {question.correct_answer}"
+                if ai_feedback:
+                    feedback = f"{feedback}（{ai_feedback}）"
+                results[index].update({'is_correct': is_correct, 'score': score, 'feedback': feedback,
+                                       'reviewed_by_ai': True})
+                submission_rows[index].update({'is_correct': is_correct, 'score': score, 'feedback': feedback})
+
+        # 增量更新题目项目分析
+        update_item_stats([
+            (questions[row['question_id']], row['is_correct'], row['answer_text']) for row in submission_rows
+        ])
+
+        # 批量写入答题记录
+        if submission_rows:
+            db.session.execute(db.insert(QuestionSubmission), submission_rows)
+
         avg_score = total_score / len(data['answers']) if data['answers'] else 0
 
         db.session.commit()
@@ -2533,7 +3514,8 @@ def submit_answers():
             'total_score': total_score,
             'average_score': round(avg_score, 2),
             'results': results,
-            'submitted_at': datetime.utcnow().isoformat()
+            'attempt_id': attempt_id,
+            'submitted_at': submitted_at.isoformat()
         })
 
     except Exception as e:
@@ -2550,15 +3532,20 @@ def get_question_stats(student_id):
         if not student:
             return jsonify({'error': '学生不存在'}), 404
 
-        # 获取答题总体统计
-        submissions = QuestionSubmission.query.filter_by(student_id=student_id).all()
-        total = len(submissions)
+        # 获取答题总体统计（数据库聚合，不加载全部记录）
+        total, correct, avg_score = db.session.execute(
+            db.select(
+                db.func.count(QuestionSubmission.id),
+                db.func.sum(db.case((QuestionSubmission.is_correct == True, 1), else_=0)),
+                db.func.avg(QuestionSubmission.score)
+            ).filter(QuestionSubmission.student_id == student_id)
+        ).one()
         if total == 0:
             return jsonify({'error': '没有答题记录'}), 404
 
-        correct = sum(1 for s in submissions if s.is_correct)
+        correct = int(correct or 0)
         accuracy = round((correct / total) * 100, 2)
-        avg_score = round(sum(s.score for s in submissions) / total, 2)
+        avg_score = round(float(avg_score or 0), 2)
 
         # 按题型统计
         type_stats = db.session.execute(
@@ -2583,25 +3570,24 @@ def get_question_stats(student_id):
             for stat in type_stats
         ]
 
-        # 最近5次答题情况
-        recent_submissions = (
-            QuestionSubmission.query
-            .filter_by(student_id=student_id)
+        # 最近5次答题情况，连表取题目内容
+        recent_submissions = db.session.execute(
+            db.select(QuestionSubmission, QuestionBank.question_text)
+            .outerjoin(QuestionBank, QuestionBank.question_id == QuestionSubmission.question_id)
+            .filter(QuestionSubmission.student_id == student_id)
             .order_by(QuestionSubmission.submission_time.desc())
             .limit(5)
-            .all()
-        )
+        ).all()
 
         recent_results = [
             {
                 'question_id': sub.question_id,
-                'question': QuestionBank.query.filter_by(question_id=sub.question_id).first().question_text[
-                            :50] + '...',
+                'question': (question_text or '')[:50] + '...',
                 'score': sub.score,
                 'is_correct': sub.is_correct,
                 'submitted_at': sub.submission_time.isoformat()
             }
-            for sub in recent_submissions
+            for sub, question_text in recent_submissions
         ]
 
         return jsonify({
@@ -2634,38 +3620,320 @@ def get_question_detail(question_id):
     })
 
 
+# 单题项目分析（难度、区分度、干扰项）
+@app.route('/api/question/<question_id>/item-stats', methods=['GET'])
+@csrf.exempt
+def get_question_item_stats(question_id):
+    question = QuestionBank.query.filter_by(question_id=question_id).first()
+    if not question:
+        return jsonify({'error': '题目不存在'}), 404
+    stats = QuestionItemStats.query.filter_by(question_id=question_id).first()
+    if not stats:
+        return jsonify({'status': 'success', 'question_id': question_id, 'item_stats': None})
+    return jsonify({
+        'status': 'success',
+        'question_id': question_id,
+        'item_stats': item_report(question, stats)
+    })
+
+
+# 解析分页参数：limit 与 before（上一页返回的 next_before，格式为 "ISO时间,id"）
+# 同一次组卷提交的记录共用一个提交时间，只按时间翻页会跳过边界上的记录，因此游标带上 id
+def parse_history_params():
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    before = request.args.get('before')
+    if not before:
+        return limit, None
+    time_part, _, id_part = before.partition(',')
+    return limit, (datetime.fromisoformat(time_part), int(id_part) if id_part else None)
+
+
+# 按 (submission_time, id) 倒序取 before 游标之后的记录
+def apply_history_cursor(query, before):
+    if before:
+        before_time, before_id = before
+        if before_id is None:
+            # 兼容只带时间的旧游标
+            query = query.filter(QuestionSubmission.submission_time < before_time)
+        else:
+            query = query.filter(db.or_(
+                QuestionSubmission.submission_time < before_time,
+                db.and_(QuestionSubmission.submission_time == before_time, QuestionSubmission.id < before_id)
+            ))
+    return query.order_by(QuestionSubmission.submission_time.desc(), QuestionSubmission.id.desc())
+
+
+def history_cursor(submission):
+    return f"{submission.submission_time.isoformat()},{submission.id}"
+
+
+# 单题答题历史（按时间倒序，基于 (question_id, submission_time) 索引分页）
+@app.route('/api/question/<question_id>/submissions', methods=['GET'])
+@csrf.exempt
+def get_question_submissions(question_id):
+    try:
+        limit, before = parse_history_params()
+    except ValueError:
+        return jsonify({'error': 'before参数格式错误'}), 400
+
+    query = QuestionSubmission.query.filter(QuestionSubmission.question_id == question_id)
+    submissions = apply_history_cursor(query, before).limit(limit).all()
+
+    return jsonify({
+        'status': 'success',
+        'question_id': question_id,
+        'submissions': [sub.to_dict() for sub in submissions],
+        'next_before': history_cursor(submissions[-1]) if len(submissions) == limit else None
+    })
+
+
+# 学生答题历史（按时间倒序，基于 (student_id, submission_time) 索引分页）
+@app.route('/api/question/history/<student_id>', methods=['GET'])
+@csrf.exempt
+def get_student_question_history(student_id):
+    try:
+        limit, before = parse_history_params()
+    except ValueError:
+        return jsonify({'error': 'before参数格式错误'}), 400
+
+    query = db.session.query(
+        QuestionSubmission, QuestionBank.question_text, QuestionBank.question_type
+    ).outerjoin(
+        QuestionBank, QuestionBank.question_id == QuestionSubmission.question_id
+    ).filter(QuestionSubmission.student_id == student_id)
+    rows = apply_history_cursor(query, before).limit(limit).all()
+
+    history = []
+    for sub, question_text, question_type in rows:
+        item = sub.to_dict()
+        item['question'] = question_text
+        item['question_type'] = question_type
+        history.append(item)
+
+    return jsonify({
+        'status': 'success',
+        'student_id': student_id,
+        'history': history,
+        'next_before': history_cursor(rows[-1][0]) if len(rows) == limit else None
+    })
+
+
+# 组卷返回给前端的题目格式（不包含答案）
+def quiz_question_payload(question):
+    return {
+        'id': question.question_id,
+        'type': question.question_type,
+        'question': question.question_text,
+        'options': question.options_data,
+        'subject': question.subject,
+        'difficulty': question.difficulty
+    }
+
+
+# 从题库按约束组卷，不调用AI
+@app.route('/api/quiz/assemble', methods=['POST'])
+@csrf.exempt
+@require_login_api
+def assemble_quiz_api():
+    data = request.get_json() or {}
+    try:
+        total = int(data.get('num_questions', 10))
+    except (TypeError, ValueError):
+        return jsonify({'error': '题目数量格式错误'}), 400
+    if total <= 0 or total > 100:
+        return jsonify({'error': '题目数量应在1-100之间'}), 400
+    type_mix = data.get('type_mix')
+    difficulty_mix = data.get('difficulty_mix')
+    try:
+        if type_mix is not None:
+            type_mix = normalize_mix(type_mix)
+        if difficulty_mix is not None:
+            difficulty_mix = normalize_mix(difficulty_mix)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        questions, shortfall = assemble_quiz(
+            total,
+            subject=data.get('subject'),
+            type_mix=type_mix,
+            difficulty_mix=difficulty_mix,
+            user_id=current_user.id,
+            student_id=data.get('student_id')
+        )
+        record_exposures(current_user.id, [q.question_id for q in questions])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'组卷失败: {str(e)}'}), 500
+
+    return jsonify({
+        'status': 'success',
+        'questions': [quiz_question_payload(q) for q in questions],
+        'requested': total,
+        'shortfall': shortfall,
+        'generated_at': datetime.utcnow().isoformat()
+    })
+
+
+# 自适应练习：根据学生最近的正确率选择下一题
+@app.route('/api/quiz/next', methods=['GET'])
+@csrf.exempt
+@require_login_api
+def next_quiz_question():
+    student_id = request.args.get('student_id')
+    if not student_id:
+        return jsonify({'error': '缺少student_id参数'}), 400
+
+    result = next_adaptive_question(
+        student_id,
+        subject=request.args.get('subject'),
+        question_type=request.args.get('question_type'),
+        user_id=current_user.id
+    )
+    question = result['question']
+    if question is None:
+        return jsonify({'error': '题库中没有可用的新题目', 'target_difficulty': result['target_difficulty']}), 404
+
+    record_exposures(current_user.id, [question.question_id])
+    db.session.commit()
+    return jsonify({
+        'status': 'success',
+        'question': quiz_question_payload(question),
+        'target_difficulty': result['target_difficulty'],
+        'recent_accuracy': round(result['accuracy'], 4) if result['accuracy'] is not None else None,
+        'recent_answered': result['answered']
+    })
+
+
+# 题库项目分析列表，便于教师挑选区分度高的题目
+@app.route('/api/question/item-stats', methods=['GET'])
+@csrf.exempt
+def list_question_item_stats():
+    subject = request.args.get('subject')
+    difficulty = request.args.get('difficulty')
+    question_type = request.args.get('question_type')
+    min_attempts = request.args.get('min_attempts', 0, type=int)
+    limit = min(request.args.get('limit', 50, type=int), 200)
+
+    query = db.session.query(QuestionBank, QuestionItemStats).join(
+        QuestionItemStats, QuestionItemStats.question_id == QuestionBank.question_id
+    )
+    if subject:
+        query = query.filter(QuestionBank.subject == subject)
+    if difficulty:
+        query = query.filter(QuestionBank.difficulty == difficulty)
+    if question_type:
+        query = query.filter(QuestionBank.question_type == question_type)
+    if min_attempts:
+        query = query.filter(QuestionItemStats.attempts >= min_attempts)
+
+    rows = query.order_by(
+        QuestionItemStats.point_biserial.is_(None), QuestionItemStats.point_biserial.desc()
+    ).limit(limit).all()
+    return jsonify({
+        'status': 'success',
+        'items': [
+            dict(item_report(question, stats), question_text=question.question_text[:100])
+            for question, stats in rows
+        ]
+    })
+
+
+# 笔记统一结构（migrations/20261019_unify_video_notes.sql）之前保存的笔记没有所属用户，仍对所有人可见；
+# 之后的笔记都有所属用户（用户被删除后所属用户为空的笔记不再公开）
+LEGACY_NOTE_CUTOFF = datetime(2026, 10, 19)
+
+
 # 新增笔记相关的API路由
 @app.route('/api/notes', methods=['GET', 'POST'])
 @csrf.exempt
 def video_notes():
+    user_id = current_user.id if current_user.is_authenticated else None
     if request.method == 'GET':
-        # 获取特定视频的笔记
+        # 获取特定视频的笔记（自己的笔记和没有所属用户的旧笔记）
         video_source = request.args.get('video_source')
         if not video_source:
             return jsonify({'error': '缺少video_source参数'}), 400
 
-        notes = VideoNote.query.filter_by(video_source=video_source).order_by(VideoNote.timestamp.desc()).all()
+        owner_filter = db.and_(VideoNote.user_id.is_(None), VideoNote.timestamp < LEGACY_NOTE_CUTOFF)
+        if user_id:
+            owner_filter = db.or_(owner_filter, VideoNote.user_id == user_id)
+        notes = VideoNote.query.filter(VideoNote.video_source == video_source, owner_filter) \
+            .order_by(VideoNote.timestamp.desc()).all()
         return jsonify({
             'video_source': video_source,
             'notes': [note.to_dict() for note in notes]
         })
 
     elif request.method == 'POST':
-        # 创建新笔记
+        # 创建新笔记（需要登录，笔记只属于创建者）
+        if not user_id:
+            return jsonify({
+                'success': False,
+                'message': '请先登录后使用此功能',
+                'code': 'NOT_LOGGED_IN',
+                'redirect': '/login'
+            }), 401
         data = request.json
         if not data or 'video_source' not in data or 'content' not in data:
             return jsonify({'error': '缺少必要参数'}), 400
 
-        new_note = VideoNote(
-            video_source=data['video_source'],
-            content=data['content']
-        )
-        db.session.add(new_note)
-        db.session.commit()
+        new_note = save_video_note(user_id, 'note', data['video_source'], data['content'],
+                                   video_title=data.get('video_title'))
 
         return jsonify(new_note.to_dict()), 201
 
 
+# 我的视频笔记：按时间倒序分页列出，支持按类型筛选和关键词搜索
+@app.route('/api/notes/mine', methods=['GET'])
+@csrf.exempt
+@require_login_api
+def list_my_video_notes():
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 20, type=int), 100)
+    note_type = request.args.get('type')
+    keyword = (request.args.get('q') or '').strip()
+
+    query = VideoNote.query.filter(VideoNote.user_id == current_user.id)
+    if note_type:
+        query = query.filter(VideoNote.note_type == note_type)
+    for term in keyword.split()[:5]:
+        pattern = f"%{term}%"
+        query = query.filter(db.or_(
+            VideoNote.video_title.ilike(pattern),
+            VideoNote.video_source.ilike(pattern),
+            VideoNote.content.ilike(pattern)
+        ))
+    pagination = query.order_by(VideoNote.timestamp.desc()).paginate(page=page, per_page=per_page, error_out=False)
+    return jsonify({
+        'success': True,
+        'notes': [note.to_dict(include_content=False) for note in pagination.items],
+        'total': pagination.total,
+        'page': page,
+        'per_page': per_page
+    })
+
+
+@app.route('/api/notes/<int:note_id>', methods=['GET', 'DELETE'])
+@csrf.exempt
+@require_login_api
+def video_note_detail(note_id):
+    note = VideoNote.query.filter_by(id=note_id, user_id=current_user.id).first()
+    if not note:
+        return jsonify({'error': '笔记不存在'}), 404
+
+    if request.method == 'GET':
+        data = note.to_dict()
+        if request.args.get('include_transcript', 'false').lower() == 'true':
+            data['transcript'] = note.transcript
+        return jsonify({'success': True, 'note': data})
+
+    db.session.delete(note)
+    db.session.commit()
+    return jsonify({'success': True})
+
+
 @app.route('/generate-ppt')
 def generate_ppt_page():
     return render_template('generate_ppt.html')
@@ -3565,6 +4833,17 @@ def login():
         if not username_input or not password:
             return jsonify({'error': '用户名和密码为必填项'}), 400
         
+        # 来源IP失败次数过多时短时限流（不锁定账户，提示与账户锁定区分开）
+        ip_throttled_until = get_ip_throttle(request.remote_addr)
+        if ip_throttled_until:
+            remaining_seconds = max(1, int((ip_throttled_until - datetime.utcnow()).total_seconds()))
+            app.logger.warning(f'安全事件 - IP登录限流: IP={request.remote_addr}, 用户={username_input}')
+            return jsonify({
+                'error': f'当前网络登录失败次数过多，请在 {remaining_seconds} 秒后重试',
+                'ip_throttled': True,
+                'remaining_seconds': remaining_seconds
+            }), 429
+        
         # 检查账户是否被锁定
         is_locked, locked_until, attempts = is_account_locked(username_input)
         if is_locked:
@@ -3613,8 +4892,10 @@ def login():
                 failure_reason='用户名或密码错误'
             )
             
-            # 获取剩余尝试次数
-            remaining = get_remaining_attempts(username_input)
+            # 剩余尝试次数（记录失败时已算出，不再单独查询）
+            remaining = record_result.get('remaining_attempts')
+            if remaining is None:
+                remaining = get_remaining_attempts(username_input)
             
             # 记录安全日志
             app.logger.warning(
@@ -3635,6 +4916,14 @@ def login():
                     'remaining_attempts': 0
                 }), 403
             
+            if record_result.get('ip_throttled'):
+                app.logger.warning(f'安全事件 - IP登录限流: IP={request.remote_addr}')
+                return jsonify({
+                    'error': '用户名或密码错误，当前网络登录失败次数过多，请稍后重试',
+                    'ip_throttled': True,
+                    'remaining_attempts': remaining
+                }), 429
+            
             # 返回错误和剩余次数
             error_msg = '用户名或密码错误'
             if remaining <= 2 and remaining > 0:
@@ -3734,13 +5023,14 @@ def get_current_user():
                 'is_active': membership.is_active
             }
         
-        # 获取使用统计
+        # 获取使用统计（一次查询取出全部功能的计数）
+        summary = get_usage_summary(current_user.id)
         usage_stats = {
-            'ai_ask_today': current_user.get_usage_count('ai_ask', 'daily'),
-            'ai_ask_week': current_user.get_usage_count('ai_ask', 'weekly'),
-            'ai_ask_month': current_user.get_usage_count('ai_ask', 'monthly'),
-            'generate_question_month': current_user.get_usage_count('generate_question', 'monthly'),
-            'generate_lecture_month': current_user.get_usage_count('generate_lecture', 'monthly'),
+            'ai_ask_today': summary_count(summary, 'ai_ask', 'daily'),
+            'ai_ask_week': summary_count(summary, 'ai_ask', 'weekly'),
+            'ai_ask_month': summary_count(summary, 'ai_ask', 'monthly'),
+            'generate_question_month': summary_count(summary, 'generate_question', 'monthly'),
+            'generate_lecture_month': summary_count(summary, 'generate_lecture', 'monthly'),
         }
         
         return jsonify({
@@ -3784,13 +5074,10 @@ def get_membership_tiers():
     """获取所有会员等级（不包含免费套餐）"""
     try:
         # ⚠️ 过滤掉免费套餐，只显示付费套餐
-        tiers = MembershipTier.query.filter(
-            MembershipTier.is_active == True,
-            MembershipTier.code != 'free'
-        ).order_by(MembershipTier.price).all()
+        tiers = get_tier_catalog().paid_tiers()
         
         return jsonify({
-            'tiers': [tier.to_dict() for tier in tiers]
+            'tiers': [tier_dict(tier) for tier in tiers]
         }), 200
     except Exception as e:
         app.logger.error(f"获取会员等级错误: {str(e)}")
@@ -3838,6 +5125,11 @@ def purchase_membership():
         db.session.add(payment)
         db.session.flush()  # 获取payment.id
         
+        # 限量套餐原子地占用名额
+        if not reserve_for_payment(payment, tier):
+            db.session.rollback()
+            return jsonify({'error': f'{tier.name}已售罄', 'sold_out': True}), 410
+        
         # 计算会员有效期
         start_date = datetime.utcnow()
         end_date = start_date + timedelta(days=tier.duration_days)
@@ -3854,6 +5146,7 @@ def purchase_membership():
         
         db.session.add(membership)
         db.session.commit()
+        invalidate_membership(current_user.id)
         
         return jsonify({
             'message': '购买成功',
@@ -4163,6 +5456,7 @@ def check_payment_status(transaction_id):
                     db.session.add(membership)
             
             db.session.commit()
+            invalidate_membership(current_user.id)
         
         return jsonify({
             'status': payment.status,
@@ -4210,7 +5504,7 @@ def cancel_auto_renew():
 def get_usage_stats_api():
     """获取用户使用统计"""
     try:
-        from membership_utils import FEATURE_PERMISSIONS, get_user_membership, get_usage_stats
+        from membership_utils import get_user_membership
         
         period = request.args.get('period', 'daily')
         user_id = current_user.id
@@ -4220,14 +5514,16 @@ def get_usage_stats_api():
         tier_code = membership.tier.code if membership else 'free'
         
         # 获取各功能的使用统计
+        summary = get_usage_summary(user_id)
         stats = {}
-        for feature_name, permissions in FEATURE_PERMISSIONS.items():
-            tier_perms = permissions.get(tier_code, permissions['free'])
-            used = get_usage_stats(user_id, feature_name, period)
+        entitlements = get_entitlements()
+        for feature_name, _ in entitlements.features():
+            _, limit = entitlements.lookup(tier_code, feature_name)
+            used = summary_count(summary, feature_name, period)
             
             stats[feature_name] = {
                 'used': used,
-                'limit': tier_perms.get('limit', 0)
+                'limit': limit
             }
         
         return jsonify({'stats': stats}), 200
@@ -5029,8 +6325,7 @@ def api_admin_users_create(current_admin):
         db.session.commit()
         
         # 记录管理员操作日志
-        from models_admin import AdminLog
-        log = AdminLog(
+        record_admin_log(
             admin_id=current_admin.id,
             action='create_user',
             module='user',
@@ -5039,8 +6334,6 @@ def api_admin_users_create(current_admin):
             description=f'创建用户 {username} ({email})',
             ip_address=request.remote_addr
         )
-        db.session.add(log)
-        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -5165,10 +6458,12 @@ def api_admin_user_detail(user_id, current_admin):
         ).first()
         
         # 查询使用统计
-        usage = UsageLog.query.filter_by(user_id=user.id).all()
-        ai_answer_count = sum(1 for u in usage if u.feature_code == 'ai_answer_questions')
-        ai_question_count = sum(1 for u in usage if u.feature_code == 'ai_generate_questions')
-        video_summary_count = sum(1 for u in usage if u.feature_code == 'video_summary')
+        usage = dict(db.session.query(UsageLog.feature_code, db.func.count(UsageLog.id)).filter(
+            UsageLog.user_id == user.id
+        ).group_by(UsageLog.feature_code).all())
+        ai_answer_count = usage.get('ai_answer_questions', 0)
+        ai_question_count = usage.get('ai_generate_questions', 0)
+        video_summary_count = usage.get('video_summary', 0)
         
         data = {
             'id': user.id,
@@ -5223,8 +6518,7 @@ def api_admin_user_update(user_id, current_admin):
         db.session.commit()
         
         # 记录操作日志
-        from models_admin import AdminLog
-        log = AdminLog(
+        record_admin_log(
             admin_id=current_admin.id,
             action='update_user',
             module='user',
@@ -5233,8 +6527,6 @@ def api_admin_user_update(user_id, current_admin):
             description=f'更新用户 {user.username} 的信息',
             ip_address=request.remote_addr
         )
-        db.session.add(log)
-        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -5263,8 +6555,7 @@ def api_admin_user_toggle(user_id, current_admin):
         db.session.commit()
         
         # 记录操作日志
-        from models_admin import AdminLog
-        log = AdminLog(
+        record_admin_log(
             admin_id=current_admin.id,
             action='toggle_user',
             module='user',
@@ -5273,8 +6564,6 @@ def api_admin_user_toggle(user_id, current_admin):
             description=f'{"启用" if user.is_active else "禁用"}用户 {user.username}',
             ip_address=request.remote_addr
         )
-        db.session.add(log)
-        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -5310,8 +6599,7 @@ def api_admin_user_delete(user_id, current_admin):
         app.logger.info(f"用户删除成功: {username}")
         
         # 记录操作日志
-        from models_admin import AdminLog
-        log = AdminLog(
+        record_admin_log(
             admin_id=current_admin.id,
             action='delete_user',
             module='user',
@@ -5320,8 +6608,6 @@ def api_admin_user_delete(user_id, current_admin):
             description=f'删除用户 {username} ({email})（已级联删除关联数据）',
             ip_address=request.remote_addr
         )
-        db.session.add(log)
-        db.session.commit()
         
         app.logger.info(f"删除日志已记录")
         
@@ -5368,8 +6654,7 @@ def api_admin_user_reset_password(user_id, current_admin):
         db.session.commit()
         
         # 记录操作日志
-        from models_admin import AdminLog
-        log = AdminLog(
+        record_admin_log(
             admin_id=current_admin.id,
             action='reset_password',
             module='user',
@@ -5378,8 +6663,6 @@ def api_admin_user_reset_password(user_id, current_admin):
             description=f'重置用户 {user.username} 的密码',
             ip_address=request.remote_addr
         )
-        db.session.add(log)
-        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -5443,12 +6726,11 @@ def api_admin_user_unlock(user_id, current_admin):
         
         # 解锁账户
         from utils.security import unlock_account
-        success = unlock_account(user.username)
+        success = unlock_account(user.username, clear_ips=True)
         
         if success:
             # 记录操作日志
-            from models_admin import AdminLog
-            log = AdminLog(
+            record_admin_log(
                 admin_id=current_admin.id,
                 action='unlock_account',
                 module='user',
@@ -5457,8 +6739,6 @@ def api_admin_user_unlock(user_id, current_admin):
                 description=f'解锁用户 {user.username} 的账户',
                 ip_address=request.remote_addr
             )
-            db.session.add(log)
-            db.session.commit()
             
             return jsonify({
                 'success': True,
@@ -5548,10 +6828,10 @@ def api_admin_user_grant_membership(user_id, current_admin):
             db.session.add(membership)
             db.session.commit()
             message = f'已为用户 {user.username} 赠送 {tier.name} 会员 {duration_days} 天'
+        invalidate_membership(user_id)
         
         # 记录操作日志
-        from models_admin import AdminLog
-        log = AdminLog(
+        record_admin_log(
             admin_id=current_admin.id,
             action='grant_membership',
             module='membership',
@@ -5560,8 +6840,6 @@ def api_admin_user_grant_membership(user_id, current_admin):
             description=message,
             ip_address=request.remote_addr
         )
-        db.session.add(log)
-        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -5789,8 +7067,7 @@ def api_admin_users_export(current_admin):
         output.headers["Content-Type"] = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         
         # 记录日志
-        from models_admin import AdminLog
-        log = AdminLog(
+        record_admin_log(
             admin_id=current_admin.id,
             action='export',
             module='user',
@@ -5801,8 +7078,6 @@ def api_admin_users_export(current_admin):
             request_path=request.path,
             status='success'
         )
-        db.session.add(log)
-        db.session.commit()
         
         return output
         
@@ -5962,8 +7237,7 @@ def api_admin_order_update_status(order_id, current_admin):
         db.session.commit()
         
         # 记录操作日志
-        from models_admin import AdminLog
-        log = AdminLog(
+        record_admin_log(
             admin_id=current_admin.id,
             action='update_order_status',
             module='order',
@@ -5972,8 +7246,6 @@ def api_admin_order_update_status(order_id, current_admin):
             description=f'订单 {order.transaction_id} 状态从 {old_status} 变更为 {new_status}',
             ip_address=request.remote_addr
         )
-        db.session.add(log)
-        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -6085,10 +7357,10 @@ def api_admin_order_refund(order_id, current_admin):
             app.logger.info(f"已取消用户 {order.user_id} 的会员权限")
         
         db.session.commit()
+        invalidate_membership(order.user_id)
         
         # 记录操作日志
-        from models_admin import AdminLog
-        log = AdminLog(
+        record_admin_log(
             admin_id=current_admin.id,
             action='refund_order',
             module='order',
@@ -6097,8 +7369,6 @@ def api_admin_order_refund(order_id, current_admin):
             description=f'订单 {order.transaction_id} 已退款，金额: ¥{refund_amount}，原因: {reason}',
             ip_address=request.remote_addr
         )
-        db.session.add(log)
-        db.session.commit()
         
         app.logger.info(f"订单 {order_id} 退款成功")
         
@@ -6134,8 +7404,7 @@ def api_admin_order_update_notes(order_id, current_admin):
         db.session.commit()
         
         # 记录操作日志
-        from models_admin import AdminLog
-        log = AdminLog(
+        record_admin_log(
             admin_id=current_admin.id,
             action='update_order_notes',
             module='order',
@@ -6144,8 +7413,6 @@ def api_admin_order_update_notes(order_id, current_admin):
             description=f'更新订单 {order.transaction_id} 的备注',
             ip_address=request.remote_addr
         )
-        db.session.add(log)
-        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -6361,8 +7628,7 @@ def api_admin_orders_export(current_admin):
         output.headers["Content-type"] = "text/csv; charset=utf-8-sig"
         
         # 记录日志
-        from models_admin import AdminLog
-        log = AdminLog(
+        record_admin_log(
             admin_id=current_admin.id,
             action='export',
             module='order',
@@ -6373,8 +7639,6 @@ def api_admin_orders_export(current_admin):
             request_path=request.path,
             status='success'
         )
-        db.session.add(log)
-        db.session.commit()
         
         return output
         
@@ -6587,16 +7851,13 @@ def api_admin_payments_reconciliation_export(current_admin):
         output.seek(0)
         
         # 记录日志
-        from models_admin import AdminLog
-        log = AdminLog(
+        record_admin_log(
             admin_id=current_admin.id,
             action='export_reconciliation',
             module='payment',
             description=f'导出对账报表: {start_date_str} 至 {end_date_str}，共 {len(transactions)} 条记录',
             ip_address=request.remote_addr
         )
-        db.session.add(log)
-        db.session.commit()
         
         filename = f'对账报表_{start_date_str}_{end_date_str}.xlsx'
         
@@ -6679,8 +7940,7 @@ def api_admin_payment_sync(payment_id, current_admin):
             db.session.commit()
             
             # 记录日志
-            from models_admin import AdminLog
-            log = AdminLog(
+            record_admin_log(
                 admin_id=current_admin.id,
                 action='sync_payment',
                 module='payment',
@@ -6689,8 +7949,6 @@ def api_admin_payment_sync(payment_id, current_admin):
                 description=f'同步支付 {payment.transaction_id} 状态: {old_status} -> {new_status}',
                 ip_address=request.remote_addr
             )
-            db.session.add(log)
-            db.session.commit()
         
         return jsonify({
             'success': True,
@@ -6800,16 +8058,13 @@ def api_admin_payments_batch_sync(current_admin):
             db.session.commit()
             
             # 记录日志
-            from models_admin import AdminLog
-            log = AdminLog(
+            record_admin_log(
                 admin_id=current_admin.id,
                 action='batch_sync_payment',
                 module='payment',
                 description=f'批量同步支付: 同步{synced_count}笔，更新{updated_count}笔，失败{failed_count}笔',
                 ip_address=request.remote_addr
             )
-            db.session.add(log)
-            db.session.commit()
         
         return jsonify({
             'success': True,
@@ -7364,10 +8619,11 @@ def api_admin_membership_tiers(current_admin):
             
             db.session.add(tier)
             db.session.commit()
+            # 其它请求可能在提交前重新载入了目录
+            invalidate_tier_catalog()
             
             # 记录操作日志
-            from models_admin import AdminLog
-            log = AdminLog(
+            record_admin_log(
                 admin_id=current_admin.id,
                 action='create_tier',
                 module='membership',
@@ -7376,8 +8632,6 @@ def api_admin_membership_tiers(current_admin):
                 description=f'创建会员套餐 {tier.name}',
                 ip_address=request.remote_addr
             )
-            db.session.add(log)
-            db.session.commit()
             
             return jsonify({
                 'success': True,
@@ -7440,10 +8694,11 @@ def api_admin_membership_tier_detail(tier_id, current_admin):
                     tier.features = data['features']
             
             db.session.commit()
+            # 其它请求可能在提交前重新载入了目录
+            invalidate_tier_catalog()
             
             # 记录操作日志
-            from models_admin import AdminLog
-            log = AdminLog(
+            record_admin_log(
                 admin_id=current_admin.id,
                 action='update_tier',
                 module='membership',
@@ -7452,8 +8707,6 @@ def api_admin_membership_tier_detail(tier_id, current_admin):
                 description=f'更新会员套餐 {tier.name}',
                 ip_address=request.remote_addr
             )
-            db.session.add(log)
-            db.session.commit()
             
             return jsonify({
                 'success': True,
@@ -7481,10 +8734,11 @@ def api_admin_membership_tier_detail(tier_id, current_admin):
             tier_name = tier.name
             db.session.delete(tier)
             db.session.commit()
+            # 其它请求可能在提交前重新载入了目录
+            invalidate_tier_catalog()
             
             # 记录操作日志
-            from models_admin import AdminLog
-            log = AdminLog(
+            record_admin_log(
                 admin_id=current_admin.id,
                 action='delete_tier',
                 module='membership',
@@ -7493,8 +8747,6 @@ def api_admin_membership_tier_detail(tier_id, current_admin):
                 description=f'删除会员套餐 {tier_name}',
                 ip_address=request.remote_addr
             )
-            db.session.add(log)
-            db.session.commit()
             
             return jsonify({
                 'success': True,
@@ -7553,7 +8805,8 @@ def api_admin_membership_stats(current_admin):
                 'total_members': total_members,
                 'expiring_members': expiring_members,
                 'expired_members': expired_members,
-                'tiers_stats': tiers_stats
+                'tiers_stats': tiers_stats,
+                'expiry_job': get_expiry_metrics()
             }
         })
         
@@ -7851,7 +9104,6 @@ def api_admin_dashboard_ai_usage_heatmap(current_admin):
         return '', 200
         
     try:
-        from sqlalchemy import func
         from datetime import datetime, timedelta
         
         days = int(request.args.get('days', 30))
@@ -7867,26 +9119,15 @@ def api_admin_dashboard_ai_usage_heatmap(current_admin):
             'video_summary': '视频摘要'
         }
         
-        # 查询usage_logs表获取AI功能使用数据
-        usage_data = db.session.query(
-            func.date(UsageLog.created_at).label('date'),
-            UsageLog.feature_code,
-            func.count(UsageLog.id).label('count')
-        ).filter(
-            UsageLog.created_at >= start_date,
-            UsageLog.created_at <= end_date,
-            UsageLog.feature_code.in_(list(ai_features.keys()))
-        ).group_by(
-            func.date(UsageLog.created_at),
-            UsageLog.feature_code
-        ).all()
+        # 读取按天汇总的使用量（usage_rollups）
+        usage_data = rollup_series('day', start_date, end_date, feature_codes=list(ai_features.keys()))
         
         # 构建热力图数据结构 [date, feature, count]
         heatmap_data = []
-        for record in usage_data:
-            date_str = record.date.strftime('%Y-%m-%d')
-            feature_label = ai_features.get(record.feature_code, record.feature_code)
-            heatmap_data.append([date_str, feature_label, record.count])
+        for bucket, feature_code, count in usage_data:
+            date_str = bucket.strftime('%Y-%m-%d')
+            feature_label = ai_features.get(feature_code, feature_code)
+            heatmap_data.append([date_str, feature_label, int(count)])
         
         # 生成完整的日期列表
         date_list = []
@@ -7912,6 +9153,60 @@ def api_admin_dashboard_ai_usage_heatmap(current_admin):
         return jsonify({'success': False, 'message': '获取数据失败'}), 500
 
 
+@app.route('/api/admin/dashboard/usage-trend', methods=['GET', 'OPTIONS'])
+@api_admin_required
+def api_admin_dashboard_usage_trend(current_admin):
+    """获取功能使用趋势（按小时或按天，可按功能/会员等级/注册月份分组）"""
+    if request.method == 'OPTIONS':
+        return '', 200
+        
+    try:
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in ('hour', 'day'):
+            return jsonify({'success': False, 'message': 'granularity 只能是 hour 或 day'}), 400
+        group_by = request.args.get('group_by', 'feature_code')
+        if group_by not in ('feature_code', 'tier_code', 'cohort'):
+            return jsonify({'success': False, 'message': 'group_by 只能是 feature_code、tier_code 或 cohort'}), 400
+        
+        # 按小时最多查看7天，按天最多一年
+        max_span = timedelta(days=7) if granularity == 'hour' else timedelta(days=366)
+        default_span = timedelta(hours=24) if granularity == 'hour' else timedelta(days=30)
+        end_date = datetime.now()
+        span = timedelta(days=request.args.get('days', type=int)) if request.args.get('days') else default_span
+        start_date = end_date - min(span, max_span)
+        
+        feature_codes = [f for f in request.args.get('features', '').split(',') if f]
+        rows = rollup_series(granularity, start_date, end_date, feature_codes=feature_codes or None,
+                             group_by=group_by, filters={
+                                 'tier_code': request.args.get('tier_code'),
+                                 'cohort': request.args.get('cohort')
+                             })
+        
+        label_format = '%Y-%m-%d %H:00' if granularity == 'hour' else '%Y-%m-%d'
+        labels = [bucket.strftime(label_format) for bucket in bucket_range(start_date, end_date, granularity)]
+        index = {label: i for i, label in enumerate(labels)}
+        series = {}
+        for bucket, group_value, count in rows:
+            values = series.setdefault(group_value, [0] * len(labels))
+            position = index.get(bucket.strftime(label_format))
+            if position is not None:
+                values[position] = int(count)
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'labels': labels,
+                'series': [{'name': name, 'data': values} for name, values in sorted(series.items())],
+                'granularity': granularity,
+                'group_by': group_by
+            }
+        })
+        
+    except Exception as e:
+        app.logger.error(f"获取使用趋势失败: {str(e)}", exc_info=True)
+        return jsonify({'success': False, 'message': '获取数据失败'}), 500
+
+
 # ==================== 操作日志 API ====================
 @app.route('/api/admin/logs', methods=['GET', 'OPTIONS'])
 @api_admin_required
@@ -8143,6 +9438,7 @@ def api_admin_settings_get(current_admin):
         return '', 200
         
     try:
+        entitlements = get_entitlements()
         # 从配置读取设置
         settings = {
             'basic': {
@@ -8178,6 +9474,10 @@ def api_admin_settings_get(current_admin):
                 'password_require_special': True,
                 'max_login_attempts': 5,
                 'login_lockout_duration': 1800,
+            },
+            'entitlements': {
+                'version': entitlements.version,
+                'features': entitlements.to_dict()
             }
         }
         
@@ -8207,9 +9507,15 @@ def api_admin_settings_update(current_admin):
         if not category:
             return jsonify({'success': False, 'message': '缺少设置类别'}), 400
         
+        # 功能权益保存到数据库，各进程几秒内自动生效
+        if category == 'entitlements':
+            error = validate_permissions(settings)
+            if error:
+                return jsonify({'success': False, 'message': error}), 400
+            entitlements = save_entitlements(settings, admin_id=current_admin.id)
+        
         # 记录操作日志
-        from models_admin import AdminLog
-        log = AdminLog(
+        record_admin_log(
             admin_id=current_admin.id,
             action='update',
             module='system',
@@ -8217,8 +9523,13 @@ def api_admin_settings_update(current_admin):
             description=f'更新系统设置: {category}',
             ip_address=request.remote_addr
         )
-        db.session.add(log)
-        db.session.commit()
+        
+        if category == 'entitlements':
+            return jsonify({
+                'success': True,
+                'message': '功能权益已更新，无需重启',
+                'data': {'version': entitlements.version, 'features': entitlements.to_dict()}
+            })
         
         return jsonify({
             'success': True,
@@ -8338,7 +9649,7 @@ def api_admin_admins_create(current_admin):
         db.session.commit()
         
         # 记录操作日志
-        log = AdminLog(
+        record_admin_log(
             admin_id=current_admin.id,
             action='create',
             module='admin',
@@ -8347,8 +9658,6 @@ def api_admin_admins_create(current_admin):
             description=f'创建管理员: {username}',
             ip_address=request.remote_addr
         )
-        db.session.add(log)
-        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -8411,7 +9720,7 @@ def api_admin_admins_update(admin_id, current_admin):
         db.session.commit()
         
         # 记录操作日志
-        log = AdminLog(
+        record_admin_log(
             admin_id=current_admin.id,
             action='update',
             module='admin',
@@ -8420,8 +9729,6 @@ def api_admin_admins_update(admin_id, current_admin):
             description=f'更新管理员: {admin.username}',
             ip_address=request.remote_addr
         )
-        db.session.add(log)
-        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -8456,7 +9763,7 @@ def api_admin_admins_delete(admin_id, current_admin):
         db.session.commit()
         
         # 记录操作日志
-        log = AdminLog(
+        record_admin_log(
             admin_id=current_admin.id,
             action='delete',
             module='admin',
@@ -8465,8 +9772,6 @@ def api_admin_admins_delete(admin_id, current_admin):
             description=f'删除管理员: {admin.username}',
             ip_address=request.remote_addr
         )
-        db.session.add(log)
-        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -34,6 +34,47 @@ class BaseConfig:
     ALLOWED_EXTENSIONS = {'c', 'py', 'zip', 'cpp', 'java', 'txt', 'pdf', 'docx', 'pptx'}
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     
+    # 作业提交文件存储配置（按内容SHA-256去重，用于重新批改）
+    ARTIFACT_STORAGE_BACKEND = os.environ.get('ARTIFACT_STORAGE_BACKEND') or 'local'
+    ARTIFACT_STORAGE_PATH = os.environ.get('ARTIFACT_STORAGE_PATH') or os.path.join(BASE_DIR, 'artifacts')
+    ARTIFACT_RETENTION_DAYS = int(os.environ.get('ARTIFACT_RETENTION_DAYS', 180))  # 0表示永久保留
+    
+    # 编程作业自动评测配置
+    AUTOGRADE_MAX_WORKERS = int(os.environ.get('AUTOGRADE_MAX_WORKERS', 0)) or os.cpu_count() or 2
+    # 评测沙箱：学生代码以低权限用户运行（服务需以 root 运行），或套一层 nsjail/unshare 等隔离命令
+    AUTOGRADE_SANDBOX_USER = os.environ.get('AUTOGRADE_SANDBOX_USER', '')
+    AUTOGRADE_SANDBOX_PREFIX = os.environ.get('AUTOGRADE_SANDBOX_PREFIX', '')
+    # 运行学生 Python 代码的解释器（评测用户需要有执行权限），为空时使用服务本身的解释器
+    AUTOGRADE_PYTHON = os.environ.get('AUTOGRADE_PYTHON', '')
+    # 两者都未配置时拒绝评测；仅限本地开发时设为 true
+    AUTOGRADE_ALLOW_UNSANDBOXED = os.environ.get('AUTOGRADE_ALLOW_UNSANDBOXED', 'false').lower() == 'true'
+    # 评测用户可同时存在的进程/线程数（防止 fork 炸弹，JVM 线程也计入；只在配置 AUTOGRADE_SANDBOX_USER 时生效）
+    AUTOGRADE_MAX_PROCESSES = int(os.environ.get('AUTOGRADE_MAX_PROCESSES', 256))
+    # 批改前对代码做静态分析，提示词中只放结构摘要和精简代码
+    CODE_SUMMARY_ENABLED = os.environ.get('CODE_SUMMARY_ENABLED', 'true').lower() == 'true'
+    CODE_SUMMARY_MAX_CHARS = int(os.environ.get('CODE_SUMMARY_MAX_CHARS', 6000))  # 单文件精简代码上限
+    
+    # 作业近似重复检测（MinHash估算的相似度阈值）
+    SIMILARITY_REUSE_THRESHOLD = float(os.environ.get('SIMILARITY_REUSE_THRESHOLD', 0.95))  # 批量批改时复用成绩
+    SIMILARITY_PLAGIARISM_THRESHOLD = float(os.environ.get('SIMILARITY_PLAGIARISM_THRESHOLD', 0.8))  # 标记抄袭嫌疑
+    
+    # 答题本地匹配：置信度低于阈值的非选择题答案交给AI复核
+    ANSWER_MATCH_CONFIDENCE_THRESHOLD = float(os.environ.get('ANSWER_MATCH_CONFIDENCE_THRESHOLD', 0.8))
+    ANSWER_AI_REVIEW_ENABLED = os.environ.get('ANSWER_AI_REVIEW_ENABLED', 'true').lower() == 'true'
+    
+    # 视频总结：字幕按时间窗口分段总结后再汇总（map-reduce）
+    VIDEO_TRANSCRIPT_WINDOW_SECONDS = int(os.environ.get('VIDEO_TRANSCRIPT_WINDOW_SECONDS', 300))
+    VIDEO_SUMMARY_MAX_WORKERS = int(os.environ.get('VIDEO_SUMMARY_MAX_WORKERS', 4))  # 分段总结并发数
+    
+    # 使用日志/管理员操作日志批量写入（write-behind）
+    WRITE_BEHIND_ENABLED = os.environ.get('WRITE_BEHIND_ENABLED', 'true').lower() == 'true'
+    WRITE_BEHIND_FLUSH_MS = int(os.environ.get('WRITE_BEHIND_FLUSH_MS', 500))  # 最长刷新间隔
+    WRITE_BEHIND_MAX_BATCH = int(os.environ.get('WRITE_BEHIND_MAX_BATCH', 200))  # 单批最多行数
+    WRITE_BEHIND_MAX_QUEUE = int(os.environ.get('WRITE_BEHIND_MAX_QUEUE', 10000))  # 队列上限，满了同步写入
+    
+    # 到期会员批量失效的运行间隔（秒），为 0 时只由 cron 运行 scripts/expire_memberships.py
+    MEMBERSHIP_EXPIRY_INTERVAL_SECONDS = int(os.environ.get('MEMBERSHIP_EXPIRY_INTERVAL_SECONDS', 60))
+    
     # CSRF保护配置
     WTF_CSRF_ENABLED = True
     WTF_CSRF_TIME_LIMIT = None  # Token不过期
@@ -50,6 +91,10 @@ class BaseConfig:
     RATELIMIT_HEADERS_ENABLED = True
     RATELIMIT_SWALLOW_ERRORS = True
     
+    # 应用前面受信任的反向代理层数：大于 0 时按 X-Forwarded-For 取真实客户端IP
+    # （登录限流、限速和日志都依赖它；直接对外暴露时必须为 0，否则IP可被伪造）
+    TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))
+    
     # DeepSeek API配置
     DEEPSEEK_API_KEY = os.environ.get('DEEPSEEK_API_KEY') or 'sk-c73b1ba93d0141899f756718e1626880'
     DEEPSEEK_BASE_URL = os.environ.get('DEEPSEEK_BASE_URL') or 'https://api.deepseek.com'
@@ -158,6 +203,9 @@ class ProductionConfig(BaseConfig):
     REDIS_URL = os.environ.get('REDIS_URL') or None
     RATELIMIT_STORAGE_URL = os.environ.get('REDIS_URL') or 'memory://'
     
+    # Zeabur / Vercel 等平台在应用前有一层代理
+    TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', 1))
+    
     # Session配置 - Vercel无Redis，使用文件系统或null
     SESSION_TYPE = 'filesystem' if not os.environ.get('REDIS_URL') else 'redis'
     SESSION_COOKIE_SECURE = True  # 仅HTTPS
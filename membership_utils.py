@@ -2,100 +2,28 @@
 会员系统工具函数和权限装饰器
 """
 from functools import wraps
-from flask import jsonify
+from flask import jsonify, g
 from flask_login import current_user
-from models_membership import UserMembership, UsageLog, MembershipTier
+from models_membership import UserMembership, MembershipTier
 from models import db
-from datetime import datetime, timedelta
-
-# 功能权限配置
-FEATURE_PERMISSIONS = {
-    'ai_ask': {
-        'name': 'AI答疑',
-        'free': {'enabled': True, 'limit': 10},
-        'weekly': {'enabled': True, 'limit': 50},
-        'monthly': {'enabled': True, 'limit': 200},
-        'yearly': {'enabled': True, 'limit': -1}  # -1 表示无限制
-    },
-    'question_gen': {
-        'name': '智能出题',
-        'free': {'enabled': True, 'limit': 3},
-        'weekly': {'enabled': True, 'limit': 15},
-        'monthly': {'enabled': True, 'limit': 50},
-        'yearly': {'enabled': True, 'limit': -1}
-    },
-    'lecture_gen': {
-        'name': '智能讲义',
-        'free': {'enabled': True, 'limit': 2},
-        'weekly': {'enabled': True, 'limit': 10},
-        'monthly': {'enabled': True, 'limit': 30},
-        'yearly': {'enabled': True, 'limit': -1}
-    },
-    'programming_help': {
-        'name': '辅助编程',
-        'free': {'enabled': True, 'limit': 5},
-        'weekly': {'enabled': True, 'limit': 25},
-        'monthly': {'enabled': True, 'limit': 100},
-        'yearly': {'enabled': True, 'limit': -1}
-    },
-    'code_review': {
-        'name': '代码审查',
-        'free': {'enabled': True, 'limit': 3},
-        'weekly': {'enabled': True, 'limit': 15},
-        'monthly': {'enabled': True, 'limit': 60},
-        'yearly': {'enabled': True, 'limit': -1}
-    },
-    'code_explain': {
-        'name': '代码解释',
-        'free': {'enabled': True, 'limit': 5},
-        'weekly': {'enabled': True, 'limit': 25},
-        'monthly': {'enabled': True, 'limit': 100},
-        'yearly': {'enabled': True, 'limit': -1}
-    },
-    'debug_help': {
-        'name': '调试帮助',
-        'free': {'enabled': True, 'limit': 5},
-        'weekly': {'enabled': True, 'limit': 25},
-        'monthly': {'enabled': True, 'limit': 100},
-        'yearly': {'enabled': True, 'limit': -1}
-    },
-    'video_summary': {
-        'name': '视频总结',
-        'free': {'enabled': True, 'limit': 3},
-        'weekly': {'enabled': True, 'limit': 15},
-        'monthly': {'enabled': True, 'limit': 50},
-        'yearly': {'enabled': True, 'limit': -1}
-    },
-    'generate_lecture': {
-        'name': '智能讲义生成',
-        'free': {'enabled': True, 'limit': 2},
-        'weekly': {'enabled': True, 'limit': 10},
-        'monthly': {'enabled': True, 'limit': 30},
-        'yearly': {'enabled': True, 'limit': -1}
-    },
-    'generate_question': {
-        'name': '智能出题生成',
-        'free': {'enabled': True, 'limit': 3},
-        'weekly': {'enabled': True, 'limit': 15},
-        'monthly': {'enabled': True, 'limit': 50},
-        'yearly': {'enabled': True, 'limit': -1}
-    }
-}
-
+from datetime import datetime
+from utils.membership_cache import resolve_membership, resolve_current_membership
+from utils.write_behind import record_usage_log
+from utils.tier_inventory import reserve_tier_slot
+from utils.tier_catalog import get_tier_catalog, tier_dict, EARLY_BIRD_CODES
+from utils.membership_expiry import expire_memberships
+from utils.entitlements import get_entitlements
+from utils.usage_counters import (get_usage_count, increment_usage, get_usage_summary, summary_count,
+                                  invalidate_usage_summary)
 
 def get_user_membership(user_id):
-    """获取用户的会员信息"""
-    membership = UserMembership.query.filter_by(
-        user_id=user_id,
-        is_active=True
-    ).first()
-    
-    return membership
+    """获取用户的会员信息（只读快照，请求内和短时间内的重复调用不再查询数据库）"""
+    return resolve_membership(user_id)
 
 
 def get_usage_stats(user_id, feature_name, period='daily'):
     """
-    获取用户特定功能的使用次数
+    获取用户特定功能的使用次数（读取预聚合计数，不再统计 usage_logs）
     
     Args:
         user_id: 用户ID
@@ -105,42 +33,24 @@ def get_usage_stats(user_id, feature_name, period='daily'):
     Returns:
         int: 使用次数
     """
-    now = datetime.now()
-    
-    if period == 'daily':
-        start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    elif period == 'weekly':
-        start_date = now - timedelta(days=now.weekday())
-        start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-    elif period == 'monthly':
-        start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    else:
-        start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    count = UsageLog.query.filter(
-        UsageLog.user_id == user_id,
-        UsageLog.feature_code == feature_name,
-        UsageLog.created_at >= start_date
-    ).count()
-    
-    return count
+    return get_usage_count(user_id, feature_name, period)
 
 
 def check_feature_access(user, feature_name):
-    """检查用户是否有权限访问某个功能"""
-    membership = get_user_membership(user.id)
+    """检查用户是否有权限访问某个功能（定时任务尚未处理的过期会员按免费用户计算）"""
+    membership = resolve_current_membership(user.id)
     tier_code = membership.tier.code if membership else 'free'
     
-    if feature_name not in FEATURE_PERMISSIONS:
+    entitlements = get_entitlements()
+    entitlement = entitlements.lookup(tier_code, feature_name)
+    if entitlement is None:
         return False, "未知的功能"
     
-    feature_perms = FEATURE_PERMISSIONS[feature_name]
-    tier_perms = feature_perms.get(tier_code, feature_perms['free'])
+    enabled, limit = entitlement
+    feature_label = entitlements.name(feature_name)
+    if not enabled:
+        return False, f"{feature_label}功能未启用"
     
-    if not tier_perms['enabled']:
-        return False, f"{feature_perms['name']}功能未启用"
-    
-    limit = tier_perms['limit']
     if limit == -1:
         return True, "无限制"
     
@@ -148,7 +58,7 @@ def check_feature_access(user, feature_name):
     used = get_usage_stats(user.id, feature_name, 'daily')
     
     if used >= limit:
-        return False, f"今日{feature_perms['name']}使用次数已达上限({limit}次)"
+        return False, f"今日{feature_label}使用次数已达上限({limit}次)"
     
     return True, f"剩余 {limit - used} 次"
 
@@ -156,14 +66,12 @@ def check_feature_access(user, feature_name):
 def log_feature_usage(user_id, feature_name, action='used'):
     """记录功能使用"""
     try:
-        log = UsageLog(
-            user_id=user_id,
-            feature_code=feature_name,
-            action=action,
-            created_at=datetime.now()
-        )
-        db.session.add(log)
+        now = datetime.now()
+        # 配额计数同步写入；审计日志交给写入缓冲批量插入
+        increment_usage(user_id, feature_name, now=now)
         db.session.commit()
+        invalidate_usage_summary(user_id)
+        record_usage_log(user_id, feature_name, action=action, created_at=now)
     except Exception as e:
         db.session.rollback()
         print(f"记录使用日志失败: {str(e)}")
@@ -177,7 +85,7 @@ def membership_required(level):
             if not current_user.is_authenticated:
                 return jsonify({'error': '请先登录'}), 401
             
-            membership = get_user_membership(current_user.id)
+            membership = resolve_current_membership(current_user.id)
             tier_code = membership.tier.code if membership else 'free'
             
             level_order = {'free': 0, 'weekly': 1, 'monthly': 2, 'yearly': 3}
@@ -194,6 +102,18 @@ def membership_required(level):
     return decorator
 
 
+def _response_status(result):
+    """取视图返回值的 HTTP 状态码（兼容 Response 对象和 (body, status) 元组）"""
+    if isinstance(result, tuple) and len(result) > 1 and isinstance(result[1], int):
+        return result[1]
+    return getattr(result, 'status_code', 200)
+
+
+def skip_feature_usage():
+    """在 feature_limit 装饰的视图中调用：本次请求没有实际消耗（如完全命中缓存/题库），不计次数"""
+    g.skip_feature_usage = True
+
+
 def feature_limit(feature_name):
     """功能使用次数限制装饰器"""
     def decorator(f):
@@ -214,8 +134,9 @@ def feature_limit(feature_name):
             # 执行原函数
             result = f(*args, **kwargs)
             
-            # 记录使用
-            log_feature_usage(current_user.id, feature_name)
+            # 记录使用：这是功能使用次数的唯一记录入口，请求失败或视图声明不计次数时跳过
+            if _response_status(result) < 400 and not g.pop('skip_feature_usage', False):
+                log_feature_usage(current_user.id, feature_name)
             
             return result
         return decorated_function
@@ -224,16 +145,13 @@ def feature_limit(feature_name):
 
 # ============= 早鸟优惠和动态定价相关函数 =============
 
-def get_total_yearly_sold_count():
+def get_total_yearly_sold_count(catalog=None):
     """统计已售年卡总数（包括所有早鸟档位）"""
-    from models_membership import PaymentTransaction
-    
-    # 统计所有状态为completed的早鸟套餐订单
-    early_bird_codes = ['early_bird_1', 'early_bird_2', 'early_bird_3']
+    catalog = catalog or get_tier_catalog()
     
     total = 0
-    for code in early_bird_codes:
-        tier = MembershipTier.query.filter_by(code=code).first()
+    for code in EARLY_BIRD_CODES:
+        tier = catalog.get_by_code(code)
         if tier:
             total += tier.sold_count
     
@@ -242,18 +160,17 @@ def get_total_yearly_sold_count():
 
 def get_current_early_bird_tier():
     """
-    获取当前可购买的早鸟档位
+    获取当前可购买的早鸟档位（基于套餐目录缓存在内存中计算）
     
     Returns:
         dict or None: 早鸟档位信息，如果早鸟已售罄则返回None
     """
-    total_sold = get_total_yearly_sold_count()
+    catalog = get_tier_catalog()
+    total_sold = get_total_yearly_sold_count(catalog)
     
     # 查找当前应该显示的早鸟档位
-    early_bird_tiers = MembershipTier.query.filter_by(
-        is_early_bird=True,
-        is_active=True
-    ).order_by(MembershipTier.early_bird_tier).all()
+    early_bird_tiers = catalog.active_early_bird()
+    next_by_stage = {tier.early_bird_tier: tier for tier in reversed(early_bird_tiers)}
     
     for tier in early_bird_tiers:
         # 检查这个档位是否还有名额
@@ -261,16 +178,12 @@ def get_current_early_bird_tier():
             remaining = tier.total_quota - tier.sold_count
             
             # 找下一个档位的价格
-            next_tier = MembershipTier.query.filter_by(
-                is_early_bird=True,
-                is_active=True,
-                early_bird_tier=tier.early_bird_tier + 1
-            ).first()
+            next_tier = next_by_stage.get(tier.early_bird_tier + 1)
             
             next_price = next_tier.price if next_tier else tier.original_price
             
             return {
-                'tier': tier.to_dict(),  # 完整的tier对象
+                'tier': tier_dict(tier),  # 完整的tier对象
                 'tier_id': tier.id,
                 'tier_name': tier.name,
                 'tier_code': tier.code,
@@ -301,23 +214,18 @@ def get_available_tiers():
     early_bird = get_current_early_bird_tier()
     
     # 获取标准套餐（非早鸟）
-    standard_tiers = MembershipTier.query.filter_by(
-        is_early_bird=False,
-        is_active=True
-    ).filter(
-        MembershipTier.code != 'free'
-    ).order_by(MembershipTier.sort_order).all()
+    standard_tiers = get_tier_catalog().standard_tiers()
     
     return {
         'early_bird': early_bird,
         'early_bird_available': early_bird is not None,
-        'standard_tiers': [tier.to_dict() for tier in standard_tiers]
+        'standard_tiers': [tier_dict(tier) for tier in standard_tiers]
     }
 
 
 def check_tier_availability(tier_id):
     """
-    检查套餐是否还有库存
+    检查套餐是否还有库存（读目录缓存，实际占用名额时由条件 UPDATE 保证不超卖）
     
     Args:
         tier_id: 套餐ID
@@ -325,7 +233,7 @@ def check_tier_availability(tier_id):
     Returns:
         tuple: (是否可用, 消息)
     """
-    tier = MembershipTier.query.get(tier_id)
+    tier = get_tier_catalog().get(tier_id)
     
     if not tier:
         return False, "套餐不存在"
@@ -343,7 +251,7 @@ def check_tier_availability(tier_id):
 
 def increment_tier_sold_count(tier_id):
     """
-    增加套餐已售数量
+    增加套餐已售数量（条件 UPDATE，并发时不会超过总名额）
     
     Args:
         tier_id: 套餐ID
@@ -356,11 +264,14 @@ def increment_tier_sold_count(tier_id):
     if not tier:
         return False
     
-    if tier.is_limited and tier.sold_count >= tier.total_quota:
-        return False
-    
-    tier.sold_count += 1
-    tier.updated_at = datetime.utcnow()
+    if tier.is_limited:
+        if not reserve_tier_slot(tier_id):
+            db.session.rollback()
+            return False
+    else:
+        MembershipTier.query.filter_by(id=tier_id).update(
+            {MembershipTier.sold_count: MembershipTier.sold_count + 1}, synchronize_session=False
+        )
     db.session.commit()
     
     return True
@@ -420,14 +331,16 @@ def get_all_features_usage(user_id):
     tier_code = membership.tier.code if membership else 'free'
     
     usage_list = []
+    # 所有功能的使用次数一次查询取出
+    summary = get_usage_summary(user_id)
     
-    for feature_code, feature_info in FEATURE_PERMISSIONS.items():
+    entitlements = get_entitlements()
+    for feature_code, feature_name in entitlements.features():
         # 获取该功能的权限配置
-        tier_perms = feature_info.get(tier_code, feature_info['free'])
-        limit = tier_perms['limit']
+        _, limit = entitlements.lookup(tier_code, feature_code)
         
         # 获取今日使用次数
-        used = get_usage_stats(user_id, feature_code, 'daily')
+        used = summary_count(summary, feature_code, 'daily')
         
         # 计算剩余次数
         if limit == -1:
@@ -439,7 +352,7 @@ def get_all_features_usage(user_id):
         
         usage_list.append({
             'feature_code': feature_code,
-            'feature_name': feature_info['name'],
+            'feature_name': feature_name,
             'limit': limit,
             'used': used,
             'remaining': remaining,
@@ -453,22 +366,9 @@ def get_all_features_usage(user_id):
 
 def auto_downgrade_expired_members():
     """
-    自动降级过期会员（定时任务使用）
+    自动降级过期会员（定时任务使用，按批次集合式更新，见 utils.membership_expiry）
     
     Returns:
         int: 降级的会员数量
     """
-    expired_memberships = UserMembership.query.filter(
-        UserMembership.is_active == True,
-        UserMembership.end_date <= datetime.utcnow()
-    ).all()
-    
-    count = 0
-    for membership in expired_memberships:
-        membership.is_active = False
-        count += 1
-    
-    if count > 0:
-        db.session.commit()
-    
-    return count
+    return expire_memberships()
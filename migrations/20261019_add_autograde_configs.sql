@@ -0,0 +1,19 @@
+-- 编程作业自动评测配置
+-- 新表 autograde_configs 由 db.create_all() 自动创建，此脚本用于手动建表的环境
+-- SQLite / PostgreSQL 通用（PostgreSQL 请将 INTEGER PRIMARY KEY 改为 SERIAL PRIMARY KEY）
+
+CREATE TABLE IF NOT EXISTS autograde_configs (
+    id INTEGER PRIMARY KEY,
+    assignment_name VARCHAR(100) NOT NULL,
+    subject VARCHAR(50) NOT NULL DEFAULT '未分类',
+    language VARCHAR(20),
+    test_cases TEXT NOT NULL,
+    grading_mode VARCHAR(20) DEFAULT 'tests_and_ai',
+    time_limit INTEGER DEFAULT 2,
+    memory_limit_mb INTEGER DEFAULT 256,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_autograde_assignment_subject UNIQUE (assignment_name, subject)
+);
+
+CREATE INDEX IF NOT EXISTS ix_autograde_configs_assignment_name ON autograde_configs(assignment_name);
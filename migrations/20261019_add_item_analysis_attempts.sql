@@ -0,0 +1,7 @@
+-- 项目分析：答题记录带上交卷ID，区分度改用校正后的总分（不含本题）
+-- SQLite / PostgreSQL 通用；执行后运行 scripts/rebuild_item_stats.py 重建汇总
+
+ALTER TABLE question_submission ADD COLUMN attempt_id VARCHAR(36);
+
+ALTER TABLE question_item_stats ADD COLUMN scored_attempts INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE question_item_stats ADD COLUMN scored_correct_count INTEGER NOT NULL DEFAULT 0;
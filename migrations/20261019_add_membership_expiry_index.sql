@@ -0,0 +1,4 @@
+-- 到期会员批量失效：按 (is_active, end_date) 查找到期记录
+-- SQLite / PostgreSQL 通用
+
+CREATE INDEX IF NOT EXISTS idx_membership_active_end ON user_memberships(is_active, end_date);
@@ -0,0 +1,11 @@
+-- 限量套餐库存：订单记录是否占用了名额，取消/过期时据此原子地归还
+-- SQLite / PostgreSQL 通用
+
+ALTER TABLE payment_transactions ADD COLUMN inventory_reserved BOOLEAN DEFAULT FALSE;
+
+-- 已有的待支付和已完成的限量套餐订单都已计入 sold_count
+UPDATE payment_transactions SET inventory_reserved = TRUE
+WHERE status IN ('pending', 'completed')
+  AND tier_id IN (SELECT id FROM membership_tiers WHERE is_limited = TRUE);
+
+CREATE INDEX IF NOT EXISTS idx_payment_status_expires ON payment_transactions(status, expires_at);
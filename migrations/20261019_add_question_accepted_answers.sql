@@ -0,0 +1,4 @@
+-- 题库：额外可接受的答案（JSON列表），供本地答案匹配使用
+-- SQLite / PostgreSQL 通用
+
+ALTER TABLE question_bank ADD COLUMN accepted_answers TEXT;
@@ -0,0 +1,13 @@
+-- 题库复用：科目、难度、题干指纹、材料指纹
+-- question_exposures 新表由 db.create_all() 自动创建，这里只补充已有表的字段
+-- 已有题目的指纹请运行 scripts/backfill_question_fingerprints.py 回填
+-- SQLite / PostgreSQL 通用
+
+ALTER TABLE question_bank ADD COLUMN subject VARCHAR(50) DEFAULT '未分类';
+ALTER TABLE question_bank ADD COLUMN difficulty VARCHAR(20);
+ALTER TABLE question_bank ADD COLUMN fingerprint VARCHAR(64);
+ALTER TABLE question_bank ADD COLUMN source_hash VARCHAR(64);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ix_question_bank_fingerprint ON question_bank(fingerprint);
+CREATE INDEX IF NOT EXISTS ix_question_bank_source_hash ON question_bank(source_hash);
+CREATE INDEX IF NOT EXISTS idx_question_subject_difficulty_type ON question_bank(subject, difficulty, question_type);
@@ -0,0 +1,8 @@
+-- 作业提交文件存储（按内容SHA-256去重），用于重新批改
+-- submission_artifacts 新表由 db.create_all() 自动创建，这里只补充已有表的字段
+-- SQLite / PostgreSQL 通用
+
+ALTER TABLE assignment ADD COLUMN artifact_id INTEGER REFERENCES submission_artifacts(id);
+ALTER TABLE assignment ADD COLUMN graded_at TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS ix_assignment_artifact_id ON assignment(artifact_id);
@@ -0,0 +1,5 @@
+-- 作业近似重复检测：MinHash 签名 + LSH 分桶
+-- submission_lsh_buckets 新表由 db.create_all() 自动创建，这里只补充已有表的字段
+-- SQLite / PostgreSQL 通用
+
+ALTER TABLE submission_artifacts ADD COLUMN minhash_signature TEXT;
@@ -0,0 +1,4 @@
+-- 视频总结缓存同时按用户上传的字幕/粘贴的文稿区分
+-- SQLite / PostgreSQL 通用
+
+ALTER TABLE video_notes ADD COLUMN transcript_hash VARCHAR(64);
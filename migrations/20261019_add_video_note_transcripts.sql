@@ -0,0 +1,8 @@
+-- 视频总结：按视频内容指纹缓存字幕与总结
+-- SQLite / PostgreSQL 通用
+
+ALTER TABLE video_notes ADD COLUMN media_hash VARCHAR(64);
+ALTER TABLE video_notes ADD COLUMN transcript TEXT;
+ALTER TABLE video_notes ADD COLUMN transcript_source VARCHAR(20);
+
+CREATE INDEX IF NOT EXISTS ix_video_notes_media_hash ON video_notes(media_hash);
@@ -0,0 +1,5 @@
+-- 讲义库：讲义默认仅创建者可见，共享需要创建者显式选择
+-- 之前生成的讲义未经创建者同意默认共享，统一改为私有，由创建者自行重新共享
+-- SQLite / PostgreSQL 通用
+
+UPDATE lecture_library SET visibility = 'private';
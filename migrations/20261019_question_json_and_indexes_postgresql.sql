@@ -0,0 +1,21 @@
+-- 题库选项改为原生 JSONB，并为答题记录补充索引（PostgreSQL）
+-- 旧数据为 JSON 文本，直接转换；空字符串视为 NULL
+
+BEGIN;
+
+ALTER TABLE question_bank
+    ALTER COLUMN options TYPE JSONB USING NULLIF(options, '')::jsonb;
+ALTER TABLE question_bank
+    ALTER COLUMN accepted_answers TYPE JSONB USING NULLIF(accepted_answers, '')::jsonb;
+
+-- 按题目 / 按学生查询答题历史
+CREATE INDEX IF NOT EXISTS idx_question_submission_question_time
+    ON question_submission(question_id, submission_time);
+CREATE INDEX IF NOT EXISTS idx_question_submission_student_time
+    ON question_submission(student_id, submission_time);
+
+-- 组卷、复用题目时按科目/难度/题型筛选（20261019_add_question_reuse.sql 已创建时跳过）
+CREATE INDEX IF NOT EXISTS idx_question_subject_difficulty_type
+    ON question_bank(subject, difficulty, question_type);
+
+COMMIT;
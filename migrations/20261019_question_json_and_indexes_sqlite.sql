@@ -0,0 +1,9 @@
+-- 为答题记录补充索引（SQLite）
+-- SQLite 没有原生 JSON 列类型，options / accepted_answers 仍以 JSON 文本存储，无需转换
+
+CREATE INDEX IF NOT EXISTS idx_question_submission_question_time
+    ON question_submission(question_id, submission_time);
+CREATE INDEX IF NOT EXISTS idx_question_submission_student_time
+    ON question_submission(student_id, submission_time);
+CREATE INDEX IF NOT EXISTS idx_question_subject_difficulty_type
+    ON question_bank(subject, difficulty, question_type);
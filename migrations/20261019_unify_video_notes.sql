@@ -0,0 +1,14 @@
+-- 视频笔记统一结构：所属用户、笔记类型、视频标题，以及按用户列出和按视频指纹查找的索引
+-- 之前的 ix_video_notes_media_hash 由 (media_hash, note_type) 复合索引代替
+-- SQLite / PostgreSQL 通用
+
+ALTER TABLE video_notes ADD COLUMN user_id INTEGER REFERENCES users(id) ON DELETE SET NULL;
+ALTER TABLE video_notes ADD COLUMN note_type VARCHAR(20) NOT NULL DEFAULT 'note';
+ALTER TABLE video_notes ADD COLUMN video_title VARCHAR(255);
+
+-- 已有的字幕总结记录
+UPDATE video_notes SET note_type = 'summary' WHERE transcript IS NOT NULL;
+
+DROP INDEX IF EXISTS ix_video_notes_media_hash;
+CREATE INDEX IF NOT EXISTS idx_video_note_user_time ON video_notes(user_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_video_note_media ON video_notes(media_hash, note_type);
@@ -1,10 +1,14 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.postgresql import JSONB
 import uuid
 import json
 
 db = SQLAlchemy()
 
+# PostgreSQL 使用原生 JSONB，SQLite 退化为 JSON（文本存储，由 SQLAlchemy 负责编解码）
+JSONType = db.JSON().with_variant(JSONB(), 'postgresql')
+
 class Student(db.Model):
     __tablename__ = 'student'  # 显式声明表名，避免与已有的 `students` 表冲突
     __table_args__ = (
@@ -110,6 +114,11 @@ class Assignment(db.Model):
     score = db.Column(db.Float)
     feedback = db.Column(db.Text)
     submission_time = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # 提交文件（按内容寻址存储），用于重新批改
+    artifact_id = db.Column(db.Integer, db.ForeignKey('submission_artifacts.id'), index=True)
+    graded_at = db.Column(db.DateTime)  # 最近一次批改时间
+
+    artifact = db.relationship('SubmissionArtifact', backref='assignments')
 
     def to_dict(self):
         return {
@@ -120,34 +129,148 @@ class Assignment(db.Model):
             'chapter': self.chapter,  # 新增
             'score': self.score,
             'feedback': self.feedback,
-            'submission_time': self.submission_time.strftime('%Y-%m-%d %H:%M:%S')
+            'submission_time': self.submission_time.strftime('%Y-%m-%d %H:%M:%S'),
+            'artifact_sha256': self.artifact.sha256 if self.artifact else None
+        }
+
+
+class SubmissionArtifact(db.Model):
+    """作业提交文件表 - 以内容SHA-256去重，文件本体保存在存储后端"""
+    __tablename__ = 'submission_artifacts'
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    original_filename = db.Column(db.String(255))
+    file_extension = db.Column(db.String(20))
+    size_bytes = db.Column(db.Integer, default=0)
+    storage_backend = db.Column(db.String(20), default='local')
+    # 已提取的文本（JSON: {文件名: 内容}），重新批改时无需再次解析
+    extracted_text = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    purged_at = db.Column(db.DateTime)  # 文件本体被保留策略清理的时间
+    # MinHash 签名（JSON整数列表），用于近似重复检测
+    minhash_signature = db.Column(db.Text)
+
+    @property
+    def file_contents(self):
+        """返回解析后的提取文本字典"""
+        if not self.extracted_text:
+            return {}
+        try:
+            return json.loads(self.extracted_text)
+        except (TypeError, json.JSONDecodeError):
+            return {}
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'sha256': self.sha256,
+            'original_filename': self.original_filename,
+            'file_extension': self.file_extension,
+            'size_bytes': self.size_bytes,
+            'storage_backend': self.storage_backend,
+            'has_extracted_text': bool(self.extracted_text),
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            'purged_at': self.purged_at.strftime('%Y-%m-%d %H:%M:%S') if self.purged_at else None
+        }
+
+class SubmissionLSHBucket(db.Model):
+    """提交相似度LSH分桶表 - 每份提交在每个分段占一行，同桶即为相似候选"""
+    __tablename__ = 'submission_lsh_buckets'
+    __table_args__ = (
+        db.Index('idx_lsh_bucket_key', 'bucket_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    bucket_key = db.Column(db.String(24), nullable=False)  # "段号:哈希"
+    artifact_id = db.Column(db.Integer, db.ForeignKey('submission_artifacts.id', ondelete='CASCADE'),
+                            nullable=False, index=True)
+
+class AutogradeConfig(db.Model):
+    """编程作业自动评测配置 - 教师为某次作业提供的测试用例"""
+    __tablename__ = 'autograde_configs'
+    __table_args__ = (
+        db.UniqueConstraint('assignment_name', 'subject', name='uq_autograde_assignment_subject'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    assignment_name = db.Column(db.String(100), nullable=False, index=True)
+    subject = db.Column(db.String(50), nullable=False, default='未分类')
+    language = db.Column(db.String(20))  # python/c/cpp/java，为空时按文件扩展名推断
+    test_cases = db.Column(db.Text, nullable=False)  # JSON: [{"name", "input", "expected_output", "points", "hidden"}]
+    grading_mode = db.Column(db.String(20), default='tests_and_ai')  # tests_only / tests_and_ai
+    time_limit = db.Column(db.Integer, default=2)  # 单个用例时间限制（秒）
+    memory_limit_mb = db.Column(db.Integer, default=256)  # 内存限制（MB）
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def test_cases_data(self):
+        """返回解析后的测试用例列表"""
+        if not self.test_cases:
+            return []
+        try:
+            return json.loads(self.test_cases)
+        except (TypeError, json.JSONDecodeError):
+            return []
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'assignment_name': self.assignment_name,
+            'subject': self.subject,
+            'language': self.language,
+            'test_cases': self.test_cases_data,
+            'grading_mode': self.grading_mode,
+            'time_limit': self.time_limit,
+            'memory_limit_mb': self.memory_limit_mb,
+            'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S') if self.updated_at else None
         }
 
+
 class QuestionBank(db.Model):
     __tablename__ = 'question_bank'
+    __table_args__ = (
+        db.Index('idx_question_subject_difficulty_type', 'subject', 'difficulty', 'question_type'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     question_id = db.Column(db.String(50), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
     question_set_id = db.Column(db.String(50), nullable=False)
     question_text = db.Column(db.Text, nullable=False)
     question_type = db.Column(db.String(20), nullable=False)
-    options = db.Column(db.Text)  # 简化处理，总是使用 Text 类型
+    subject = db.Column(db.String(50), default='未分类')
+    difficulty = db.Column(db.String(20))
+    # 归一化题干的SHA-256，用于拒绝重复题目
+    fingerprint = db.Column(db.String(64), unique=True, index=True)
+    # 出题材料文本的SHA-256，未指定科目时只复用同一材料的题目
+    source_hash = db.Column(db.String(64), index=True)
+    options = db.Column(JSONType)  # 选择题选项列表
     correct_answer = db.Column(db.Text, nullable=False)
     explanation = db.Column(db.Text)
+    accepted_answers = db.Column(JSONType)  # 额外可接受的答案/同义写法
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    def __init__(self, **kwargs):
-        # 确保options被序列化为JSON字符串
-        if 'options' in kwargs and kwargs['options'] is not None:
-            kwargs['options'] = json.dumps(kwargs['options'])
-        super().__init__(**kwargs)
+
+    @staticmethod
+    def _json_list(value):
+        """兼容迁移前以JSON字符串保存的旧数据"""
+        if value is None:
+            return []
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except json.JSONDecodeError:
+                return []
+        return value if isinstance(value, list) else []
+
     @property
     def options_data(self):
-        """统一返回解析后的JSON数据"""
-        if self.options is None:
-            return []
-        try:
-            return json.loads(self.options)
-        except (TypeError, json.JSONDecodeError):
-            return []
+        """统一返回选项列表"""
+        return self._json_list(self.options)
+
+    @property
+    def accepted_answers_data(self):
+        """返回额外可接受的答案列表"""
+        return self._json_list(self.accepted_answers)
     def to_dict(self):
         """API返回的标准格式"""
         return {
@@ -155,16 +278,36 @@ class QuestionBank(db.Model):
             'question_id': self.question_id,
             'question_text': self.question_text,
             'question_type': self.question_type,
+            'subject': self.subject,
+            'difficulty': self.difficulty,
             'options': self.options_data,
             'correct_answer': self.correct_answer,
             'explanation': self.explanation,
+            'accepted_answers': self.accepted_answers_data,
             'created_at': self.created_at.isoformat()
         }
 
 
 
+class QuestionExposure(db.Model):
+    """题目下发记录 - 记录已发给某用户的题目，复用题库时跳过已见过的题"""
+    __tablename__ = 'question_exposures'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'question_id', name='uq_question_exposure_user_question'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    question_id = db.Column(db.String(50), nullable=False)
+    served_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 class QuestionSubmission(db.Model):
     __tablename__ = 'question_submission'
+    __table_args__ = (
+        db.Index('idx_question_submission_question_time', 'question_id', 'submission_time'),
+        db.Index('idx_question_submission_student_time', 'student_id', 'submission_time'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.String(20), db.ForeignKey('student.student_id'), nullable=False)
     question_id = db.Column(db.String(50), nullable=False)  # 关联 question_bank.question_id
@@ -173,10 +316,12 @@ class QuestionSubmission(db.Model):
     feedback = db.Column(db.Text)
     score = db.Column(db.Float)
     submission_time = db.Column(db.DateTime, default=datetime.utcnow)
+    attempt_id = db.Column(db.String(36))  # 同一次交卷的记录共用一个ID，旧数据为空
 
     def to_dict(self):
         return {
             'id': self.id,
+            'attempt_id': self.attempt_id,
             'student_id': self.student_id,
             'question_id': self.question_id,
             'answer_text': self.answer_text,
@@ -186,20 +331,168 @@ class QuestionSubmission(db.Model):
             'submission_time': self.submission_time.strftime('%Y-%m-%d %H:%M:%S')
         }
 
+class QuestionItemStats(db.Model):
+    """题目项目分析汇总表 - 随答题增量更新，查询时直接读取"""
+    __tablename__ = 'question_item_stats'
+
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.String(50), unique=True, nullable=False, index=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    correct_count = db.Column(db.Integer, default=0, nullable=False)
+    # 点二列相关只统计同一次测验中还有其它题目的作答（校正后的总分 = 其余题目的得分率，不含本题）
+    scored_attempts = db.Column(db.Integer, default=0, nullable=False)
+    scored_correct_count = db.Column(db.Integer, default=0, nullable=False)
+    # 点二列相关所需的累计量：校正总分之和/平方和，以及答对者的校正总分之和
+    total_score_sum = db.Column(db.Float, default=0.0, nullable=False)
+    total_score_sq_sum = db.Column(db.Float, default=0.0, nullable=False)
+    correct_total_score_sum = db.Column(db.Float, default=0.0, nullable=False)
+    # 选择题各选项统计 JSON: {"A": [选择人数, 选择者校正总分之和, 计入总分的人数]}
+    option_stats = db.Column(db.Text)
+    p_value = db.Column(db.Float)  # 难度（答对比例）
+    point_biserial = db.Column(db.Float)  # 区分度
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def option_stats_data(self):
+        """返回解析后的选项统计"""
+        if not self.option_stats:
+            return {}
+        try:
+            return json.loads(self.option_stats)
+        except (TypeError, json.JSONDecodeError):
+            return {}
+
+    def to_dict(self):
+        return {
+            'question_id': self.question_id,
+            'attempts': self.attempts,
+            'correct_count': self.correct_count,
+            'p_value': round(self.p_value, 4) if self.p_value is not None else None,
+            'point_biserial': round(self.point_biserial, 4) if self.point_biserial is not None else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
 class VideoNote(db.Model):
+    """视频笔记 - 用户手写笔记、视频字幕总结和视频讲义统一保存在这里"""
     __tablename__ = 'video_notes'
+    __table_args__ = (
+        db.Index('idx_video_note_user_time', 'user_id', 'timestamp'),
+        db.Index('idx_video_note_media', 'media_hash', 'note_type'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))  # 所属用户，旧数据为空
+    note_type = db.Column(db.String(20), default='note', nullable=False)  # note/summary/lecture
     video_source = db.Column(db.String(512), nullable=False)  # 视频URL或文件名
-    content = db.Column(db.Text, nullable=False)  # 笔记内容
+    video_title = db.Column(db.String(255))  # 视频标题，未提供时取文件名或链接
+    content = db.Column(db.Text, nullable=False)  # 笔记内容（总结/讲义正文）
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)  # 创建时间
+    # 视频总结：按视频内容指纹（上传文件的SHA-256或规范化链接的SHA-256）缓存字幕和总结
+    media_hash = db.Column(db.String(64))
+    transcript = db.Column(db.Text)  # 带时间戳的字幕文本
+    transcript_hash = db.Column(db.String(64))  # 用户上传字幕/粘贴文稿的指纹，只来自视频本身时为空
+    transcript_source = db.Column(db.String(20))  # sidecar/embedded/pasted
 
-    def to_dict(self):
-        return {
+    def to_dict(self, include_content=True):
+        data = {
             'id': self.id,
+            'user_id': self.user_id,
+            'note_type': self.note_type,
             'video_source': self.video_source,
-            'content': self.content,
-            'timestamp': self.timestamp.isoformat()
+            'video_title': self.video_title or self.video_source,
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None
         }
+        if include_content:
+            data['content'] = self.content
+            data['transcript_source'] = self.transcript_source
+        else:
+            data['excerpt'] = (self.content or '')[:200]
+        return data
+
+
+class LectureLibraryEntry(db.Model):
+    """讲义库 - 按归一化材料指纹 + 生成参数共享已生成的讲义，重新生成时递增版本"""
+    __tablename__ = 'lecture_library'
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'source_hash', 'params_hash', 'version', name='uq_lecture_library_version'),
+        db.Index('idx_lecture_library_lookup', 'kind', 'source_hash', 'params_hash'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # courseware（课件讲义）/ video（视频讲义）
+    source_hash = db.Column(db.String(64), nullable=False)
+    params_hash = db.Column(db.String(64), nullable=False)
+    params = db.Column(JSONType)  # 生成参数，便于展示
+    version = db.Column(db.Integer, nullable=False, default=1)
+    source_name = db.Column(db.String(255))  # 原始文件名或链接
+    content = db.Column(db.Text, nullable=False)
+    content_format = db.Column(db.String(20), default='markdown')  # markdown / json
+    owner_user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), index=True)
+    visibility = db.Column(db.String(20), nullable=False, default='private')  # private（默认）/ shared（创建者选择共享）
+    hit_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def content_data(self):
+        """json 格式的讲义返回解析后的对象，其它格式返回原文"""
+        if self.content_format != 'json':
+            return self.content
+        try:
+            return json.loads(self.content)
+        except (TypeError, json.JSONDecodeError):
+            return self.content
+
+    def to_dict(self, include_content=False):
+        data = {
+            'id': self.id,
+            'kind': self.kind,
+            'source_name': self.source_name,
+            'params': self.params,
+            'version': self.version,
+            'visibility': self.visibility,
+            'owner_user_id': self.owner_user_id,
+            'hit_count': self.hit_count,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+        if include_content:
+            data['content'] = self.content_data
+        return data
+
+
+class CodeReviewSession(db.Model):
+    """增量代码审查会话 - 保存上一版代码及审查要点，再次提交时只发送diff"""
+    __tablename__ = 'code_review_sessions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    mode = db.Column(db.String(20), nullable=False)  # code_review / debug_help
+    language = db.Column(db.String(30))
+    current_code = db.Column(db.Text)
+    last_review = db.Column(db.Text)
+    findings_summary = db.Column(db.Text)  # 上一轮审查的要点摘要
+    revision = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class CodeExplanationCache(db.Model):
+    """代码解释缓存 - 按规范化代码指纹 + 讲解深度缓存 code_explain / programming_help 的回答"""
+    __tablename__ = 'code_explanation_cache'
+    __table_args__ = (
+        db.UniqueConstraint('feature', 'fingerprint', 'level', name='uq_code_explanation_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    feature = db.Column(db.String(30), nullable=False)  # code_explain / programming_help
+    fingerprint = db.Column(db.String(64), nullable=False)
+    level = db.Column(db.String(20), nullable=False, default='intermediate')
+    language = db.Column(db.String(30))
+    identifiers = db.Column(JSONType)  # 缓存时代码中的标识符（按出现顺序），命中时用于替换变量名
+    response = db.Column(db.Text, nullable=False)
+    hit_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
 class Conversation(db.Model):
@@ -256,3 +549,20 @@ class LoginAttempt(db.Model):
             'locked_until': self.locked_until.isoformat() if self.locked_until else None
         }
 
+
+class LoginThrottle(db.Model):
+    """登录限流计数表 - 每个用户名/IP 一行，保存滑动窗口的上一窗口和当前窗口失败次数及锁定到期时间"""
+    __tablename__ = 'login_throttles'
+    id = db.Column(db.Integer, primary_key=True)
+    key_type = db.Column(db.String(10), nullable=False)  # user/ip
+    key = db.Column(db.String(80), nullable=False)  # 用户名或IP地址
+    window_start = db.Column(db.DateTime, nullable=False)  # 当前窗口起点
+    prev_count = db.Column(db.Integer, default=0, nullable=False)  # 上一窗口的失败次数
+    curr_count = db.Column(db.Integer, default=0, nullable=False)  # 当前窗口的失败次数
+    locked_until = db.Column(db.DateTime)  # 锁定到期时间
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('key_type', 'key', name='uq_login_throttle_key'),
+    )
+
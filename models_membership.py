@@ -78,15 +78,10 @@ class User(db.Model):
         return str(self.id)
     
     def get_current_membership(self):
-        """获取当前有效的会员"""
-        active_membership = UserMembership.query.filter_by(
-            user_id=self.id,
-            is_active=True
-        ).filter(
-            UserMembership.end_date > datetime.utcnow()
-        ).first()
+        """获取当前有效的会员（只读快照，见 utils.membership_cache）"""
+        from utils.membership_cache import resolve_current_membership
         
-        return active_membership
+        return resolve_current_membership(self.id)
     
     def has_permission(self, feature_code):
         """检查是否有权限访问某个功能"""
@@ -116,25 +111,9 @@ class User(db.Model):
         Returns:
             int: 使用次数
         """
-        from datetime import timedelta
+        from utils.usage_counters import get_usage_count
         
-        now = datetime.utcnow()
-        if period == 'daily':
-            start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        elif period == 'weekly':
-            start_date = now - timedelta(days=7)
-        elif period == 'monthly':
-            start_date = now - timedelta(days=30)
-        else:
-            start_date = now - timedelta(days=1)
-        
-        count = UsageLog.query.filter(
-            UsageLog.user_id == self.id,
-            UsageLog.feature_code == feature_code,
-            UsageLog.created_at >= start_date
-        ).count()
-        
-        return count
+        return get_usage_count(self.id, feature_code, period)
 
 
 class MembershipTier(db.Model):
@@ -225,6 +204,11 @@ class UserMembership(db.Model):
     # 关联关系
     tier = db.relationship('MembershipTier', backref='user_memberships')
 
+    # 索引（用于定时任务查找到期会员）
+    __table_args__ = (
+        db.Index('idx_membership_active_end', 'is_active', 'end_date'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -268,6 +252,7 @@ class PaymentTransaction(db.Model):
     notify_url = db.Column(db.Text)                       # 异步回调地址
     callback_data = db.Column(db.Text)                    # 回调原始数据（JSON）
     expires_at = db.Column(db.DateTime)                   # 订单过期时间
+    inventory_reserved = db.Column(db.Boolean, default=False)  # 是否占用了限量套餐名额（见 utils/tier_inventory.py）
     
     # 备注
     note = db.Column(db.Text)
@@ -279,6 +264,11 @@ class PaymentTransaction(db.Model):
     # 关联关系
     tier = db.relationship('MembershipTier', backref='payments')
 
+    # 索引（用于批量清理过期订单）
+    __table_args__ = (
+        db.Index('idx_payment_status_expires', 'status', 'expires_at'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -324,3 +314,61 @@ class UsageLog(db.Model):
             'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S')
         }
 
+
+class UsageCounter(db.Model):
+    """功能使用计数表 - 按 (用户, 功能, 周期, 周期起点) 预聚合，配额检查只读一行"""
+    __tablename__ = 'usage_counters'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    feature_code = db.Column(db.String(50), nullable=False)
+    period = db.Column(db.String(10), nullable=False)  # daily/weekly/monthly
+    bucket_start = db.Column(db.Date, nullable=False)  # 周期起点（当天/本周一/本月1日）
+    count = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'feature_code', 'period', 'bucket_start', name='uq_usage_counter_bucket'),
+    )
+
+
+class UsageRollup(db.Model):
+    """功能使用汇总表 - 按小时/天、功能、会员等级、注册月份汇总 usage_logs，供后台图表查询"""
+    __tablename__ = 'usage_rollups'
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # hour/day
+    bucket_start = db.Column(db.DateTime, nullable=False)  # 整点或当天零点（服务器本地时间，与 usage_logs 一致）
+    feature_code = db.Column(db.String(50), nullable=False)
+    tier_code = db.Column(db.String(20), nullable=False, default='free')  # 汇总时用户的会员等级
+    cohort = db.Column(db.String(7), nullable=False, default='unknown')  # 用户注册月份 YYYY-MM
+    count = db.Column(db.Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'bucket_start', 'feature_code', 'tier_code', 'cohort',
+                            name='uq_usage_rollup_bucket'),
+    )
+
+
+class FeatureEntitlement(db.Model):
+    """功能权益表 - 每个 (功能, 会员等级) 一行，后台可修改，见 utils/entitlements.py"""
+    __tablename__ = 'feature_entitlements'
+    id = db.Column(db.Integer, primary_key=True)
+    feature_code = db.Column(db.String(50), nullable=False)
+    feature_name = db.Column(db.String(50), nullable=False)
+    tier_code = db.Column(db.String(20), nullable=False)
+    enabled = db.Column(db.Boolean, default=True, nullable=False)
+    daily_limit = db.Column(db.Integer, default=0, nullable=False)  # -1 表示无限制
+    sort_order = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('feature_code', 'tier_code', name='uq_feature_entitlement'),
+    )
+
+
+class EntitlementCatalogVersion(db.Model):
+    """功能权益版本表 - 只有一行，权益修改时版本号加一，各进程据此重新加载"""
+    __tablename__ = 'entitlement_catalog_versions'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_by = db.Column(db.Integer)  # 修改的管理员ID
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -11,9 +11,12 @@ import logging
 
 from models import db
 from models_membership import PaymentTransaction, UserMembership, MembershipTier
-from membership_utils import check_tier_availability, increment_tier_sold_count
+from membership_utils import check_tier_availability
+from utils.membership_cache import invalidate_membership
 from utils.payment_alipay import get_alipay_client, is_alipay_configured
 from utils.security import sanitize_input
+from utils.tier_inventory import (reserve_for_payment, close_pending_payment, confirm_payment_slot,
+                                  expire_lapsed_payments)
 
 logger = logging.getLogger(__name__)
 
@@ -41,7 +44,8 @@ def register_payment_routes(app, csrf):
                     'payment_not_configured': True
                 }), 503
             
-            # 检查套餐是否可用
+            # 先归还该套餐过期订单占用的名额，再检查是否可用
+            expire_lapsed_payments(tier_id=tier_id)
             available, message = check_tier_availability(tier_id)
             if not available:
                 return jsonify({
@@ -79,12 +83,11 @@ def register_payment_routes(app, csrf):
             db.session.add(payment)
             db.session.flush()  # 获取payment.id
             
-            # 如果是限量套餐，锁定库存
-            if tier.is_limited:
-                success = increment_tier_sold_count(tier_id)
-                if not success:
-                    db.session.rollback()
-                    return jsonify({'error': '套餐已售罄'}), 410
+            # 如果是限量套餐，原子地占用一个名额并立即提交，不在生成支付链接期间持有行锁
+            if not reserve_for_payment(payment, tier):
+                db.session.rollback()
+                return jsonify({'error': '套餐已售罄', 'sold_out': True}), 410
+            db.session.commit()
             
             # 创建支付URL
             if payment_method == 'alipay':
@@ -132,11 +135,15 @@ def register_payment_routes(app, csrf):
                     
                 except Exception as e:
                     db.session.rollback()
+                    # 订单已提交，关闭订单并归还名额
+                    close_pending_payment(payment, 'failed')
+                    db.session.commit()
                     logger.error(f"创建支付宝订单失败: {str(e)}")
                     return jsonify({'error': f'创建支付失败: {str(e)}'}), 500
             
             else:
-                db.session.rollback()
+                close_pending_payment(payment, 'failed')
+                db.session.commit()
                 return jsonify({'error': '不支持的支付方式'}), 400
             
         except Exception as e:
@@ -172,7 +179,7 @@ def register_payment_routes(app, csrf):
             # 检查订单是否过期
             if payment.expires_at and datetime.utcnow() > payment.expires_at:
                 if payment.status == 'pending':
-                    payment.status = 'expired'
+                    close_pending_payment(payment, 'expired')
                     db.session.commit()
                 
                 return jsonify({
@@ -201,6 +208,8 @@ def register_payment_routes(app, csrf):
                         _activate_membership(payment)
                         
                         db.session.commit()
+                        # 提交后再清除缓存，避免其它请求在提交前读到旧记录并缓存
+                        invalidate_membership(payment.user_id)
                         
                         return jsonify({
                             'status': 'completed',
@@ -217,7 +226,7 @@ def register_payment_routes(app, csrf):
                         }), 200
                     
                     elif trade_status == 'TRADE_CLOSED':
-                        payment.status = 'cancelled'
+                        close_pending_payment(payment, 'cancelled')
                         db.session.commit()
                         
                         return jsonify({
@@ -295,6 +304,8 @@ def register_payment_routes(app, csrf):
                 _activate_membership(payment)
                 
                 db.session.commit()
+                # 提交后再清除缓存，避免其它请求在提交前读到旧记录并缓存
+                invalidate_membership(payment.user_id)
                 
                 logger.info(f"支付成功: {out_trade_no}, 用户: {payment.user_id}")
                 
@@ -302,7 +313,7 @@ def register_payment_routes(app, csrf):
             
             # 处理其他状态
             elif trade_status == 'TRADE_CLOSED':
-                payment.status = 'cancelled'
+                close_pending_payment(payment, 'cancelled')
                 payment.callback_data = json.dumps(callback_data, ensure_ascii=False)
                 db.session.commit()
             
@@ -378,15 +389,12 @@ def register_payment_routes(app, csrf):
                 except Exception as e:
                     logger.warning(f"关闭支付宝订单失败: {str(e)}")
             
-            # 更新订单状态
-            payment.status = 'cancelled'
+            # 更新订单状态并归还限量套餐名额（订单已被回调或过期清理处理时不重复归还）
+            if not close_pending_payment(payment, 'cancelled'):
+                db.session.rollback()
+                return jsonify({'error': '订单状态不允许取消'}), 400
             payment.note = (payment.note or '') + ' [用户取消]'
             
-            # 如果是限量套餐，释放库存
-            tier = payment.tier
-            if tier and tier.is_limited and tier.sold_count > 0:
-                tier.sold_count -= 1
-            
             db.session.commit()
             
             logger.info(f"取消订单成功: {order_id}")
@@ -417,6 +425,9 @@ def register_payment_routes(app, csrf):
                 logger.info(f"会员已开通，跳过: 订单 {payment.transaction_id}")
                 return
             
+            # 订单过期或关闭后才到账时重新占用名额
+            confirm_payment_slot(payment)
+            
             # 计算会员有效期
             start_date = datetime.utcnow()
             
@@ -0,0 +1,66 @@
+"""
+题库指纹回填脚本
+为已有题目计算指纹（题干 + 选项 + 科目/出题材料）；重复题目只保留最早的一条带指纹，其余保持为空，
+不会再被复用，但历史答题记录不受影响。指纹算法变化后使用 --all 全部重新计算
+
+用法:
+    python scripts/backfill_question_fingerprints.py [--all]
+"""
+
+import argparse
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from models import db, QuestionBank
+from utils.question_bank import question_fingerprint, question_scope
+
+BATCH_SIZE = 500
+
+
+def backfill(recompute=False):
+    """按批回填指纹，recompute 为真时先清空全部指纹再重新计算"""
+    with app.app_context():
+        if recompute:
+            QuestionBank.query.update({QuestionBank.fingerprint: None}, synchronize_session=False)
+            db.session.commit()
+        seen = {
+            row.fingerprint for row in QuestionBank.query.with_entities(QuestionBank.fingerprint)
+            .filter(QuestionBank.fingerprint.isnot(None))
+        }
+        updated = 0
+        duplicates = 0
+        last_id = 0
+        while True:
+            batch = QuestionBank.query.filter(
+                QuestionBank.id > last_id,
+                QuestionBank.fingerprint.is_(None)
+            ).order_by(QuestionBank.id).limit(BATCH_SIZE).all()
+            if not batch:
+                break
+            for question in batch:
+                last_id = question.id
+                fingerprint = question_fingerprint(
+                    question.question_text,
+                    question.options_data,
+                    question_scope(question.subject, question.source_hash)
+                )
+                if not fingerprint or fingerprint in seen:
+                    duplicates += 1
+                    continue
+                question.fingerprint = fingerprint
+                seen.add(fingerprint)
+                updated += 1
+            db.session.commit()
+            print(f"  已处理到 id={last_id}，回填 {updated} 条，重复 {duplicates} 条")
+
+        print(f"\n✅ 回填完成：{updated} 条题目写入指纹，{duplicates} 条重复或空题干")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='回填题库指纹')
+    parser.add_argument('--all', action='store_true', help='清空并重新计算全部题目的指纹')
+    backfill(recompute=parser.parse_args().all)
@@ -0,0 +1,33 @@
+"""
+功能使用汇总回填脚本
+根据 usage_logs 重建 usage_rollups（首次上线汇总表或数据修复时运行）
+
+用法：
+    python scripts/backfill_usage_rollups.py            # 重建全部历史
+    python scripts/backfill_usage_rollups.py --days 30  # 只重建最近30天
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from utils.usage_rollups import backfill_usage_rollups
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='回填功能使用汇总')
+    parser.add_argument('--days', type=int, default=0, help='只重建最近N天（默认全部）')
+    parser.add_argument('--batch-size', type=int, default=5000, help='每批处理的日志条数')
+    args = parser.parse_args()
+
+    since = datetime.now() - timedelta(days=args.days) if args.days > 0 else None
+    with app.app_context():
+        start = time.time()
+        count = backfill_usage_rollups(since=since, batch_size=args.batch_size)
+        print(f"✅ 已汇总 {count} 条使用日志，耗时 {time.time() - start:.1f}s")
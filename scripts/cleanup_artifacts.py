@@ -0,0 +1,28 @@
+"""
+作业提交文件清理脚本
+删除超过 ARTIFACT_RETENTION_DAYS 未被使用的提交文件（数据库中的提取文本保留，仍可重新批改），
+建议每天由 cron 运行一次
+
+用法:
+    python scripts/cleanup_artifacts.py [--days 180]
+"""
+
+import argparse
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from utils.artifact_store import cleanup_expired_artifacts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='清理过期的作业提交文件')
+    parser.add_argument('--days', type=int, default=None, help='保留天数，默认读取 ARTIFACT_RETENTION_DAYS')
+    args = parser.parse_args()
+
+    with app.app_context():
+        count = cleanup_expired_artifacts(args.days)
+        print(f"✅ 已清理 {count} 个过期文件")
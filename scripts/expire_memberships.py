@@ -0,0 +1,21 @@
+"""
+到期会员处理脚本
+把 end_date 已过的有效会员记录按批次置为失效（应用进程内已按 MEMBERSHIP_EXPIRY_INTERVAL_SECONDS 周期运行；
+关闭进程内任务时请由 cron 每分钟运行一次）
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from utils.membership_expiry import expire_memberships, get_expiry_metrics
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        count = expire_memberships()
+        metrics = get_expiry_metrics()
+        print(f"✅ 已处理 {count} 条到期会员，{metrics['last_batches']} 批，耗时 {metrics['last_duration_ms']}ms")
@@ -0,0 +1,22 @@
+"""
+过期订单清理脚本
+把超过支付期限的待支付订单标记为 expired 并归还限量套餐名额（建议每分钟由 cron 运行一次；
+下单时也会先清理该套餐的过期订单）
+"""
+
+import os
+import sys
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from utils.tier_inventory import expire_lapsed_payments
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        start = time.time()
+        count = expire_lapsed_payments()
+        print(f"✅ 已处理 {count} 个过期订单，耗时 {time.time() - start:.1f}s")
@@ -0,0 +1,19 @@
+"""
+登录限流计数清理脚本
+删除长时间没有失败记录且未处于锁定期的 login_throttles 行（建议每天由 cron 运行一次）
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from utils.security import purge_login_throttles
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        count = purge_login_throttles()
+        print(f"✅ 已清理 {count} 条登录限流计数")
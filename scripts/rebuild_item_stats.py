@@ -0,0 +1,21 @@
+"""
+题目项目分析重建脚本
+从全部答题记录重新计算 question_item_stats 汇总表（首次上线或数据修复时运行）
+"""
+
+import os
+import sys
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from utils.item_analysis import rebuild_item_stats
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        start = time.time()
+        count = rebuild_item_stats()
+        print(f"✅ 已重建 {count} 道题目的项目分析，耗时 {time.time() - start:.1f}s")
@@ -0,0 +1,52 @@
+"""
+作业相似度索引重建脚本
+清空全部 MinHash 签名和 LSH 分桶后按提取文本重新计算（签名算法变化后运行，
+新旧签名不能互相比较）
+
+用法:
+    python scripts/rebuild_similarity_index.py
+"""
+
+import os
+import sys
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from models import db, SubmissionArtifact, SubmissionLSHBucket
+from utils.similarity_index import index_artifact
+
+BATCH_SIZE = 200
+
+
+def rebuild():
+    """按批重新建立索引，每批提交一次"""
+    with app.app_context():
+        SubmissionLSHBucket.query.delete(synchronize_session=False)
+        SubmissionArtifact.query.update({SubmissionArtifact.minhash_signature: None}, synchronize_session=False)
+        db.session.commit()
+
+        indexed = 0
+        last_id = 0
+        while True:
+            batch = SubmissionArtifact.query.filter(
+                SubmissionArtifact.id > last_id,
+                SubmissionArtifact.extracted_text.isnot(None)
+            ).order_by(SubmissionArtifact.id).limit(BATCH_SIZE).all()
+            if not batch:
+                break
+            for artifact in batch:
+                last_id = artifact.id
+                if index_artifact(artifact) is not None:
+                    indexed += 1
+            db.session.commit()
+            print(f"  已处理到 id={last_id}，建立索引 {indexed} 份")
+        return indexed
+
+
+if __name__ == '__main__':
+    start = time.time()
+    count = rebuild()
+    print(f"\n✅ 已重建 {count} 份提交的相似度索引，耗时 {time.time() - start:.1f}s")
@@ -0,0 +1,21 @@
+"""
+功能使用计数重建脚本
+根据 usage_logs 重新计算当前日/周/月周期的 usage_counters（首次上线计数表或数据修复时运行）
+"""
+
+import os
+import sys
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from utils.usage_counters import rebuild_counters
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        start = time.time()
+        count = rebuild_counters()
+        print(f"✅ 已重建 {count} 条使用计数，耗时 {time.time() - start:.1f}s")
@@ -0,0 +1,110 @@
+"""
+限量套餐库存并发压测脚本
+创建一个临时限量套餐，用数百个线程同时抢购，验证成功数等于名额且 sold_count 不超过总名额；
+随后并发归还一部分名额，验证归还后仍可准确售出。结束后删除临时套餐
+
+用法:
+    python scripts/stress_tier_inventory.py [--buyers 500] [--quota 50] [--rounds 3]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from models import db
+from models_membership import MembershipTier
+from utils.tier_inventory import reserve_tier_slot, release_tier_slots
+
+
+def run_concurrently(count, action):
+    """count 个线程在同一时刻开始执行 action，返回 (成功数, 出错数)"""
+    barrier = threading.Barrier(count)
+    results = {'ok': 0, 'error': 0}
+    lock = threading.Lock()
+
+    def worker():
+        with app.app_context():
+            barrier.wait()
+            try:
+                ok = action()
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                ok = None
+            finally:
+                db.session.remove()
+        with lock:
+            if ok is None:
+                results['error'] += 1
+            elif ok:
+                results['ok'] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results['ok'], results['error']
+
+
+def sold_count(tier_id):
+    db.session.expire_all()
+    return db.session.get(MembershipTier, tier_id).sold_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='限量套餐库存并发压测')
+    parser.add_argument('--buyers', type=int, default=500, help='每轮并发抢购的线程数')
+    parser.add_argument('--quota', type=int, default=50, help='临时套餐的总名额')
+    parser.add_argument('--rounds', type=int, default=3, help='抢购/归还的轮数')
+    args = parser.parse_args()
+
+    with app.app_context():
+        code = f"stress_{uuid.uuid4().hex[:8]}"
+        tier = MembershipTier(name=code, code=code, level=0, price=0, duration_days=1, is_active=False,
+                              is_limited=True, total_quota=args.quota, sold_count=0)
+        db.session.add(tier)
+        db.session.commit()
+        tier_id = tier.id
+
+        failed = False
+        try:
+            for round_no in range(1, args.rounds + 1):
+                before = sold_count(tier_id)
+                start = time.time()
+                sold, errors = run_concurrently(args.buyers, lambda: reserve_tier_slot(tier_id))
+                after = sold_count(tier_id)
+                expected = min(args.quota - before, args.buyers - errors)
+                print(f"第{round_no}轮: {args.buyers} 人抢购 {args.quota - before} 个名额，成功 {sold}，"
+                      f"出错 {errors}，sold_count={after}，耗时 {time.time() - start:.2f}s")
+                if after > args.quota or after - before != sold or sold > expected or (not errors and sold != expected):
+                    print(f"❌ 超卖或计数不一致: 名额 {args.quota}, sold_count {after}, 成功 {sold}")
+                    failed = True
+                    break
+
+                # 并发归还一半名额，下一轮应能恰好再售出这些名额
+                releases = after // 2
+                if releases:
+                    run_concurrently(releases, lambda: release_tier_slots(tier_id) or True)
+                if sold_count(tier_id) != after - releases:
+                    print(f"❌ 归还后计数不一致: 期望 {after - releases}, 实际 {sold_count(tier_id)}")
+                    failed = True
+                    break
+        finally:
+            MembershipTier.query.filter_by(id=tier_id).delete()
+            db.session.commit()
+
+        if failed:
+            sys.exit(1)
+        print("✅ 未出现超卖，已售数量与成功抢购数一致")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试本地答案匹配：近似匹配不能把错误答案以高置信度判对
+用法: python test_answer_matching.py  或  pytest test_answer_matching.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(__file__))
+
+from utils.answer_matching import match_answer
+
+# 与 config.ANSWER_MATCH_CONFIDENCE_THRESHOLD 的默认值一致
+REVIEW_THRESHOLD = 0.8
+
+
+def assert_sent_to_review(user_answer, correct_answer, **kwargs):
+    """判错且置信度低于阈值，会交给AI复核"""
+    result = match_answer(user_answer, correct_answer, **kwargs)
+    assert not result['is_correct'], (user_answer, correct_answer, result)
+    assert result['confidence'] < REVIEW_THRESHOLD, (user_answer, correct_answer, result)
+
+
+def assert_wrong(user_answer, correct_answer, **kwargs):
+    result = match_answer(user_answer, correct_answer, **kwargs)
+    assert not result['is_correct'], (user_answer, correct_answer, result)
+
+
+def assert_correct(user_answer, correct_answer, **kwargs):
+    result = match_answer(user_answer, correct_answer, **kwargs)
+    assert result['is_correct'], (user_answer, correct_answer, result)
+
+
+def test_edit_distance_does_not_change_cjk_or_digits():
+    assert_sent_to_review('南京大学', '北京大学')
+    assert_sent_to_review('1948年', '1949年')
+
+
+def test_chemical_formula_requires_exact_match():
+    assert_sent_to_review('H2O2', 'H2O')
+    assert_sent_to_review('CO', 'CO2')
+    assert_correct('h2o', 'H2O')
+
+
+def test_single_letters_are_not_synonyms_outside_true_false():
+    assert_wrong('t', 'y')
+    assert_wrong('n', 'x')
+    assert_wrong('t', '对')
+    assert_correct('t', '对', question_type='true_false')
+    assert_correct('x', '错', question_type='判断题')
+    assert_correct('正确', '对')
+
+
+def test_multi_part_answer_is_not_split_into_alternatives():
+    assert_wrong('需要叶绿素', '需要光照；需要叶绿素')
+    assert_wrong('然率', '或然率')
+    assert_correct('或然率', '或然率')
+
+
+def test_explicit_alternatives():
+    assert_correct('首都北京', '北京 | 首都北京')
+    assert_correct('km/h', 'km/h')
+    assert_correct('千米每小时', 'km/h / 千米每小时')
+
+
+def test_signs_and_operators_are_not_ignored():
+    assert_wrong('-3', '3')
+    assert_wrong('12', '1/2')
+    assert_wrong('2', '2%')
+    assert_sent_to_review('x+1', 'x-1')
+    assert_sent_to_review('a>b', 'a<b')
+    assert_sent_to_review('3*4', '34')
+    assert_sent_to_review('x^2+2x+1', 'x^2-2x+1')
+    assert_correct('x + 1', 'x+1')
+    assert_correct('-0.5', '-1/2')
+    assert_correct('50%', '0.5')
+
+
+def test_tolerant_matches_still_accepted():
+    assert_correct('photosynthsis', 'photosynthesis')
+    assert_correct('3.140', '3.14')
+    assert_correct('（A）', 'A', question_type='choice')
+
+
+if __name__ == '__main__':
+    tests = [value for name, value in sorted(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")
@@ -5,8 +5,8 @@
 
 from functools import wraps
 from flask import session, redirect, url_for, flash, request, jsonify
-from models_admin import Admin, AdminLog, AdminPermission
-from models import db
+from models_admin import Admin, AdminPermission
+from utils.write_behind import record_admin_log
 import json
 
 
@@ -108,8 +108,8 @@ def log_admin_action(action, module='', description=''):
                         else:
                             status = 'success'
                         
-                        # 创建日志
-                        log = AdminLog(
+                        # 创建日志（批量写入）
+                        record_admin_log(
                             admin_id=admin.id,
                             action=action,
                             module=module,
@@ -122,8 +122,6 @@ def log_admin_action(action, module='', description=''):
                             request_path=request.path,
                             status=status
                         )
-                        db.session.add(log)
-                        db.session.commit()
                 except Exception as e:
                     # 日志记录失败不应影响主功能
                     print(f"Error logging admin action: {str(e)}")
@@ -0,0 +1,268 @@
+"""
+答案匹配模块
+在本地判断学生答案与标准答案是否一致：全角/半角归一化、数值容差、同义词、
+编辑距离以及中文字符 n-gram 相似度，并给出置信度，
+只有置信度不足的答案才需要交给AI复核
+"""
+
+import re
+import unicodedata
+from fractions import Fraction
+
+# 默认同义词组，组内任意写法视为同一答案
+DEFAULT_SYNONYM_GROUPS = [
+    {'对', '正确', '是', '√', '✓', 'true', 'yes', 'right'},
+    {'错', '错误', '否', '×', '✗', 'false', 'no', 'wrong'},
+]
+
+# 单个字母的判断写法只在判断题中使用（填空题里 t/y、n/x 是不同的答案）
+TRUE_FALSE_LETTER_GROUPS = [{'t', 'y'}, {'f', 'n', 'x'}]
+TRUE_FALSE_TYPES = {'true_false', 'judge', 'judgment', 'judgement', '判断', '判断题'}
+
+# 标准答案中多个可接受答案的分隔符：只认显式的 "|" 和两侧有空格的 " / "，
+# 不按“或”、“；”拆分（“或然率”、“需要光照；需要叶绿素”都是完整答案）
+ALTERNATIVE_SEPARATORS = re.compile(r'\s*\|\s*|\s+/\s+')
+
+# 数值比较的容差
+NUMERIC_ABS_TOLERANCE = 1e-6
+NUMERIC_REL_TOLERANCE = 1e-3
+
+# 编辑距离判定：短答案允许的相对编辑距离
+EDIT_DISTANCE_MAX_LENGTH = 30
+EDIT_DISTANCE_RATIO = 0.15
+
+# n-gram 相似度判定阈值
+NGRAM_SIZE = 2
+NGRAM_ACCEPT = 0.85
+
+# 近似匹配改动了数字、汉字或化学式时不自动判对，以该置信度判错交给AI复核
+NEEDS_REVIEW_CONFIDENCE = 0.5
+
+# 归一化时去掉的字符：空白和不影响答案含义的文字标点
+# （保留 + - * / = < > ^ % . 等运算符和小数点："-3" 与 "3"、"x+1" 与 "x-1" 是不同的答案）
+_PUNCTUATION_RE = re.compile(r'[\s　`~!@#$&()_\[\]{}\\|;:\'",?。，、；：？！…—·「」『』【】（）《》〈〉“”‘’]+')
+# 运算符：近似匹配改动了运算符时不自动判对
+_OPERATOR_CHARS = set('+-*/=<>^%.')
+_NUMBER_RE = re.compile(r'^[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?%?$|^[-+]?\d+/\d+$')
+_OPTION_RE = re.compile(r'^[(（]?([a-hA-H])[)）.．、]?')
+_CJK_RE = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]')
+# 化学式：元素符号（大写字母开头）加可选的下标数字，至少两个元素或带下标，如 H2O、NaCl、CO2
+_FORMULA_RE = re.compile(r'^(?:[A-Z][a-z]?\d*|\((?:[A-Z][a-z]?\d*)+\)\d*)+$')
+
+
+def normalize_answer(text):
+    """
+    归一化答案：NFKC（全角转半角）、大小写折叠、去掉文字标点和空白（运算符保留），
+    以及句末的句点
+
+    Args:
+        text (str): 原始答案
+
+    Returns:
+        str: 归一化后的答案
+    """
+    if text is None:
+        return ''
+    text = unicodedata.normalize('NFKC', str(text)).casefold().strip()
+    return _PUNCTUATION_RE.sub('', text).rstrip('.')
+
+
+def parse_number(text):
+    """
+    把答案解析为数值，支持小数、科学计数法、分数和百分数
+
+    Returns:
+        float or None
+    """
+    text = unicodedata.normalize('NFKC', str(text or '')).strip().replace(',', '').replace(' ', '')
+    if not text or not _NUMBER_RE.match(text):
+        return None
+    try:
+        if text.endswith('%'):
+            return float(text[:-1]) / 100
+        if '/' in text:
+            return float(Fraction(text))
+        return float(text)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def extract_option_letters(text):
+    """提取选择题答案中的选项字母，如 'A', '(B)', 'A,C', 'ac'"""
+    text = unicodedata.normalize('NFKC', str(text or '')).strip()
+    match = _OPTION_RE.match(text)
+    if match and len(text) <= 4:
+        return {match.group(1).upper()}
+    compact = re.sub(r'[\s,，、;；和及]+', '', text)
+    if compact and len(compact) <= 8 and re.fullmatch(r'[a-hA-H]+', compact):
+        return set(compact.upper())
+    return None
+
+
+def levenshtein(a, b):
+    """编辑距离"""
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def ngram_similarity(a, b, n=NGRAM_SIZE):
+    """字符 n-gram 的 Dice 相似度，适合没有分词的中文"""
+    if not a or not b:
+        return 0.0
+    if len(a) < n or len(b) < n:
+        return 1.0 if a == b else 0.0
+    grams_a = [a[i:i + n] for i in range(len(a) - n + 1)]
+    grams_b = [b[i:i + n] for i in range(len(b) - n + 1)]
+    counts = {}
+    for gram in grams_a:
+        counts[gram] = counts.get(gram, 0) + 1
+    overlap = 0
+    for gram in grams_b:
+        if counts.get(gram, 0) > 0:
+            counts[gram] -= 1
+            overlap += 1
+    return 2 * overlap / (len(grams_a) + len(grams_b))
+
+
+def looks_like_formula(text):
+    """是否像化学式（区分大小写，需要原始答案）"""
+    text = unicodedata.normalize('NFKC', str(text or '')).strip().replace(' ', '')
+    return bool(_FORMULA_RE.match(text)) and (len(re.findall(r'[A-Z]', text)) > 1 or bool(re.search(r'\d', text)))
+
+
+def changed_characters(a, b):
+    """两个字符串中不能互相对应的字符（按字符计数求对称差）"""
+    counts = {}
+    for ch in a:
+        counts[ch] = counts.get(ch, 0) + 1
+    for ch in b:
+        counts[ch] = counts.get(ch, 0) - 1
+    return {ch for ch, n in counts.items() if n}
+
+
+def looks_like_expression(text):
+    """归一化后的答案是否含有运算符（表达式、不等式、带符号的数）"""
+    return any(ch in _OPERATOR_CHARS for ch in text)
+
+
+def _significant_change(user_norm, expected_norm):
+    """近似匹配时改动的字符里是否有数字、汉字或运算符（年份、校名只差一个字也是不同答案）"""
+    return any(ch.isdigit() or ch in _OPERATOR_CHARS or _CJK_RE.match(ch)
+               for ch in changed_characters(user_norm, expected_norm))
+
+
+def _canonical(text, synonym_groups):
+    """同义词归一：属于某个同义词组时返回该组的排序后首个词"""
+    for group in synonym_groups:
+        if text in group:
+            return min(group)
+    return text
+
+
+def _result(is_correct, confidence, method):
+    return {'is_correct': is_correct, 'confidence': round(confidence, 3), 'method': method}
+
+
+def _match_single(user_norm, user_raw, expected_raw, synonym_groups):
+    """与单个可接受答案比较"""
+    expected_norm = normalize_answer(expected_raw)
+    if not expected_norm:
+        return _result(False, 0.0, 'empty_reference')
+
+    # 数值先于字面比较：符号、百分号、分数线都会改变数值
+    user_number = parse_number(user_raw)
+    expected_number = parse_number(expected_raw)
+    if user_number is not None and expected_number is not None:
+        tolerance = max(NUMERIC_ABS_TOLERANCE, abs(expected_number) * NUMERIC_REL_TOLERANCE)
+        if abs(user_number - expected_number) <= tolerance:
+            return _result(True, 0.99, 'numeric')
+        return _result(False, 0.95, 'numeric')
+
+    if user_norm == expected_norm:
+        return _result(True, 1.0, 'exact')
+
+    if _canonical(user_norm, synonym_groups) == _canonical(expected_norm, synonym_groups):
+        return _result(True, 0.98, 'synonym')
+
+    if looks_like_formula(expected_raw) or looks_like_formula(user_raw):
+        # 化学式只接受完全一致，H2O 与 H2O2 只差一个字符
+        return _result(False, NEEDS_REVIEW_CONFIDENCE, 'formula')
+
+    if looks_like_expression(expected_norm) or looks_like_expression(user_norm):
+        # 表达式只接受完全一致（本地不做代数化简），其余交给AI复核
+        return _result(False, NEEDS_REVIEW_CONFIDENCE, 'expression')
+
+    longest = max(len(user_norm), len(expected_norm))
+    if longest <= EDIT_DISTANCE_MAX_LENGTH:
+        distance = levenshtein(user_norm, expected_norm)
+        allowed = max(1, int(longest * EDIT_DISTANCE_RATIO)) if longest >= 4 else 0
+        if distance <= allowed:
+            if _significant_change(user_norm, expected_norm):
+                return _result(False, NEEDS_REVIEW_CONFIDENCE, 'edit_distance')
+            return _result(True, 0.85, 'edit_distance')
+        if longest <= 4:
+            # 很短的答案差一个字就可能是完全不同的意思
+            return _result(False, 0.9, 'edit_distance')
+
+    similarity = ngram_similarity(user_norm, expected_norm)
+    if similarity >= NGRAM_ACCEPT:
+        if any(ch.isdigit() or ch in _OPERATOR_CHARS for ch in changed_characters(user_norm, expected_norm)):
+            return _result(False, NEEDS_REVIEW_CONFIDENCE, 'ngram')
+        return _result(True, similarity, 'ngram')
+    # 相似度越接近接受阈值，判错的置信度越低，交由AI复核
+    return _result(False, 1 - similarity, 'ngram')
+
+
+def match_answer(user_answer, correct_answer, question_type=None, accepted_answers=None,
+                 synonym_groups=None):
+    """
+    判断学生答案是否正确
+
+    Args:
+        user_answer (str): 学生答案
+        correct_answer (str): 标准答案，可用 "|" 或 " / " 分隔多个可接受答案
+        question_type (str): 题型，choice 时按选项字母比较，判断题额外接受 t/f 等单字母写法
+        accepted_answers (list): 额外可接受的答案
+        synonym_groups (list): 额外同义词组（集合列表）
+
+    Returns:
+        dict: {is_correct, confidence(0~1), method}
+    """
+    if not normalize_answer(user_answer):
+        return _result(False, 1.0, 'empty')
+
+    if question_type == 'choice':
+        user_letters = extract_option_letters(user_answer)
+        expected_letters = extract_option_letters(correct_answer)
+        if user_letters and expected_letters:
+            return _result(user_letters == expected_letters, 1.0, 'choice')
+
+    default_groups = DEFAULT_SYNONYM_GROUPS
+    if question_type in TRUE_FALSE_TYPES:
+        default_groups = [g | letters for g, letters in zip(DEFAULT_SYNONYM_GROUPS, TRUE_FALSE_LETTER_GROUPS)]
+    groups = [set(map(normalize_answer, g)) for g in (synonym_groups or [])] + default_groups
+    candidates = [c for c in ALTERNATIVE_SEPARATORS.split(str(correct_answer or '')) if c.strip()]
+    if str(correct_answer or '').strip() and str(correct_answer).strip() not in candidates:
+        candidates.insert(0, str(correct_answer).strip())
+    candidates.extend(accepted_answers or [])
+
+    user_norm = normalize_answer(user_answer)
+    best = None
+    for candidate in candidates:
+        result = _match_single(user_norm, user_answer, candidate, groups)
+        if result['is_correct']:
+            if best is None or not best['is_correct'] or result['confidence'] > best['confidence']:
+                best = result
+        elif best is None or (not best['is_correct'] and result['confidence'] < best['confidence']):
+            # 判错时取最不确定的那个，避免把可能正确的答案以高置信度判错
+            best = result
+    return best or _result(False, 0.0, 'empty_reference')
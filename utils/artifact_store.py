@@ -0,0 +1,195 @@
+"""
+作业提交文件存储模块
+按内容 SHA-256 寻址保存上传的作业文件，相同内容只存一份，
+供重新批改时直接复用，无需学生重新上传
+"""
+
+import hashlib
+import os
+import shutil
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+
+import config
+
+# 读取文件时的块大小
+CHUNK_SIZE = 64 * 1024
+
+
+def compute_sha256(file_path):
+    """
+    计算文件内容的 SHA-256 摘要
+
+    Args:
+        file_path (str): 文件路径
+
+    Returns:
+        str: 十六进制摘要
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactBackend(ABC):
+    """存储后端基类，新的后端（如对象存储）只需实现以下方法"""
+
+    name = 'base'
+
+    @abstractmethod
+    def exists(self, sha256):
+        """文件是否存在"""
+
+    @abstractmethod
+    def put(self, sha256, source_path):
+        """写入文件，已存在时直接返回"""
+
+    @abstractmethod
+    def open_path(self, sha256):
+        """返回可直接读取的本地文件路径"""
+
+    @abstractmethod
+    def delete(self, sha256):
+        """删除文件，返回是否删除了文件"""
+
+
+class LocalFileSystemBackend(ArtifactBackend):
+    """本地文件系统后端，目录按摘要前两级分片，避免单目录文件过多"""
+
+    name = 'local'
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+
+    def _path(self, sha256):
+        return os.path.join(self.root_dir, sha256[:2], sha256[2:4], sha256)
+
+    def exists(self, sha256):
+        return os.path.exists(self._path(sha256))
+
+    def put(self, sha256, source_path):
+        target = self._path(sha256)
+        if os.path.exists(target):
+            return target
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # 先写临时文件再原子替换，避免并发上传同一文件时读到半截内容
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, target)
+        return target
+
+    def open_path(self, sha256):
+        path = self._path(sha256)
+        return path if os.path.exists(path) else None
+
+    def delete(self, sha256):
+        path = self._path(sha256)
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+
+# 已注册的后端
+BACKENDS = {
+    'local': lambda: LocalFileSystemBackend(
+        getattr(config.Config, 'ARTIFACT_STORAGE_PATH', os.path.join(config.BASE_DIR, 'artifacts'))
+    ),
+}
+
+_backend = None
+
+
+def get_backend():
+    """获取当前配置的存储后端（进程内单例）"""
+    global _backend
+    if _backend is None:
+        backend_name = getattr(config.Config, 'ARTIFACT_STORAGE_BACKEND', 'local')
+        factory = BACKENDS.get(backend_name, BACKENDS['local'])
+        _backend = factory()
+    return _backend
+
+
+def store_artifact(file_path, original_filename):
+    """
+    保存上传文件，已存在相同内容时直接复用
+
+    Args:
+        file_path (str): 临时文件路径
+        original_filename (str): 原始文件名
+
+    Returns:
+        SubmissionArtifact: 对应的数据库记录（未提交）
+    """
+    from models import db, SubmissionArtifact
+
+    sha256 = compute_sha256(file_path)
+    backend = get_backend()
+
+    artifact = SubmissionArtifact.query.filter_by(sha256=sha256).first()
+    if artifact is None:
+        backend.put(sha256, file_path)
+        extension = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
+        artifact = SubmissionArtifact(
+            sha256=sha256,
+            original_filename=original_filename,
+            file_extension=extension,
+            size_bytes=os.path.getsize(file_path),
+            storage_backend=backend.name
+        )
+        db.session.add(artifact)
+        db.session.flush()
+    elif not backend.exists(sha256):
+        # 文件被清理过但记录仍在，重新写入；清除清理标记，之后过期仍可再次清理
+        backend.put(sha256, file_path)
+        artifact.purged_at = None
+
+    artifact.last_used_at = datetime.utcnow()
+    return artifact
+
+
+def get_artifact_path(artifact):
+    """获取已存储文件的本地路径，文件不存在时返回 None"""
+    return get_backend().open_path(artifact.sha256)
+
+
+def cleanup_expired_artifacts(retention_days=None):
+    """
+    清理超过保留期且未被使用的文件（定时任务使用）
+
+    仅删除磁盘文件，保留数据库记录中的已提取文本，
+    因此过期后仍可基于文本重新批改
+
+    Args:
+        retention_days (int): 保留天数，默认读取配置 ARTIFACT_RETENTION_DAYS
+
+    Returns:
+        int: 删除的文件数量
+    """
+    from models import db, SubmissionArtifact
+
+    if retention_days is None:
+        retention_days = getattr(config.Config, 'ARTIFACT_RETENTION_DAYS', 180)
+    if not retention_days or retention_days <= 0:
+        return 0
+
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    backend = get_backend()
+
+    expired = SubmissionArtifact.query.filter(
+        SubmissionArtifact.last_used_at < cutoff,
+        SubmissionArtifact.purged_at.is_(None)
+    ).all()
+
+    count = 0
+    for artifact in expired:
+        if backend.delete(artifact.sha256):
+            count += 1
+        artifact.purged_at = datetime.utcnow()
+
+    if expired:
+        db.session.commit()
+
+    return count
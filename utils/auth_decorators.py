@@ -43,7 +43,8 @@ def require_membership(f):
         
         # 2. 检查是否有有效会员
         from datetime import datetime
-        membership = current_user.get_current_membership()
+        from utils.membership_cache import resolve_membership
+        membership = resolve_membership(current_user.id)
         
         if not membership:
             return jsonify({
@@ -53,7 +54,7 @@ def require_membership(f):
                 'redirect': '/payment'
             }), 403
         
-        # 3. 检查会员是否过期
+        # 3. 检查会员是否过期（定时任务尚未将其置为失效时）
         if membership.end_date < datetime.utcnow():
             return jsonify({
                 'success': False,
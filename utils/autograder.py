@@ -0,0 +1,467 @@
+"""
+编程作业自动评测模块
+在沙箱子进程中编译、运行学生代码，并与教师提供的测试用例比对输出
+支持 Python / C / C++ / Java，限制 CPU 时间、内存、进程数和输出大小
+
+每个命令都经由 utils/sandbox_exec.py 启动：它在 exec 前设置资源限制，
+并切换到 AUTOGRADE_SANDBOX_USER 指定的低权限用户；AUTOGRADE_SANDBOX_PREFIX
+可以再套一层 nsjail / unshare 等命令隔离文件系统和网络。
+两者都未配置时拒绝评测（开发环境可设置 AUTOGRADE_ALLOW_UNSANDBOXED=true）
+"""
+
+import json
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+try:
+    import pwd  # 仅POSIX系统可用
+except ImportError:
+    pwd = None
+
+SANDBOX_EXEC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sandbox_exec.py')
+
+# 默认限制
+DEFAULT_TIME_LIMIT = 2          # 单个用例运行时间（秒）
+MIN_TIME_LIMIT = 1              # 教师可设置的时间限制范围（秒）
+MAX_TIME_LIMIT = 10
+DEFAULT_MEMORY_LIMIT_MB = 256   # 内存上限（MB）
+COMPILE_TIME_LIMIT = 30         # 编译时间上限（秒）
+MAX_OUTPUT_BYTES = 64 * 1024    # 单个用例最多保留的输出
+MAX_FILE_SIZE_BYTES = 1024 * 1024  # 程序可写文件大小上限
+MAX_OPEN_FILES = 64
+
+# 语言与扩展名对应关系
+LANGUAGE_EXTENSIONS = {
+    'python': ('.py',),
+    'c': ('.c', '.h'),
+    'cpp': ('.cpp', '.cc', '.hpp', '.h'),
+    'java': ('.java',),
+}
+
+
+def detect_language(file_contents):
+    """
+    根据提交的文件推断语言
+
+    Args:
+        file_contents (dict): {文件名: 源代码}
+
+    Returns:
+        str or None: 语言名称
+    """
+    names = [name.lower() for name in file_contents]
+    if any(n.endswith('.java') for n in names):
+        return 'java'
+    if any(n.endswith(('.cpp', '.cc')) for n in names):
+        return 'cpp'
+    if any(n.endswith('.c') for n in names):
+        return 'c'
+    if any(n.endswith('.py') for n in names):
+        return 'python'
+    return None
+
+
+class SandboxUnavailable(Exception):
+    """评测沙箱不可用（系统不支持或未配置）"""
+
+
+def _sandbox_settings():
+    """
+    读取沙箱配置
+
+    Returns:
+        dict: {prefix, uid, gid, max_processes}
+
+    Raises:
+        SandboxUnavailable: 无法安全运行学生代码时
+    """
+    if os.name != 'posix':
+        raise SandboxUnavailable('当前系统不支持评测沙箱（需要 Linux/Unix）')
+
+    cfg = config.Config
+    prefix = shlex.split(getattr(cfg, 'AUTOGRADE_SANDBOX_PREFIX', '') or '')
+    user = getattr(cfg, 'AUTOGRADE_SANDBOX_USER', '') or ''
+    uid = gid = None
+    if user:
+        try:
+            entry = pwd.getpwnam(user)
+        except KeyError:
+            raise SandboxUnavailable(f'评测用户 {user} 不存在')
+        uid, gid = entry.pw_uid, entry.pw_gid
+        if uid == 0:
+            raise SandboxUnavailable('评测用户不能是 root')
+        if os.geteuid() != 0:
+            raise SandboxUnavailable('切换评测用户需要服务以 root 运行，请改用 AUTOGRADE_SANDBOX_PREFIX')
+    elif not prefix and not getattr(cfg, 'AUTOGRADE_ALLOW_UNSANDBOXED', False):
+        raise SandboxUnavailable('未配置评测沙箱（AUTOGRADE_SANDBOX_USER 或 AUTOGRADE_SANDBOX_PREFIX）')
+
+    return {
+        'prefix': prefix,
+        'python': getattr(cfg, 'AUTOGRADE_PYTHON', '') or sys.executable,
+        'uid': uid,
+        'gid': gid,
+        # RLIMIT_NPROC 按用户计数：只有切换到专用评测用户时才设置，
+        # 否则会限制服务用户的全部进程，并行评测时无法 fork
+        'max_processes': getattr(cfg, 'AUTOGRADE_MAX_PROCESSES', 64) if uid is not None else None,
+    }
+
+
+def sandbox_unavailable_reason():
+    """
+    评测沙箱不可用的原因，可用时返回 None（调用方据此改用AI批改，而不是记 0 分）
+
+    Returns:
+        str or None
+    """
+    try:
+        _sandbox_settings()
+    except SandboxUnavailable as e:
+        return str(e)
+    return None
+
+
+def _sandbox_command(cmd, sandbox, time_limit, memory_limit_mb, limit_memory):
+    """在命令前加上沙箱前缀和资源限制启动器"""
+    limits = {
+        'cpu_seconds': int(time_limit) + 1,
+        'memory_bytes': memory_limit_mb * 1024 * 1024 if limit_memory else None,
+        'file_size_bytes': MAX_FILE_SIZE_BYTES,
+        'max_processes': sandbox['max_processes'],
+        'max_open_files': MAX_OPEN_FILES,
+        'uid': sandbox['uid'],
+        'gid': sandbox['gid'],
+    }
+    return sandbox['prefix'] + [sys.executable, '-I', SANDBOX_EXEC, json.dumps(limits), '--'] + list(cmd)
+
+
+def _sandbox_env(work_dir):
+    """最小化的环境变量，避免泄露服务端配置（如API密钥）"""
+    return {
+        'PATH': '/usr/local/bin:/usr/bin:/bin',
+        'HOME': work_dir,
+        'TMPDIR': work_dir,
+        'LANG': 'C.UTF-8',
+        'PYTHONDONTWRITEBYTECODE': '1',
+        'PYTHONIOENCODING': 'utf-8',
+    }
+
+
+def _kill_group(proc):
+    """结束整个进程组（包括学生程序再启动的子进程）"""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        proc.kill()
+
+
+def _run(cmd, work_dir, sandbox, stdin_data='', time_limit=DEFAULT_TIME_LIMIT,
+         memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB, limit_memory=True):
+    """
+    在工作目录中通过沙箱运行命令
+
+    Returns:
+        dict: {returncode, stdout, stderr, timed_out, elapsed}
+    """
+    start = time.time()
+    try:
+        # start_new_session 在子进程中调用 setsid，不经过 preexec_fn，可在线程中安全使用
+        proc = subprocess.Popen(
+            _sandbox_command(cmd, sandbox, time_limit, memory_limit_mb, limit_memory),
+            cwd=work_dir,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=_sandbox_env(work_dir),
+            start_new_session=True,
+        )
+    except FileNotFoundError as e:
+        return {
+            'returncode': None,
+            'stdout': '',
+            'stderr': f'评测环境缺少编译器或解释器: {e}',
+            'timed_out': False,
+            'elapsed': 0,
+        }
+
+    try:
+        stdout, stderr = proc.communicate(stdin_data.encode('utf-8'), timeout=time_limit)
+        timed_out = False
+    except subprocess.TimeoutExpired:
+        _kill_group(proc)
+        stdout, _ = proc.communicate()
+        stderr = b''
+        timed_out = True
+    finally:
+        # 主进程正常退出后，残留在进程组中的后台子进程也一并结束
+        if proc.returncode is not None:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+    return {
+        'returncode': None if timed_out else proc.returncode,
+        'stdout': (stdout or b'')[:MAX_OUTPUT_BYTES].decode('utf-8', errors='replace'),
+        'stderr': (stderr or b'')[:MAX_OUTPUT_BYTES].decode('utf-8', errors='replace'),
+        'timed_out': timed_out,
+        'elapsed': round(time.time() - start, 3),
+    }
+
+
+def _write_sources(file_contents, work_dir, language):
+    """把提交的源文件写入工作目录（去掉目录层级，防止路径穿越）"""
+    written = []
+    extensions = LANGUAGE_EXTENSIONS.get(language, ())
+    for name, source in file_contents.items():
+        base_name = os.path.basename(name.replace('\\', '/'))
+        if not base_name.lower().endswith(extensions):
+            continue
+        path = os.path.join(work_dir, base_name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(source)
+        written.append(base_name)
+    return written
+
+
+def _find_java_main(file_contents):
+    """查找包含 main 方法的 Java 类名"""
+    for name, source in file_contents.items():
+        if name.endswith('.java') and 'static void main' in source:
+            return os.path.splitext(os.path.basename(name))[0]
+    return None
+
+
+def _find_python_entry(sources, file_contents):
+    """优先选择 main.py 或包含 __main__ 判断的文件"""
+    if 'main.py' in sources:
+        return 'main.py'
+    for name, source in file_contents.items():
+        base_name = os.path.basename(name.replace('\\', '/'))
+        if base_name in sources and '__main__' in source:
+            return base_name
+    return sources[0] if sources else None
+
+
+def _prepare(file_contents, work_dir, language, memory_limit_mb, sandbox):
+    """
+    编译（如需要）并返回运行命令
+
+    Returns:
+        tuple: (run_cmd or None, compile_error or None, limit_memory)
+    """
+    sources = _write_sources(file_contents, work_dir, language)
+    if not sources:
+        return None, '未找到可评测的源代码文件', True
+
+    if language == 'python':
+        entry = _find_python_entry(sources, file_contents)
+        check = _run([sandbox['python'], '-m', 'py_compile', entry], work_dir, sandbox,
+                     time_limit=COMPILE_TIME_LIMIT, limit_memory=False)
+        if check['returncode'] != 0:
+            return None, check['stderr'] or '语法错误', True
+        return [sandbox['python'], '-I', entry], None, True
+
+    if language in ('c', 'cpp'):
+        compiler = 'gcc' if language == 'c' else 'g++'
+        units = [s for s in sources if not s.endswith(('.h', '.hpp'))]
+        cmd = [compiler, '-O2', '-o', 'prog'] + units
+        if language == 'c':
+            cmd.append('-lm')
+        result = _run(cmd, work_dir, sandbox, time_limit=COMPILE_TIME_LIMIT, limit_memory=False)
+        if result['returncode'] != 0:
+            return None, result['stderr'] or result['stdout'] or '编译失败', True
+        return [os.path.join(work_dir, 'prog')], None, True
+
+    if language == 'java':
+        main_class = _find_java_main(file_contents)
+        if not main_class:
+            return None, '未找到包含 main 方法的类', True
+        result = _run(['javac', '-encoding', 'UTF-8', '-J-XX:+UseSerialGC'] + sources, work_dir, sandbox,
+                      time_limit=COMPILE_TIME_LIMIT, limit_memory=False)
+        if result['returncode'] != 0:
+            return None, result['stderr'] or '编译失败', True
+        # JVM 预留的虚拟内存远大于堆大小，改用 -Xmx 限制堆内存；
+        # JVM 线程也计入进程数限制，使用串行GC并按单核启动以减少线程数
+        return ['java', f'-Xmx{memory_limit_mb}m', '-XX:+UseSerialGC', '-XX:ActiveProcessorCount=1',
+                '-cp', work_dir, main_class], None, False
+
+    return None, f'不支持的语言: {language}', True
+
+
+def normalize_output(text):
+    """比对前规范化输出：统一换行、去掉行尾空白和末尾空行"""
+    lines = (text or '').replace('\r\n', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).rstrip('\n')
+
+
+def run_test_suite(file_contents, test_cases, language=None,
+                   time_limit=DEFAULT_TIME_LIMIT, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB):
+    """
+    对一份提交运行全部测试用例
+
+    Args:
+        file_contents (dict): {文件名: 源代码}
+        test_cases (list): [{'name', 'input', 'expected_output', 'points'}]
+        language (str): 语言，为空时自动推断
+        time_limit (int): 单个用例时间限制（秒），限制在 MIN_TIME_LIMIT~MAX_TIME_LIMIT 之间
+        memory_limit_mb (int): 内存限制（MB）
+
+    Returns:
+        dict: 评测结果，score 为 0-100 的得分；沙箱不可用时 sandbox_unavailable 为 True，
+        compile_error 给出原因
+    """
+    language = language or detect_language(file_contents)
+    time_limit = max(MIN_TIME_LIMIT, min(time_limit or DEFAULT_TIME_LIMIT, MAX_TIME_LIMIT))
+    total_points = sum(float(case.get('points', 1)) for case in test_cases) or 1
+    summary = {
+        'language': language,
+        'compile_error': None,
+        'passed': 0,
+        'total': len(test_cases),
+        'score': 0.0,
+        'cases': [],
+    }
+
+    try:
+        sandbox = _sandbox_settings()
+    except SandboxUnavailable as e:
+        # 不是学生代码的问题，score 不能作为成绩保存
+        summary['compile_error'] = f'无法评测: {e}'
+        summary['sandbox_unavailable'] = True
+        return summary
+
+    work_dir = tempfile.mkdtemp(prefix='autograde_')
+    try:
+        if sandbox['uid'] is not None:
+            # 工作目录交给评测用户，学生程序只能写这个目录
+            os.chown(work_dir, sandbox['uid'], sandbox['gid'])
+        run_cmd, compile_error, limit_memory = _prepare(file_contents, work_dir, language,
+                                                        memory_limit_mb, sandbox)
+        if compile_error:
+            summary['compile_error'] = compile_error[:2000]
+            return summary
+
+        earned = 0.0
+        for index, case in enumerate(test_cases):
+            result = _run(run_cmd, work_dir, sandbox,
+                          stdin_data=case.get('input', ''),
+                          time_limit=time_limit,
+                          memory_limit_mb=memory_limit_mb,
+                          limit_memory=limit_memory)
+
+            if result['timed_out']:
+                status = 'timeout'
+            elif result['returncode'] != 0:
+                status = 'runtime_error'
+            elif normalize_output(result['stdout']) == normalize_output(case.get('expected_output', '')):
+                status = 'passed'
+            else:
+                status = 'wrong_answer'
+
+            points = float(case.get('points', 1))
+            if status == 'passed':
+                summary['passed'] += 1
+                earned += points
+
+            summary['cases'].append({
+                'name': case.get('name') or f'用例{index + 1}',
+                'status': status,
+                'points': points,
+                'elapsed': result['elapsed'],
+                # 只保留少量输出用于反馈，避免把完整输出塞进提示词
+                'stdout': result['stdout'][:500],
+                'stderr': result['stderr'][:500],
+                'hidden': bool(case.get('hidden', False)),
+            })
+
+        summary['score'] = round(earned / total_points * 100, 2)
+        return summary
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_test_suites(submissions, test_cases, language=None,
+                    time_limit=DEFAULT_TIME_LIMIT, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB,
+                    max_workers=None):
+    """
+    并行评测多份提交
+
+    每份提交都在独立的沙箱子进程中运行（不使用 preexec_fn），线程池只负责调度，
+    因此并发度可以按CPU核数设置
+
+    Args:
+        submissions (dict): {key: file_contents}
+        其余参数同 run_test_suite
+
+    Returns:
+        dict: {key: 评测结果}
+    """
+    if not submissions:
+        return {}
+    if max_workers is None:
+        max_workers = getattr(config.Config, 'AUTOGRADE_MAX_WORKERS', None) or os.cpu_count() or 2
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            key: executor.submit(run_test_suite, contents, test_cases, language, time_limit, memory_limit_mb)
+            for key, contents in submissions.items()
+        }
+        return {key: future.result() for key, future in futures.items()}
+
+
+def format_test_report(result, include_hidden=False):
+    """
+    生成简短的评测报告文本，用于反馈和提示词
+
+    Args:
+        result (dict): run_test_suite 的返回值
+        include_hidden (bool): 是否包含隐藏用例的输出
+
+    Returns:
+        str: 报告文本
+    """
+    if result['compile_error']:
+        return f"编译/语法检查失败:\n{result['compile_error'][:800]}"
+
+    status_names = {
+        'passed': '通过',
+        'wrong_answer': '答案错误',
+        'runtime_error': '运行错误',
+        'timeout': '超时',
+    }
+    lines = [f"测试通过 {result['passed']}/{result['total']}，得分 {result['score']}"]
+    for case in result['cases']:
+        line = f"- {case['name']}: {status_names.get(case['status'], case['status'])}"
+        if case['status'] == 'runtime_error' and case['stderr'].strip() and (include_hidden or not case['hidden']):
+            line += f"（{case['stderr'].strip().splitlines()[-1][:200]}）"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def public_test_results(result):
+    """返回给学生的评测结果，隐藏用例不暴露程序输出"""
+    cases = []
+    for case in result['cases']:
+        if case['hidden']:
+            case = dict(case, stdout='', stderr='')
+        cases.append(case)
+    return dict(result, cases=cases)
+
+
+def public_test_cases(test_cases):
+    """对外展示的测试用例：隐藏用例只保留名称和分值，不暴露输入与期望输出"""
+    cases = []
+    for case in test_cases:
+        if case.get('hidden'):
+            case = {'name': case.get('name'), 'points': case.get('points', 1), 'hidden': True}
+        cases.append(case)
+    return cases
@@ -0,0 +1,277 @@
+"""
+代码指纹模块
+把代码转换为去掉注释和空白、局部变量名按出现顺序规范化后的 token 序列并计算指纹，
+只改了空白、注释或变量名的同一段代码得到相同的指纹，用于缓存代码解释结果。
+只有代码中自己声明/赋值的名字会被规范化，调用的库函数、导入的模块和其它未在本地绑定的名字保持原样
+（pow 和 fmod、sqrt 和 floor 的含义不同，不能当作同一个变量）
+"""
+
+import ast
+import builtins
+import hashlib
+import io
+import keyword
+import re
+import tokenize
+import unicodedata
+
+from utils.code_summary import tokenize_c_family
+
+# C 系语言的关键字（不会被当作变量名）
+C_FAMILY_KEYWORDS = {
+    # C / C++
+    'auto', 'break', 'case', 'char', 'const', 'continue', 'default', 'do', 'double', 'else', 'enum', 'extern',
+    'float', 'for', 'goto', 'if', 'inline', 'int', 'long', 'register', 'return', 'short', 'signed', 'sizeof',
+    'static', 'struct', 'switch', 'typedef', 'union', 'unsigned', 'void', 'volatile', 'while', 'bool', 'true',
+    'false', 'class', 'public', 'private', 'protected', 'virtual', 'template', 'typename', 'namespace', 'using',
+    'new', 'delete', 'this', 'nullptr', 'try', 'catch', 'throw', 'operator', 'friend', 'std', 'NULL',
+    # Java
+    'abstract', 'boolean', 'byte', 'extends', 'final', 'finally', 'implements', 'import', 'instanceof',
+    'interface', 'native', 'package', 'super', 'synchronized', 'throws', 'transient', 'null', 'var',
+}
+
+# 出现在名字前面时说明这不是声明（如 return x、new Foo）
+C_NON_TYPE_WORDS = {
+    'return', 'else', 'case', 'goto', 'new', 'delete', 'throw', 'sizeof', 'typedef', 'using', 'namespace',
+    'package', 'import', 'extends', 'implements', 'instanceof', 'throws', 'operator', 'do', 'public',
+    'private', 'protected',
+}
+
+_C_NAME_RE = re.compile(r'^[A-Za-z_]\w*$')
+
+# 这些标点之后开始一条新的语句或参数，可以跟声明
+_C_STATEMENT_START = {None, ';', '{', '}', '(', ','}
+
+PYTHON_KEEP = set(keyword.kwlist) | set(dir(builtins)) | {'self', 'cls'}
+
+
+def _canonical_name(name, mapping, identifiers):
+    if name not in mapping:
+        mapping[name] = f"v{len(mapping)}"
+        identifiers.append(name)
+    return mapping[name]
+
+
+def _python_bound_names(code):
+    """
+    用语法树找出代码中本地绑定的名字（赋值、参数、def/class、for/with/except 目标），
+    导入的名字不算在内
+
+    Returns:
+        set: 可以规范化的名字
+    """
+    tree = ast.parse(code)
+    bound, imported = set(), set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            bound.add(node.id)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                imported.add(alias.asname or alias.name.split('.')[0])
+    return bound - imported - PYTHON_KEEP
+
+
+def _normalize_python(code):
+    local_names = _python_bound_names(code)
+    tokens = []
+    mapping = {}
+    identifiers = []
+    previous = None
+    for tok in tokenize.generate_tokens(io.StringIO(code).readline):
+        if tok.type in (tokenize.COMMENT, tokenize.NL, tokenize.ENCODING, tokenize.ENDMARKER):
+            continue
+        if tok.type == tokenize.NEWLINE:
+            text = ';'
+        elif tok.type == tokenize.INDENT:
+            text = '{'
+        elif tok.type == tokenize.DEDENT:
+            text = '}'
+        elif tok.type == tokenize.NAME and tok.string in local_names and previous != '.':
+            text = _canonical_name(tok.string, mapping, identifiers)
+        else:
+            text = tok.string
+        tokens.append(text)
+        previous = tok.string
+    return tokens, identifiers
+
+
+def _is_type_token(text, before):
+    """text 是否可能是类型名（关键字或普通名字，且不是成员访问 a.b 中的 b）"""
+    if text is None or text in C_NON_TYPE_WORDS or before in ('.', '->'):
+        return False
+    return text in C_FAMILY_KEYWORDS or bool(_C_NAME_RE.match(text))
+
+
+def _c_declared_names(tokens):
+    """
+    粗略找出 C/C++/Java 代码中声明的名字：紧跟在类型名（关键字或其它名字）之后的名字，
+    如 int x、Node *p、Scanner sc、int f(...)，以及同一条声明中逗号后面的名字（int a, b）
+
+    Args:
+        tokens (list): [(kind, text)]，不含换行
+
+    Returns:
+        set: 可以规范化的名字
+    """
+    declared = set()
+    before = [None, None, None]  # 最近的三个 token（最近的在最后）
+    decl_depth = None  # 正在进行的声明语句所在的括号深度
+    depth = 0
+    for kind, text in tokens:
+        prev, prev2, prev3 = before[-1], before[-2], before[-3]
+        if kind == 'ident' and text not in C_FAMILY_KEYWORDS:
+            if _is_type_token(prev, prev2):
+                declared.add(text)
+                decl_depth = depth
+            elif prev in ('*', '&') and _is_type_token(prev2, prev3) and (
+                    prev3 in _C_STATEMENT_START or prev3 in C_FAMILY_KEYWORDS):
+                declared.add(text)
+                decl_depth = depth
+            elif decl_depth == depth and (prev == ',' or (prev in ('*', '&') and prev2 == ',')):
+                declared.add(text)
+        if text in ('(', '[', '{'):
+            depth += 1
+        elif text in (')', ']', '}'):
+            depth = max(depth - 1, 0)
+        if text in (';', '{', '}') or (decl_depth is not None and depth < decl_depth):
+            decl_depth = None
+        before = before[1:] + [text]
+    return declared
+
+
+def _normalize_c_family(code):
+    raw = [(kind, text) for kind, text in tokenize_c_family(code) if kind != 'newline']
+    local_names = _c_declared_names(raw)
+    tokens = []
+    mapping = {}
+    identifiers = []
+    previous = None
+    for kind, text in raw:
+        if kind == 'preproc':
+            text = re.sub(r'\s+', ' ', text.strip())
+        elif kind == 'ident' and text in local_names and previous not in ('.', '->', '::'):
+            text = _canonical_name(text, mapping, identifiers)
+        tokens.append(text)
+        previous = text
+    return tokens, identifiers
+
+
+def normalize_code(code, language='python'):
+    """
+    生成规范化 token 序列
+
+    Args:
+        code (str): 源代码
+        language (str): 编程语言
+
+    Returns:
+        tuple: (token 列表, 按出现顺序的原始标识符列表)
+    """
+    if (language or '').lower() in ('python', 'py', 'python3'):
+        try:
+            return _normalize_python(code)
+        except (tokenize.TokenError, IndentationError, SyntaxError, ValueError):
+            pass  # 代码不完整时按 C 系规则做粗略切分
+    return _normalize_c_family(code)
+
+
+def code_fingerprint(code, language='python'):
+    """
+    计算代码指纹
+
+    Returns:
+        tuple: (指纹, 原始标识符列表)
+    """
+    tokens, identifiers = normalize_code(code or '', language)
+    payload = f"{(language or '').lower()}\x00" + ' '.join(tokens)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest(), identifiers
+
+
+def rename_identifiers(text, cached_identifiers, current_identifiers):
+    """
+    把缓存结果中原提问者的变量名替换为当前代码中对应位置的变量名
+
+    Args:
+        text (str): 缓存的解释文本
+        cached_identifiers (list): 缓存时代码的标识符（按出现顺序）
+        current_identifiers (list): 当前代码的标识符（按出现顺序）
+
+    Returns:
+        str: 替换后的文本
+    """
+    mapping = {
+        old: new for old, new in zip(cached_identifiers or [], current_identifiers or [])
+        if old != new
+    }
+    if not mapping or not text:
+        return text
+    # 只以ASCII字符判断边界，中文紧挨变量名时也能替换
+    pattern = re.compile(r'(?<![A-Za-z0-9_])(' + '|'.join(
+        re.escape(name) for name in sorted(mapping, key=len, reverse=True)
+    ) + r')(?![A-Za-z0-9_])')
+    return pattern.sub(lambda m: mapping[m.group(1)], text)
+
+
+def normalize_question(text):
+    """问题文本归一化：全角转半角、大小写折叠、压缩空白，保留运算符和标点（i++ 与 i-- 是不同的问题）"""
+    text = unicodedata.normalize('NFKC', str(text or '')).casefold()
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def explanation_cache_key(code, language, question=None):
+    """
+    缓存键：代码指纹，programming_help 还需叠加归一化后的问题
+
+    Returns:
+        tuple: (指纹, 原始标识符列表)
+    """
+    fingerprint, identifiers = code_fingerprint(code, language)
+    if question:
+        fingerprint = hashlib.sha256(
+            f"{fingerprint}\x00{normalize_question(question)}".encode('utf-8')
+        ).hexdigest()
+    return fingerprint, identifiers
+
+
+def find_cached_explanation(feature, fingerprint, level, identifiers):
+    """
+    查询缓存，命中时累加命中次数并把变量名换成当前代码中的名字
+
+    Returns:
+        str or None: 缓存的回答
+    """
+    from models import db, CodeExplanationCache
+
+    entry = CodeExplanationCache.query.filter_by(feature=feature, fingerprint=fingerprint, level=level).first()
+    if entry is None:
+        return None
+    CodeExplanationCache.query.filter_by(id=entry.id).update(
+        {CodeExplanationCache.hit_count: CodeExplanationCache.hit_count + 1}, synchronize_session=False
+    )
+    db.session.commit()
+    return rename_identifiers(entry.response, entry.identifiers, identifiers)
+
+
+def save_cached_explanation(feature, fingerprint, level, language, identifiers, response):
+    """保存回答到缓存，并发写入同一键时忽略后写入者"""
+    from sqlalchemy.exc import IntegrityError
+    from models import db, CodeExplanationCache
+
+    db.session.add(CodeExplanationCache(
+        feature=feature,
+        fingerprint=fingerprint,
+        level=level,
+        language=language,
+        identifiers=identifiers,
+        response=response
+    ))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
@@ -0,0 +1,537 @@
+"""
+代码静态分析预处理模块
+在把学生代码送入批改提示词之前，提取结构、函数列表、复杂度和常见问题，
+并去掉注释、空行等样板内容，生成精简表示以减少Token消耗
+Python 使用 ast 分析，C/C++/Java 使用轻量级词法分析
+"""
+
+import ast
+import os
+import re
+
+CODE_EXTENSIONS = ('.py', '.c', '.cpp', '.cc', '.h', '.hpp', '.java')
+
+# 精简后单个文件保留的最大字符数，超出时只保留函数签名和部分函数体
+DEFAULT_MAX_CHARS_PER_FILE = 6000
+
+# 函数过长/过复杂的阈值
+LONG_FUNCTION_LINES = 60
+HIGH_COMPLEXITY = 10
+
+# C系语言中增加圈复杂度的关键字和运算符
+C_BRANCH_KEYWORDS = {'if', 'for', 'while', 'case', 'catch'}
+C_BRANCH_OPERATORS = {'&&', '||', '?'}
+C_CONTROL_KEYWORDS = {'if', 'for', 'while', 'switch', 'catch', 'return', 'sizeof', 'else', 'do', 'new'}
+
+_C_TOKEN_RE = re.compile(
+    r'''
+    (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+  | (?P<preproc>^[ \t]*\#[^\n]*)
+  | (?P<ident>[A-Za-z_]\w*)
+  | (?P<number>\d[\w.]*)
+  | (?P<op>&&|\|\||==|!=|<=|>=|->|\+\+|--|::|[{}()\[\];,?:<>=+\-*/%&|!^~.])
+  | (?P<newline>\n)
+  | (?P<space>[ \t\r]+)
+    ''',
+    re.VERBOSE | re.DOTALL | re.MULTILINE
+)
+
+
+def estimate_tokens(text):
+    """
+    粗略估算Token数：中文按每字1个，其余按每4个字符1个
+
+    Args:
+        text (str): 文本
+
+    Returns:
+        int: 估算的Token数
+    """
+    if not text:
+        return 0
+    cjk = len(re.findall(r'[一-鿿]', text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def is_code_file(filename):
+    """判断是否为可分析的源代码文件"""
+    return filename.lower().endswith(CODE_EXTENSIONS)
+
+
+# ==================== Python ====================
+
+class _PythonComplexityVisitor(ast.NodeVisitor):
+    """统计函数的圈复杂度（分支数 + 1）"""
+
+    def __init__(self):
+        self.complexity = 1
+
+    def generic_visit(self, node):
+        if isinstance(node, (ast.If, ast.For, ast.While, ast.AsyncFor, ast.IfExp,
+                             ast.ExceptHandler, ast.With, ast.AsyncWith, ast.Assert)):
+            self.complexity += 1
+        elif isinstance(node, ast.BoolOp):
+            self.complexity += len(node.values) - 1
+        elif isinstance(node, ast.comprehension):
+            self.complexity += 1 + len(node.ifs)
+        super().generic_visit(node)
+
+    def visit_FunctionDef(self, node):
+        # 嵌套函数单独统计
+        if node is not self._root:
+            return
+        self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def measure(self, node):
+        self._root = node
+        self.visit(node)
+        return self.complexity
+
+
+def _strip_docstrings(tree):
+    """删除模块、类、函数的文档字符串"""
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            body = node.body
+            if body and isinstance(body[0], ast.Expr) and isinstance(getattr(body[0], 'value', None), ast.Constant) \
+                    and isinstance(body[0].value.value, str):
+                node.body = body[1:] or [ast.Pass()]
+    return tree
+
+
+def _python_lint(tree):
+    """常见问题检查"""
+    findings = []
+    imported = {}
+    used_names = set()
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                imported[(alias.asname or alias.name).split('.')[0]] = node.lineno
+        elif isinstance(node, ast.ImportFrom):
+            for alias in node.names:
+                if alias.name == '*':
+                    findings.append(f"第{node.lineno}行: 使用了 from {node.module} import *")
+                else:
+                    imported[alias.asname or alias.name] = node.lineno
+        elif isinstance(node, ast.Name):
+            used_names.add(node.id)
+        elif isinstance(node, ast.Attribute):
+            root = node
+            while isinstance(root, ast.Attribute):
+                root = root.value
+            if isinstance(root, ast.Name):
+                used_names.add(root.id)
+        elif isinstance(node, ast.ExceptHandler) and node.type is None:
+            findings.append(f"第{node.lineno}行: 使用了裸 except")
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            for default in node.args.defaults + node.args.kw_defaults:
+                if isinstance(default, (ast.List, ast.Dict, ast.Set)):
+                    findings.append(f"第{node.lineno}行: 函数 {node.name} 使用了可变默认参数")
+                    break
+        elif isinstance(node, ast.Compare):
+            for op, comparator in zip(node.ops, node.comparators):
+                if isinstance(op, (ast.Eq, ast.NotEq)) and isinstance(comparator, ast.Constant) \
+                        and comparator.value is None:
+                    findings.append(f"第{node.lineno}行: 与 None 比较应使用 is / is not")
+
+    for name, lineno in imported.items():
+        if name not in used_names:
+            findings.append(f"第{lineno}行: 导入的 {name} 未被使用")
+
+    return findings
+
+
+def summarize_python(source):
+    """
+    分析Python源代码
+
+    Args:
+        source (str): 源代码
+
+    Returns:
+        dict: {language, lines, imports, classes, functions, findings, condensed, syntax_error}
+    """
+    summary = {
+        'language': 'python',
+        'lines': source.count('\n') + 1,
+        'imports': [],
+        'classes': [],
+        'functions': [],
+        'findings': [],
+        'condensed': None,
+        'syntax_error': None,
+    }
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as e:
+        summary['syntax_error'] = f"第{e.lineno}行: {e.msg}"
+        summary['condensed'] = strip_python_comments(source)
+        return summary
+
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            summary['imports'].extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            summary['imports'].append(node.module or '.')
+        elif isinstance(node, ast.ClassDef):
+            methods = [n.name for n in node.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+            summary['classes'].append({'name': node.name, 'methods': methods})
+
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            length = (getattr(node, 'end_lineno', node.lineno) or node.lineno) - node.lineno + 1
+            complexity = _PythonComplexityVisitor().measure(node)
+            summary['functions'].append({
+                'name': node.name,
+                'args': [a.arg for a in node.args.args],
+                'line': node.lineno,
+                'length': length,
+                'complexity': complexity,
+                'has_docstring': ast.get_docstring(node) is not None,
+            })
+            if length > LONG_FUNCTION_LINES:
+                summary['findings'].append(f"第{node.lineno}行: 函数 {node.name} 过长（{length}行）")
+            if complexity > HIGH_COMPLEXITY:
+                summary['findings'].append(f"第{node.lineno}行: 函数 {node.name} 圈复杂度较高（{complexity}）")
+
+    summary['findings'].extend(_python_lint(tree))
+
+    # ast.unparse 会丢弃注释并统一格式，再去掉文档字符串
+    try:
+        summary['condensed'] = ast.unparse(_strip_docstrings(tree))
+    except Exception:
+        summary['condensed'] = strip_python_comments(source)
+    return summary
+
+
+def strip_python_comments(source):
+    """无法解析时的退化处理：去掉整行注释和多余空行"""
+    lines = [line.rstrip() for line in source.splitlines() if not line.strip().startswith('#')]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+
+# ==================== C / C++ / Java ====================
+
+def tokenize_c_family(source):
+    """
+    轻量级词法分析，返回 (类型, 文本) 列表，不含注释和空白
+
+    Args:
+        source (str): 源代码
+
+    Returns:
+        list: [(kind, text)]
+    """
+    tokens = []
+    for match in _C_TOKEN_RE.finditer(source):
+        kind = match.lastgroup
+        if kind == 'space':
+            continue
+        if kind == 'comment':
+            # 保留块注释中的换行，保证行号准确
+            tokens.extend(('newline', '\n') for _ in range(match.group().count('\n')))
+            continue
+        tokens.append((kind, match.group()))
+    return tokens
+
+
+def strip_c_comments(source):
+    """去掉注释并压缩空行，保留字符串字面量"""
+    parts = []
+    for match in _C_TOKEN_RE.finditer(source):
+        kind = match.lastgroup
+        if kind == 'comment':
+            # 块注释内的换行保留一个，避免把两行代码拼在一起
+            parts.append('\n' if '\n' in match.group() else ' ')
+        else:
+            parts.append(match.group())
+    text = ''.join(parts)
+    lines = [line.rstrip() for line in text.splitlines()]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+
+def summarize_c_family(source, language):
+    """
+    分析C/C++/Java源代码
+
+    Args:
+        source (str): 源代码
+        language (str): c / cpp / java
+
+    Returns:
+        dict: 与 summarize_python 相同结构
+    """
+    summary = {
+        'language': language,
+        'lines': source.count('\n') + 1,
+        'imports': [],
+        'classes': [],
+        'functions': [],
+        'findings': [],
+        'condensed': strip_c_comments(source),
+        'syntax_error': None,
+    }
+
+    tokens = tokenize_c_family(source)
+    depth = 0
+    current = None  # 正在统计的函数
+    line_no = 1  # 按换行token累计行号
+    prev_tokens = []
+    pending_import = None
+
+    for kind, text in tokens:
+        if kind == 'newline':
+            line_no += 1
+            continue
+        if kind == 'preproc':
+            directive = text.strip()
+            if directive.startswith('#include'):
+                summary['imports'].append(directive[len('#include'):].strip())
+            continue
+
+        # Java 的 import 语句：收集到分号为止
+        if pending_import is not None:
+            if text == ';':
+                summary['imports'].append(''.join(pending_import))
+                pending_import = None
+            else:
+                pending_import.append(text)
+            continue
+        if kind == 'ident' and language == 'java' and text == 'import' and depth == 0:
+            pending_import = []
+            continue
+
+        if kind == 'ident' and text in ('class', 'struct', 'interface', 'enum') and depth <= 1:
+            summary['classes'].append({'name': None, 'methods': []})
+
+        if kind == 'ident' and summary['classes'] and summary['classes'][-1]['name'] is None \
+                and prev_tokens and prev_tokens[-1][1] in ('class', 'struct', 'interface', 'enum'):
+            summary['classes'][-1]['name'] = text
+
+        if kind == 'op' and text == '{':
+            # 形如 name(...) {  且 name 不是控制关键字时视为函数定义
+            if current is None and prev_tokens and prev_tokens[-1][1] in (')', 'const', 'override', 'noexcept') \
+                    or (current is None and len(prev_tokens) >= 2 and prev_tokens[-2][1] == 'throws'):
+                name = _function_name_before(prev_tokens)
+                if name and name not in C_CONTROL_KEYWORDS:
+                    current = {
+                        'name': name,
+                        'args': [],
+                        'line': line_no,
+                        'length': 0,
+                        'complexity': 1,
+                        'has_docstring': False,
+                        '_depth': depth,
+                    }
+            depth += 1
+        elif kind == 'op' and text == '}':
+            depth = max(0, depth - 1)
+            if current is not None and depth == current['_depth']:
+                current['length'] = line_no - current['line'] + 1
+                del current['_depth']
+                summary['functions'].append(current)
+                if summary['classes'] and depth >= 1:
+                    summary['classes'][-1]['methods'].append(current['name'])
+                if current['length'] > LONG_FUNCTION_LINES:
+                    summary['findings'].append(f"第{current['line']}行: 函数 {current['name']} 过长（{current['length']}行）")
+                if current['complexity'] > HIGH_COMPLEXITY:
+                    summary['findings'].append(
+                        f"第{current['line']}行: 函数 {current['name']} 圈复杂度较高（{current['complexity']}）")
+                current = None
+        elif current is not None:
+            if (kind == 'ident' and text in C_BRANCH_KEYWORDS) or (kind == 'op' and text in C_BRANCH_OPERATORS):
+                current['complexity'] += 1
+
+        if kind == 'ident' and text == 'gets':
+            summary['findings'].append(f"第{line_no}行: 使用了不安全的 gets()")
+        elif kind == 'ident' and text == 'goto':
+            summary['findings'].append(f"第{line_no}行: 使用了 goto")
+
+        prev_tokens.append((kind, text))
+        if len(prev_tokens) > 64:
+            prev_tokens = prev_tokens[-64:]
+
+    if depth != 0:
+        summary['findings'].append('花括号不匹配，代码可能无法编译')
+
+    return summary
+
+
+def _function_name_before(prev_tokens):
+    """从 '{' 之前的token中找出函数名（匹配最后一对圆括号之前的标识符）"""
+    depth = 0
+    for i in range(len(prev_tokens) - 1, -1, -1):
+        kind, text = prev_tokens[i]
+        if text == ')':
+            depth += 1
+        elif text == '(':
+            depth -= 1
+            if depth == 0:
+                if i > 0 and prev_tokens[i - 1][0] == 'ident':
+                    return prev_tokens[i - 1][1]
+                return None
+    return None
+
+
+# ==================== 汇总 ====================
+
+def summarize_source(filename, source):
+    """根据文件扩展名选择分析方法"""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.py':
+        return summarize_python(source)
+    if ext == '.java':
+        return summarize_c_family(source, 'java')
+    if ext in ('.cpp', '.cc', '.hpp'):
+        return summarize_c_family(source, 'cpp')
+    return summarize_c_family(source, 'c')
+
+
+_PY_OUTLINE_PREFIXES = ('def ', 'async def ', 'class ', '@')
+_C_CONTAINER_KEYWORDS = {'class', 'struct', 'interface', 'enum', 'union', 'namespace', 'extern'}
+
+
+def _python_outline_flags(lines):
+    """Python：顶层语句、类/函数定义、装饰器行和空行属于大纲，其余为函数/类体"""
+    flags = []
+    for line in lines:
+        stripped = line.lstrip()
+        flags.append(not stripped or stripped == line or stripped.startswith(_PY_OUTLINE_PREFIXES))
+    return flags
+
+
+def _c_outline_flags(lines):
+    """
+    C系语言：按花括号层级判断，只在类/结构体/命名空间内（或顶层）的行属于大纲，
+    函数体开头和结尾的那一行（签名行、右花括号）也保留
+    """
+    flags = []
+    stack = []  # 每层花括号是否为容器（类/命名空间等）
+    header = []  # 当前语句已出现的标识符
+    for line in lines:
+        outline_at_start = all(stack)
+        for match in _C_TOKEN_RE.finditer(line):
+            kind, text = match.lastgroup, match.group()
+            if kind == 'ident':
+                header.append(text)
+            elif text == '{':
+                stack.append(bool(_C_CONTAINER_KEYWORDS.intersection(header)))
+                header = []
+            elif text == '}':
+                if stack:
+                    stack.pop()
+                header = []
+            elif text == ';':
+                header = []
+        flags.append(outline_at_start or all(stack))
+    return flags
+
+
+def _render_outline(lines, flags, keep):
+    """每段函数体只保留前 keep 行，其余替换为省略标记"""
+    result = []
+    i = 0
+    while i < len(lines):
+        if flags[i]:
+            result.append(lines[i])
+            i += 1
+            continue
+        end = i
+        while end < len(lines) and not flags[end]:
+            end += 1
+        if end - i <= keep:
+            result.extend(lines[i:end])
+        else:
+            result.extend(lines[i:i + keep])
+            omitted = lines[i + keep]
+            indent = omitted[:len(omitted) - len(omitted.lstrip())]
+            result.append(f"{indent}... (省略{end - i - keep}行)")
+        i = end
+    return '\n'.join(result)
+
+
+def _truncate_condensed(condensed, max_chars, language='python'):
+    """
+    精简代码仍然过长时，保留全部签名/大纲行，按相同行数截断每个函数体，
+    取能放进 max_chars 的最大保留行数；只剩大纲仍超长时也不再删减签名
+    """
+    if len(condensed) <= max_chars:
+        return condensed
+    lines = condensed.split('\n')
+    flags = _python_outline_flags(lines) if language == 'python' else _c_outline_flags(lines)
+    low, high = 0, len(lines)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if len(_render_outline(lines, flags, mid)) <= max_chars:
+            low = mid
+        else:
+            high = mid - 1
+    return _render_outline(lines, flags, low)
+
+
+def format_summary(filename, summary, max_chars=DEFAULT_MAX_CHARS_PER_FILE):
+    """
+    生成用于提示词的精简文本
+
+    Args:
+        filename (str): 文件名
+        summary (dict): summarize_source 的返回值
+        max_chars (int): 精简代码最多保留的字符数
+
+    Returns:
+        str: 精简表示
+    """
+    lines = [f"文件: {filename}（{summary['language']}，{summary['lines']}行）"]
+    if summary['syntax_error']:
+        lines.append(f"语法错误: {summary['syntax_error']}")
+    if summary['imports']:
+        lines.append(f"依赖: {', '.join(summary['imports'][:20])}")
+    if summary['classes']:
+        lines.append('类: ' + '; '.join(
+            f"{c['name']}({', '.join(c['methods'][:10])})" for c in summary['classes'] if c['name']
+        ))
+    if summary['functions']:
+        lines.append('函数:')
+        for func in summary['functions'][:40]:
+            lines.append(f"  - {func['name']} 第{func['line']}行 {func['length']}行 复杂度{func['complexity']}")
+    if summary['findings']:
+        lines.append('静态检查:')
+        lines.extend(f"  - {f}" for f in summary['findings'][:20])
+    lines.append('精简代码（已去除注释/空行/文档字符串）:')
+    lines.append(_truncate_condensed(summary['condensed'] or '', max_chars, summary['language']))
+    return '\n'.join(lines)
+
+
+def build_condensed_submission(file_contents, max_chars_per_file=DEFAULT_MAX_CHARS_PER_FILE):
+    """
+    把一次提交的所有文件转换为提示词文本，代码文件走静态分析，其它文件原样保留
+
+    Args:
+        file_contents (dict): {文件名: 内容}
+        max_chars_per_file (int): 单文件精简代码最大长度
+
+    Returns:
+        tuple: (提示词文本, 统计信息 {original_tokens, condensed_tokens})
+    """
+    parts = []
+    original_tokens = 0
+    for filename, content in file_contents.items():
+        original_tokens += estimate_tokens(f"文件: {filename}\n\n{content}\n\n---\n\n")
+        original = f"文件: {filename}\n\n{content}"
+        if is_code_file(filename):
+            try:
+                condensed = format_summary(filename, summarize_source(filename, content), max_chars_per_file)
+                # 很短的文件加上摘要反而更长，此时保留原文
+                if len(condensed) < len(original):
+                    parts.append(condensed)
+                    continue
+            except Exception:
+                pass  # 分析失败时退回原文
+        parts.append(original)
+    text = '\n\n---\n\n'.join(parts) + '\n\n---\n\n'
+    return text, {'original_tokens': original_tokens, 'condensed_tokens': estimate_tokens(text)}
@@ -0,0 +1,266 @@
+"""
+功能权益目录模块
+各会员等级的功能开关和每日次数上限保存在 feature_entitlements 表中，后台系统设置可直接修改，无需重新部署。
+读取时编译为内存中的查找表：功能代码对应数组下标，每个会员等级一组 (开关, 上限) 数组，
+配额检查只做一次下标取值。修改时 entitlement_catalog_versions 中的版本号加一，
+各进程每隔几秒比较一次版本号，发生变化时重新加载（热更新，不需要重启）。
+数据库中还没有权益数据时使用 DEFAULT_FEATURE_PERMISSIONS
+"""
+
+import threading
+import time
+
+# 各进程检查版本号的间隔（秒）：其它进程的修改最多延迟这么久生效
+VERSION_CHECK_SECONDS = 5
+
+# 默认权益（数据库中没有数据时使用，也是后台首次保存前展示的内容）
+DEFAULT_FEATURE_PERMISSIONS = {
+    'ai_ask': {
+        'name': 'AI答疑',
+        'free': {'enabled': True, 'limit': 10},
+        'weekly': {'enabled': True, 'limit': 50},
+        'monthly': {'enabled': True, 'limit': 200},
+        'yearly': {'enabled': True, 'limit': -1}  # -1 表示无限制
+    },
+    'question_gen': {
+        'name': '智能出题',
+        'free': {'enabled': True, 'limit': 3},
+        'weekly': {'enabled': True, 'limit': 15},
+        'monthly': {'enabled': True, 'limit': 50},
+        'yearly': {'enabled': True, 'limit': -1}
+    },
+    'lecture_gen': {
+        'name': '智能讲义',
+        'free': {'enabled': True, 'limit': 2},
+        'weekly': {'enabled': True, 'limit': 10},
+        'monthly': {'enabled': True, 'limit': 30},
+        'yearly': {'enabled': True, 'limit': -1}
+    },
+    'programming_help': {
+        'name': '辅助编程',
+        'free': {'enabled': True, 'limit': 5},
+        'weekly': {'enabled': True, 'limit': 25},
+        'monthly': {'enabled': True, 'limit': 100},
+        'yearly': {'enabled': True, 'limit': -1}
+    },
+    'code_review': {
+        'name': '代码审查',
+        'free': {'enabled': True, 'limit': 3},
+        'weekly': {'enabled': True, 'limit': 15},
+        'monthly': {'enabled': True, 'limit': 60},
+        'yearly': {'enabled': True, 'limit': -1}
+    },
+    'code_explain': {
+        'name': '代码解释',
+        'free': {'enabled': True, 'limit': 5},
+        'weekly': {'enabled': True, 'limit': 25},
+        'monthly': {'enabled': True, 'limit': 100},
+        'yearly': {'enabled': True, 'limit': -1}
+    },
+    'debug_help': {
+        'name': '调试帮助',
+        'free': {'enabled': True, 'limit': 5},
+        'weekly': {'enabled': True, 'limit': 25},
+        'monthly': {'enabled': True, 'limit': 100},
+        'yearly': {'enabled': True, 'limit': -1}
+    },
+    'video_summary': {
+        'name': '视频总结',
+        'free': {'enabled': True, 'limit': 3},
+        'weekly': {'enabled': True, 'limit': 15},
+        'monthly': {'enabled': True, 'limit': 50},
+        'yearly': {'enabled': True, 'limit': -1}
+    },
+    'generate_lecture': {
+        'name': '智能讲义生成',
+        'free': {'enabled': True, 'limit': 2},
+        'weekly': {'enabled': True, 'limit': 10},
+        'monthly': {'enabled': True, 'limit': 30},
+        'yearly': {'enabled': True, 'limit': -1}
+    },
+    'generate_question': {
+        'name': '智能出题生成',
+        'free': {'enabled': True, 'limit': 3},
+        'weekly': {'enabled': True, 'limit': 15},
+        'monthly': {'enabled': True, 'limit': 50},
+        'yearly': {'enabled': True, 'limit': -1}
+    }
+}
+
+DEFAULT_TIER = 'free'
+
+_state = {'catalog': None, 'checked_at': 0.0}
+_lock = threading.Lock()
+
+
+class EntitlementCatalog:
+    """编译后的权益查找表（只读）"""
+
+    def __init__(self, version, permissions):
+        """
+        Args:
+            version (int): 版本号，0 表示使用默认权益
+            permissions (dict): 与 DEFAULT_FEATURE_PERMISSIONS 结构相同
+        """
+        self.version = version
+        self.feature_codes = tuple(permissions)
+        self.feature_names = tuple(permissions[code].get('name', code) for code in self.feature_codes)
+        self.index = {code: i for i, code in enumerate(self.feature_codes)}
+
+        tier_codes = {DEFAULT_TIER}
+        for info in permissions.values():
+            tier_codes.update(k for k in info if k != 'name')
+
+        self.tiers = {}
+        for tier_code in tier_codes:
+            enabled, limits = [], []
+            for code in self.feature_codes:
+                info = permissions[code]
+                rule = info.get(tier_code) or info.get(DEFAULT_TIER) or {'enabled': False, 'limit': 0}
+                enabled.append(bool(rule.get('enabled', True)))
+                limits.append(int(rule.get('limit', 0)))
+            self.tiers[tier_code] = (tuple(enabled), tuple(limits))
+
+    def lookup(self, tier_code, feature_code):
+        """
+        Returns:
+            tuple: (是否启用, 每日上限)，未知功能返回 None；未配置的会员等级按免费用户处理
+        """
+        i = self.index.get(feature_code)
+        if i is None:
+            return None
+        enabled, limits = self.tiers.get(tier_code) or self.tiers[DEFAULT_TIER]
+        return enabled[i], limits[i]
+
+    def name(self, feature_code):
+        i = self.index.get(feature_code)
+        return self.feature_names[i] if i is not None else feature_code
+
+    def features(self):
+        """[(功能代码, 功能名称)]，按配置顺序"""
+        return list(zip(self.feature_codes, self.feature_names))
+
+    def to_dict(self):
+        """转回 DEFAULT_FEATURE_PERMISSIONS 的结构（后台展示用）"""
+        result = {}
+        for i, code in enumerate(self.feature_codes):
+            item = {'name': self.feature_names[i]}
+            for tier_code, (enabled, limits) in sorted(self.tiers.items()):
+                item[tier_code] = {'enabled': enabled[i], 'limit': limits[i]}
+            result[code] = item
+        return result
+
+
+def _current_version():
+    from models import db
+    from models_membership import EntitlementCatalogVersion
+
+    return db.session.query(EntitlementCatalogVersion.version).filter_by(id=1).scalar() or 0
+
+
+def _load(version):
+    from models_membership import FeatureEntitlement
+
+    rows = FeatureEntitlement.query.order_by(FeatureEntitlement.sort_order, FeatureEntitlement.id).all()
+    if not rows:
+        return EntitlementCatalog(version, DEFAULT_FEATURE_PERMISSIONS)
+    permissions = {}
+    for row in rows:
+        item = permissions.setdefault(row.feature_code, {'name': row.feature_name})
+        item[row.tier_code] = {'enabled': row.enabled, 'limit': row.daily_limit}
+    return EntitlementCatalog(version, permissions)
+
+
+def get_entitlements():
+    """读取编译后的权益目录；距上次检查超过 VERSION_CHECK_SECONDS 时比较版本号，变化时重新加载"""
+    now = time.monotonic()
+    with _lock:
+        catalog, checked_at = _state['catalog'], _state['checked_at']
+    if catalog is not None and now - checked_at < VERSION_CHECK_SECONDS:
+        return catalog
+
+    version = _current_version()
+    if catalog is None or catalog.version != version:
+        catalog = _load(version)
+    with _lock:
+        _state['catalog'] = catalog
+        _state['checked_at'] = now
+    return catalog
+
+
+def validate_permissions(permissions):
+    """
+    校验后台提交的权益配置：当前目录中的功能都必须保留（接口仍按功能代码做配额检查，
+    缺少配置会导致所有用户无法使用该功能），enabled 必须是布尔值
+
+    Returns:
+        str or None: 错误信息
+    """
+    if not isinstance(permissions, dict) or not permissions:
+        return '权益配置不能为空'
+    missing = [code for code in get_entitlements().feature_codes if code not in permissions]
+    if missing:
+        return f'缺少功能的配置: {", ".join(missing)}'
+    for code, info in permissions.items():
+        if not isinstance(info, dict):
+            return f'{code} 的配置格式不正确'
+        if DEFAULT_TIER not in info:
+            return f'{code} 缺少免费用户的配置'
+        for tier_code, rule in info.items():
+            if tier_code == 'name':
+                continue
+            if not isinstance(rule, dict):
+                return f'{code}.{tier_code} 的配置格式不正确'
+            if not isinstance(rule.get('enabled', True), bool):
+                return f'{code}.{tier_code} 的开关必须是 true 或 false'
+            if isinstance(rule.get('limit'), bool):
+                return f'{code}.{tier_code} 的次数上限必须是整数'
+            try:
+                limit = int(rule.get('limit', 0))
+            except (TypeError, ValueError):
+                return f'{code}.{tier_code} 的次数上限必须是整数'
+            if limit < -1:
+                return f'{code}.{tier_code} 的次数上限不能小于 -1'
+    return None
+
+
+def save_entitlements(permissions, admin_id=None):
+    """
+    用后台提交的配置整体替换权益表，版本号加一并立即在本进程生效（调用前请先 validate_permissions）
+
+    Returns:
+        EntitlementCatalog: 新的权益目录
+    """
+    from models import db
+    from models_membership import FeatureEntitlement, EntitlementCatalogVersion
+
+    FeatureEntitlement.query.delete(synchronize_session=False)
+    for sort_order, (code, info) in enumerate(permissions.items()):
+        for tier_code, rule in info.items():
+            if tier_code == 'name':
+                continue
+            db.session.add(FeatureEntitlement(
+                feature_code=code,
+                feature_name=info.get('name') or code,
+                tier_code=tier_code,
+                enabled=bool(rule.get('enabled', True)),
+                daily_limit=int(rule.get('limit', 0)),
+                sort_order=sort_order
+            ))
+
+    bumped = EntitlementCatalogVersion.query.filter_by(id=1).update({
+        EntitlementCatalogVersion.version: EntitlementCatalogVersion.version + 1,
+        EntitlementCatalogVersion.updated_by: admin_id
+    }, synchronize_session=False)
+    if not bumped:
+        db.session.add(EntitlementCatalogVersion(id=1, version=1, updated_by=admin_id))
+    db.session.commit()
+
+    reload_entitlements()
+    return get_entitlements()
+
+
+def reload_entitlements():
+    """下次读取时立即检查版本号"""
+    with _lock:
+        _state['checked_at'] = 0.0
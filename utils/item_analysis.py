@@ -0,0 +1,263 @@
+"""
+题目项目分析模块
+按经典测量理论计算每道题的难度（p值）、点二列相关区分度和选择题干扰项分析。
+每次交卷视为一次测验，作答者的"总分"取本次交卷中其余题目的得分率（校正后的总分，不含本题，
+避免本题自身抬高相关系数）；只有一道题的交卷没有校正总分，只计入难度。
+统计量以累计和的形式保存在 question_item_stats 表中，随答题增量更新，查询时直接读取
+"""
+
+import json
+import math
+from datetime import timedelta
+
+from utils.answer_matching import extract_option_letters
+
+# 样本太少时指标没有参考意义
+MIN_ATTEMPTS_FOR_DISCRIMINATION = 5
+
+# 没有交卷ID的旧记录：同一学生相邻两条记录间隔不超过该值时视为同一次交卷
+LEGACY_ATTEMPT_GAP = timedelta(seconds=60)
+
+
+def option_key(question, answer_text):
+    """选择题返回学生所选选项（如 'A'、'AC'），其它题型返回 None"""
+    if question.question_type != 'choice':
+        return None
+    letters = extract_option_letters(answer_text)
+    return ''.join(sorted(letters)) if letters else '其他'
+
+
+def compute_point_biserial(attempts, correct_count, total_sum, total_sq_sum, correct_total_sum):
+    """
+    由累计量计算点二列相关系数
+
+    Args:
+        attempts (int): 作答人次
+        correct_count (int): 答对人次
+        total_sum (float): 所有作答者总分之和
+        total_sq_sum (float): 所有作答者总分平方和
+        correct_total_sum (float): 答对者总分之和
+
+    Returns:
+        float or None: 相关系数，样本不足或方差为0时返回 None
+    """
+    if attempts < MIN_ATTEMPTS_FOR_DISCRIMINATION or correct_count in (0, attempts):
+        return None
+    mean = total_sum / attempts
+    variance = total_sq_sum / attempts - mean * mean
+    if variance <= 1e-12:
+        return None
+    p = correct_count / attempts
+    mean_correct = correct_total_sum / correct_count
+    mean_wrong = (total_sum - correct_total_sum) / (attempts - correct_count)
+    return (mean_correct - mean_wrong) / math.sqrt(variance) * math.sqrt(p * (1 - p))
+
+
+def _refresh_derived(stats):
+    stats.p_value = stats.correct_count / stats.attempts if stats.attempts else None
+    stats.point_biserial = compute_point_biserial(
+        stats.scored_attempts, stats.scored_correct_count, stats.total_score_sum,
+        stats.total_score_sq_sum, stats.correct_total_score_sum
+    )
+
+
+def _ensure_stats_rows(question_ids):
+    """
+    为还没有汇总行的题目插入空行（INSERT ... ON CONFLICT DO NOTHING），
+    两份交卷同时首次作答同一道题时不会因唯一约束失败
+    """
+    from sqlalchemy.exc import IntegrityError
+    from models import db, QuestionItemStats
+
+    existing = {
+        row.question_id for row in QuestionItemStats.query.with_entities(QuestionItemStats.question_id)
+        .filter(QuestionItemStats.question_id.in_(question_ids))
+    }
+    missing = [question_id for question_id in question_ids if question_id not in existing]
+    if not missing:
+        return
+
+    rows = [
+        {'question_id': question_id, 'attempts': 0, 'correct_count': 0, 'scored_attempts': 0,
+         'scored_correct_count': 0, 'total_score_sum': 0.0, 'total_score_sq_sum': 0.0,
+         'correct_total_score_sum': 0.0}
+        for question_id in missing
+    ]
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        db.session.execute(insert(QuestionItemStats).values(rows).on_conflict_do_nothing(
+            index_elements=['question_id']
+        ))
+        return
+
+    # 其它数据库：逐行插入，冲突时回滚到保存点
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.add(QuestionItemStats(**row))
+        except IntegrityError:
+            pass
+
+
+def update_item_stats(responses):
+    """
+    用一次交卷的作答结果增量更新项目统计（未提交）
+
+    Args:
+        responses (list): [(QuestionBank, 是否正确, 学生答案)]
+    """
+    from models import db, QuestionItemStats
+
+    if not responses:
+        return
+
+    count = len(responses)
+    correct_total = sum(1 for _, is_correct, _ in responses if is_correct)
+    question_ids = sorted({question.question_id for question, _, _ in responses})
+
+    # 先补齐汇总行，再一次查询取出并加行锁（PostgreSQL），避免并发交卷互相覆盖
+    _ensure_stats_rows(question_ids)
+    rows = {
+        stats.question_id: stats
+        for stats in QuestionItemStats.query.filter(
+            QuestionItemStats.question_id.in_(question_ids)
+        ).order_by(QuestionItemStats.question_id).with_for_update().all()
+    }
+
+    for question, is_correct, answer_text in responses:
+        stats = rows[question.question_id]
+        # 校正后的总分：本次交卷中其余题目的得分率
+        rest = (correct_total - (1 if is_correct else 0)) / (count - 1) if count > 1 else None
+
+        stats.attempts += 1
+        if is_correct:
+            stats.correct_count += 1
+        if rest is not None:
+            stats.scored_attempts += 1
+            stats.total_score_sum += rest
+            stats.total_score_sq_sum += rest * rest
+            if is_correct:
+                stats.scored_correct_count += 1
+                stats.correct_total_score_sum += rest
+
+        key = option_key(question, answer_text)
+        if key is not None:
+            options = stats.option_stats_data
+            chosen, score_sum, scored = _option_entry(options.get(key))
+            if rest is not None:
+                score_sum += rest
+                scored += 1
+            options[key] = [chosen + 1, score_sum, scored]
+            stats.option_stats = json.dumps(options, ensure_ascii=False)
+
+        _refresh_derived(stats)
+
+
+def _option_entry(entry):
+    """选项统计 [选择人数, 校正总分之和, 计入总分的人数]，兼容只有前两项的旧数据"""
+    if not entry:
+        return 0, 0.0, 0
+    if len(entry) < 3:
+        return entry[0], entry[1], entry[0]
+    return entry[0], entry[1], entry[2]
+
+
+def classify_item(stats):
+    """根据难度和区分度给出题目质量建议"""
+    if stats.attempts < MIN_ATTEMPTS_FOR_DISCRIMINATION:
+        return '样本不足'
+    if stats.p_value is not None and (stats.p_value > 0.95 or stats.p_value < 0.1):
+        return '过易' if stats.p_value > 0.95 else '过难'
+    if stats.point_biserial is None:
+        return '样本不足'
+    if stats.point_biserial >= 0.3:
+        return '优秀'
+    if stats.point_biserial >= 0.2:
+        return '良好'
+    if stats.point_biserial >= 0:
+        return '需修改'
+    return '建议删除'
+
+
+def distractor_analysis(question, stats):
+    """
+    选择题干扰项分析：各选项的选择比例及选择者平均得分率。
+    好的干扰项应被一定比例的学生选择，且选择者得分率低于正确选项的选择者
+
+    Returns:
+        list: [{option, count, ratio, mean_total_score, is_key}]
+    """
+    options = stats.option_stats_data
+    if not options:
+        return []
+    key_letters = extract_option_letters(question.correct_answer) if question else None
+    key = ''.join(sorted(key_letters)) if key_letters else None
+    result = []
+    for option, entry in sorted(options.items()):
+        count, score_sum, scored = _option_entry(entry)
+        result.append({
+            'option': option,
+            'count': count,
+            'ratio': round(count / stats.attempts, 4) if stats.attempts else 0,
+            'mean_total_score': round(score_sum / scored, 4) if scored else None,
+            'is_key': option == key
+        })
+    return result
+
+
+def item_report(question, stats):
+    """组合单题的完整分析结果"""
+    report = stats.to_dict()
+    report['quality'] = classify_item(stats)
+    if question is not None and question.question_type == 'choice':
+        report['distractors'] = distractor_analysis(question, stats)
+    return report
+
+
+def _same_attempt(previous, submission):
+    """两条相邻的答题记录（已按学生、时间排序）是否属于同一次交卷"""
+    if previous.student_id != submission.student_id:
+        return False
+    if previous.attempt_id or submission.attempt_id:
+        return previous.attempt_id == submission.attempt_id
+    if previous.submission_time is None or submission.submission_time is None:
+        return False
+    return submission.submission_time - previous.submission_time <= LEGACY_ATTEMPT_GAP
+
+
+def rebuild_item_stats():
+    """
+    从全部答题记录重建汇总表（首次上线或修复数据时使用）。
+    按交卷ID分组；没有交卷ID的旧记录按同一学生的相邻提交间隔（LEGACY_ATTEMPT_GAP）分组
+
+    Returns:
+        int: 重建的题目数量
+    """
+    from models import db, QuestionBank, QuestionItemStats, QuestionSubmission
+
+    QuestionItemStats.query.delete()
+    db.session.flush()
+
+    questions = {q.question_id: q for q in QuestionBank.query.all()}
+    previous = None
+    responses = []
+    query = QuestionSubmission.query.order_by(
+        QuestionSubmission.student_id, QuestionSubmission.submission_time, QuestionSubmission.id
+    ).yield_per(1000)
+    for submission in query:
+        if responses and not _same_attempt(previous, submission):
+            update_item_stats(responses)
+            responses = []
+        previous = submission
+        question = questions.get(submission.question_id)
+        if question is not None:
+            responses.append((question, bool(submission.is_correct), submission.answer_text))
+    if responses:
+        update_item_stats(responses)
+
+    db.session.commit()
+    return QuestionItemStats.query.count()
@@ -0,0 +1,141 @@
+"""
+讲义库模块
+同一份课件/视频在相同生成参数下只生成一次讲义，之后直接从库中返回；
+用户可显式要求重新生成，新结果作为新版本保存。
+讲义默认只对创建者可见，创建者显式选择共享后其他用户才能看到和复用
+"""
+
+import hashlib
+import json
+import re
+from urllib.parse import urlsplit, urlunsplit
+
+from sqlalchemy.exc import IntegrityError
+
+CHUNK_SIZE = 64 * 1024
+
+VISIBILITY_SHARED = 'shared'
+VISIBILITY_PRIVATE = 'private'
+
+
+def source_text_hash(text):
+    """课件文本指纹：去掉空白差异后计算 SHA-256"""
+    return hashlib.sha256(re.sub(r'\s+', ' ', text or '').strip().encode('utf-8')).hexdigest()
+
+
+def file_stream_hash(file_storage):
+    """上传文件内容的 SHA-256（读取后把指针移回开头，不影响后续保存）"""
+    digest = hashlib.sha256()
+    stream = file_storage.stream
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def url_hash(url):
+    """视频链接指纹：协议和域名小写，去掉片段和末尾斜杠"""
+    parts = urlsplit((url or '').strip())
+    normalized = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip('/'), parts.query, ''))
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def params_hash(params):
+    """生成参数指纹（键排序后序列化）"""
+    return hashlib.sha256(
+        json.dumps(params or {}, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    ).hexdigest()
+
+
+def _visible_query(kind, source_hash, params, user_id):
+    from models import db, LectureLibraryEntry
+
+    query = LectureLibraryEntry.query.filter_by(
+        kind=kind, source_hash=source_hash, params_hash=params_hash(params)
+    )
+    return query.filter(db.or_(
+        LectureLibraryEntry.visibility == VISIBILITY_SHARED,
+        LectureLibraryEntry.owner_user_id == user_id
+    ))
+
+
+def find_lecture(kind, source_hash, params, user_id):
+    """
+    查找当前用户可见的最新版本讲义，命中时累加命中次数
+
+    Args:
+        kind (str): courseware / video
+        source_hash (str): 材料指纹
+        params (dict): 生成参数
+        user_id (int): 当前用户
+
+    Returns:
+        LectureLibraryEntry or None
+    """
+    from models import db, LectureLibraryEntry
+
+    entry = _visible_query(kind, source_hash, params, user_id).order_by(
+        LectureLibraryEntry.version.desc()
+    ).first()
+    if entry is not None:
+        LectureLibraryEntry.query.filter_by(id=entry.id).update(
+            {LectureLibraryEntry.hit_count: LectureLibraryEntry.hit_count + 1}, synchronize_session=False
+        )
+        db.session.commit()
+    return entry
+
+
+def save_lecture(kind, source_hash, params, content, user_id, source_name=None, content_format='markdown',
+                 visibility=VISIBILITY_PRIVATE):
+    """
+    保存新生成的讲义，版本号在同一材料和参数下递增
+
+    Returns:
+        LectureLibraryEntry: 已提交的记录
+    """
+    from models import db, LectureLibraryEntry
+
+    key = params_hash(params)
+    if visibility not in (VISIBILITY_SHARED, VISIBILITY_PRIVATE):
+        visibility = VISIBILITY_PRIVATE
+
+    # 并发重新生成时版本号可能冲突，重试一次
+    for _ in range(2):
+        latest = db.session.query(db.func.max(LectureLibraryEntry.version)).filter_by(
+            kind=kind, source_hash=source_hash, params_hash=key
+        ).scalar() or 0
+        entry = LectureLibraryEntry(
+            kind=kind,
+            source_hash=source_hash,
+            params_hash=key,
+            params=params,
+            version=latest + 1,
+            source_name=source_name,
+            content=content if isinstance(content, str) else json.dumps(content, ensure_ascii=False),
+            content_format=content_format,
+            owner_user_id=user_id,
+            visibility=visibility
+        )
+        db.session.add(entry)
+        try:
+            db.session.commit()
+            return entry
+        except IntegrityError:
+            db.session.rollback()
+    raise RuntimeError('保存讲义版本冲突，请重试')
+
+
+def list_visible_lectures(user_id, kind=None, page=1, per_page=20):
+    """分页列出用户可见的讲义（不含正文）"""
+    from models import db, LectureLibraryEntry
+
+    query = LectureLibraryEntry.query.filter(db.or_(
+        LectureLibraryEntry.visibility == VISIBILITY_SHARED,
+        LectureLibraryEntry.owner_user_id == user_id
+    ))
+    if kind:
+        query = query.filter(LectureLibraryEntry.kind == kind)
+    return query.order_by(LectureLibraryEntry.created_at.desc()).paginate(
+        page=page, per_page=per_page, error_out=False
+    )
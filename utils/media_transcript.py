@@ -0,0 +1,263 @@
+"""
+视频字幕与转写处理模块
+从视频内嵌字幕轨（需要 ffmpeg/ffprobe）或外挂字幕文件（SRT/ASS/WebVTT）中提取字幕，
+按时间窗口切分长字幕，并以 map-reduce 方式分段总结后再汇总，
+使视频总结基于真实内容而不是文件名
+"""
+
+import hashlib
+import json
+import re
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+SUBTITLE_EXTENSIONS = ('.srt', '.vtt', '.ass', '.ssa')
+
+# 每个分段覆盖的时长（秒）和最大字符数
+DEFAULT_WINDOW_SECONDS = 300
+MAX_CHUNK_CHARS = 6000
+
+# 调用外部工具的超时时间（秒）
+FFMPEG_TIMEOUT = 120
+
+_TIME_RE = re.compile(r'(?:(\d+):)?(\d{1,2}):(\d{1,2})[.,](\d{1,3})')
+_TAG_RE = re.compile(r'<[^>]+>|\{\\[^}]*\}')
+
+
+def _parse_timestamp(text):
+    match = _TIME_RE.search(text)
+    if not match:
+        return None
+    hours, minutes, seconds, fraction = match.groups()
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds) + int(fraction.ljust(3, '0')[:3]) / 1000
+
+
+def _clean_text(text):
+    text = _TAG_RE.sub('', text).replace('\\N', ' ').replace('\\n', ' ')
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def parse_srt(content):
+    """
+    解析 SRT / WebVTT 字幕（两者时间轴格式相近）
+
+    Returns:
+        list: [{'start': 秒, 'end': 秒, 'text': 文本}]
+    """
+    cues = []
+    for block in re.split(r'\n\s*\n', content.replace('\r\n', '\n').replace('\r', '\n')):
+        lines = [line for line in block.strip().split('\n') if line.strip()]
+        for i, line in enumerate(lines):
+            if '-->' in line:
+                start_text, end_text = line.split('-->', 1)
+                start, end = _parse_timestamp(start_text), _parse_timestamp(end_text)
+                text = _clean_text(' '.join(lines[i + 1:]))
+                if start is not None and text:
+                    cues.append({'start': start, 'end': end if end is not None else start, 'text': text})
+                break
+    return cues
+
+
+def parse_vtt(content):
+    """解析 WebVTT 字幕（去掉文件头和 NOTE/STYLE 块后按 SRT 规则解析）"""
+    content = re.sub(r'^﻿?WEBVTT[^\n]*\n', '', content.lstrip())
+    content = re.sub(r'(?ms)^(NOTE|STYLE|REGION)\b.*?(?:\n\s*\n|\Z)', '', content)
+    return parse_srt(content)
+
+
+def parse_ass(content):
+    """解析 ASS/SSA 字幕的 Dialogue 行"""
+    cues = []
+    fields = None
+    for line in content.splitlines():
+        line = line.strip()
+        if line.lower().startswith('format:') and fields is None:
+            fields = [f.strip().lower() for f in line[7:].split(',')]
+        elif line.lower().startswith('dialogue:'):
+            columns = fields or ['layer', 'start', 'end', 'style', 'name', 'marginl', 'marginr', 'marginv',
+                                 'effect', 'text']
+            values = line[9:].split(',', len(columns) - 1)
+            if len(values) < len(columns):
+                continue
+            row = dict(zip(columns, values))
+            start, end = _parse_timestamp(row.get('start', '')), _parse_timestamp(row.get('end', ''))
+            text = _clean_text(row.get('text', ''))
+            if start is not None and text:
+                cues.append({'start': start, 'end': end if end is not None else start, 'text': text})
+    return cues
+
+
+def parse_subtitle(content, filename):
+    """按扩展名（无法判断时按内容）选择解析器"""
+    name = (filename or '').lower()
+    if name.endswith(('.ass', '.ssa')) or '[Events]' in content:
+        return parse_ass(content)
+    if name.endswith('.vtt') or content.lstrip('﻿').startswith('WEBVTT'):
+        return parse_vtt(content)
+    return parse_srt(content)
+
+
+def read_subtitle_file(path):
+    """读取外挂字幕文件，兼容 UTF-8 / GBK 编码"""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    for encoding in ('utf-8-sig', 'gb18030', 'utf-16'):
+        try:
+            return raw.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return raw.decode('utf-8', errors='ignore')
+
+
+def ffmpeg_available():
+    return shutil.which('ffprobe') is not None and shutil.which('ffmpeg') is not None
+
+
+def extract_embedded_subtitles(video_path):
+    """
+    用 ffmpeg 提取视频内嵌的文字字幕轨（转为 SRT），优先中文字幕轨
+
+    Returns:
+        list: 字幕条目，没有字幕轨或没有安装 ffmpeg 时返回空列表
+    """
+    if not ffmpeg_available():
+        return []
+    try:
+        probe = subprocess.run(
+            ['ffprobe', '-v', 'error', '-select_streams', 's',
+             '-show_entries', 'stream=index,codec_name:stream_tags=language', '-of', 'json', video_path],
+            capture_output=True, text=True, timeout=FFMPEG_TIMEOUT
+        )
+        streams = json.loads(probe.stdout or '{}').get('streams', [])
+    except (subprocess.SubprocessError, json.JSONDecodeError, OSError):
+        return []
+
+    # 图形字幕（如 PGS、DVD）无法直接转为文本
+    text_codecs = {'subrip', 'srt', 'ass', 'ssa', 'webvtt', 'mov_text', 'text'}
+    candidates = [s for s in streams if s.get('codec_name') in text_codecs]
+    candidates.sort(key=lambda s: 0 if (s.get('tags') or {}).get('language') in ('chi', 'zho', 'chs', 'zh') else 1)
+
+    for stream in candidates:
+        try:
+            result = subprocess.run(
+                ['ffmpeg', '-v', 'error', '-i', video_path, '-map', f"0:{stream['index']}", '-f', 'srt', '-'],
+                capture_output=True, timeout=FFMPEG_TIMEOUT
+            )
+        except (subprocess.SubprocessError, OSError):
+            continue
+        cues = parse_srt(result.stdout.decode('utf-8', errors='ignore'))
+        if cues:
+            return cues
+    return []
+
+
+def transcript_input_hash(subtitle_hashes=(), pasted_text=None):
+    """
+    用户提供的字幕输入的指纹（上传字幕文件的内容指纹 + 粘贴的文本）。
+    同一视频配不同字幕得到的总结不同，缓存需要同时按它区分
+
+    Args:
+        subtitle_hashes (iterable): 上传字幕文件内容的 SHA-256，按上传顺序
+        pasted_text (str): 用户粘贴的字幕/文稿
+
+    Returns:
+        str or None: 指纹，都没有提供时返回 None（字幕只能来自视频本身）
+    """
+    subtitle_hashes = list(subtitle_hashes or [])
+    pasted = (pasted_text or '').strip()
+    if not subtitle_hashes and not pasted:
+        return None
+    payload = json.dumps({'subtitles': subtitle_hashes, 'pasted': pasted}, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def load_transcript(video_path=None, subtitle_paths=(), pasted_text=None):
+    """
+    按优先级获取字幕：用户上传的字幕文件 > 视频内嵌字幕轨 > 用户粘贴的文本
+
+    Args:
+        video_path (str): 视频文件路径，可为 None
+        subtitle_paths (iterable): 上传的字幕文件路径
+        pasted_text (str): 用户粘贴的字幕/文稿文本
+
+    Returns:
+        tuple: (字幕条目列表, 来源 sidecar（上传的外挂字幕）/embedded/pasted，没有字幕时为 None)
+    """
+    for path in subtitle_paths or []:
+        cues = parse_subtitle(read_subtitle_file(path), path)
+        if cues:
+            return cues, 'sidecar'
+
+    if video_path:
+        cues = extract_embedded_subtitles(video_path)
+        if cues:
+            return cues, 'embedded'
+
+    if pasted_text and pasted_text.strip():
+        # 没有时间轴的文稿按段落切分，时间统一记为 0，分段时按字数截断
+        cues = [{'start': 0, 'end': 0, 'text': _clean_text(p)}
+                for p in re.split(r'\n\s*\n', pasted_text) if p.strip()]
+        if cues:
+            return cues, 'pasted'
+    return [], None
+
+
+def chunk_cues(cues, window_seconds=DEFAULT_WINDOW_SECONDS, max_chars=MAX_CHUNK_CHARS):
+    """
+    按时间窗口切分字幕，单段过长时提前截断
+
+    Returns:
+        list: [{'start': 秒, 'end': 秒, 'text': 文本}]
+    """
+    chunks = []
+    current = None
+    for cue in sorted(cues, key=lambda c: c['start']):
+        if current is None or cue['start'] - current['start'] >= window_seconds \
+                or len(current['text']) + len(cue['text']) > max_chars:
+            current = {'start': cue['start'], 'end': cue['end'], 'text': cue['text']}
+            chunks.append(current)
+        else:
+            # 相邻字幕常有重复行（滚动字幕），去掉重复
+            if not current['text'].endswith(cue['text']):
+                current['text'] += ' ' + cue['text']
+            current['end'] = max(current['end'], cue['end'])
+    return chunks
+
+
+def format_timestamp(seconds):
+    seconds = int(seconds or 0)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def transcript_text(cues):
+    """字幕转为带时间戳的纯文本，便于保存和展示"""
+    return '\n'.join(f"[{format_timestamp(c['start'])}] {c['text']}" for c in cues)
+
+
+def map_reduce_summarize(chunks, summarize_chunk, combine, max_workers=4):
+    """
+    分段总结后汇总
+
+    Args:
+        chunks (list): chunk_cues 的返回值
+        summarize_chunk (callable): (分段文本, 时间范围字符串) -> 分段总结
+        combine (callable): (分段总结列表) -> 最终总结
+        max_workers (int): 并发调用数
+
+    Returns:
+        tuple: (最终总结, 分段总结列表)
+    """
+    if not chunks:
+        return '', []
+
+    def _map(chunk):
+        time_range = f"{format_timestamp(chunk['start'])}-{format_timestamp(chunk['end'])}"
+        return f"[{time_range}] {summarize_chunk(chunk['text'], time_range)}"
+
+    if len(chunks) == 1:
+        partials = [_map(chunks[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            partials = list(executor.map(_map, chunks))
+    return combine(partials), partials
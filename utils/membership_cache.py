@@ -0,0 +1,142 @@
+"""
+会员信息缓存模块
+同一请求内多次解析会员信息时只查询一次（缓存在 flask.g 上），
+跨请求使用按用户的短时 TTL 缓存；会员记录新增、修改、删除所在的事务提交（或回滚）后自动失效，
+开通会员等流程也可在提交后显式调用 invalidate_membership
+"""
+
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import db
+from models_membership import UserMembership, MembershipTier
+
+# 跨请求缓存的有效期（秒）：多进程部署时其它进程的修改最多延迟这么久生效
+MEMBERSHIP_CACHE_TTL = 30
+
+_cache = {}  # {user_id: (过期时间, 会员快照或 None)}
+_lock = threading.Lock()
+
+
+def _snapshot(instance):
+    """复制 ORM 对象的列属性，缓存的快照与会话无关，跨请求使用不会触发延迟加载"""
+    return SimpleNamespace(**{column.key: getattr(instance, column.key) for column in instance.__table__.columns})
+
+
+def _load(user_id):
+    """查询用户最近到期的有效会员记录（含套餐），没有时返回 None"""
+    row = db.session.query(UserMembership, MembershipTier).join(
+        MembershipTier, MembershipTier.id == UserMembership.tier_id
+    ).filter(
+        UserMembership.user_id == user_id,
+        UserMembership.is_active == True
+    ).order_by(UserMembership.end_date.desc()).first()
+    if row is None:
+        return None
+    membership, tier = row
+    snapshot = _snapshot(membership)
+    snapshot.tier = _snapshot(tier)
+    return snapshot
+
+
+def resolve_membership(user_id):
+    """
+    解析用户的有效会员记录（只读快照，属性与 UserMembership 相同，tier 为套餐快照）
+
+    包含已过期但尚未被定时任务（utils.membership_expiry）置为失效的记录，需要判断是否过期时请比较 end_date；
+    需要修改会员记录时请直接查询 UserMembership
+
+    Returns:
+        SimpleNamespace or None
+    """
+    request_cache = None
+    if has_app_context():
+        request_cache = g.setdefault('_membership_cache', {})
+        if user_id in request_cache:
+            return request_cache[user_id]
+
+    now = time.monotonic()
+    with _lock:
+        cached = _cache.get(user_id)
+    if cached and cached[0] > now:
+        membership = cached[1]
+    else:
+        membership = _load(user_id)
+        with _lock:
+            _cache[user_id] = (now + MEMBERSHIP_CACHE_TTL, membership)
+
+    if request_cache is not None:
+        request_cache[user_id] = membership
+    return membership
+
+
+def resolve_current_membership(user_id):
+    """未过期的有效会员，没有时返回 None（在快照上比较 end_date，不额外查询）"""
+    membership = resolve_membership(user_id)
+    if membership is None or membership.end_date <= datetime.utcnow():
+        return None
+    return membership
+
+
+def invalidate_membership(user_id=None):
+    """清除用户的会员缓存（包括当前请求内的缓存），user_id 为空时清除全部"""
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+    if has_app_context() and '_membership_cache' in g:
+        if user_id is None:
+            g._membership_cache.clear()
+        else:
+            g._membership_cache.pop(user_id, None)
+
+
+_PENDING_KEY = 'membership_cache_pending'
+
+
+def _invalidate_after_transaction(target, user_id):
+    """
+    flush 时立即清除一次，并在事务结束后再清除一次：提交前其它请求仍可能读到旧记录并写入缓存，
+    回滚时本请求可能已把未提交的记录写入缓存
+    """
+    invalidate_membership(user_id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_KEY, set()).add(user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _transaction_committed(session):
+    for user_id in session.info.pop(_PENDING_KEY, ()):
+        invalidate_membership(user_id)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _transaction_rolled_back(session, previous_transaction):
+    # 保存点回滚时外层事务还会继续，保留待清除的用户，提交时再清除一次
+    pending = session.info.get(_PENDING_KEY, ())
+    if previous_transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
+    for user_id in list(pending):
+        invalidate_membership(user_id)
+
+
+@event.listens_for(UserMembership, 'after_insert')
+@event.listens_for(UserMembership, 'after_update')
+@event.listens_for(UserMembership, 'after_delete')
+def _membership_changed(mapper, connection, target):
+    _invalidate_after_transaction(target, target.user_id)
+
+
+@event.listens_for(MembershipTier, 'after_update')
+@event.listens_for(MembershipTier, 'after_delete')
+def _tier_changed(mapper, connection, target):
+    # 套餐变更影响所有持有该套餐的用户（None 表示清除全部）
+    _invalidate_after_transaction(target, None)
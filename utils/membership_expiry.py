@@ -0,0 +1,145 @@
+"""
+会员到期处理模块
+到期的会员记录由定时任务按批次用集合式 UPDATE 统一置为失效（每批一个短事务），
+逐个清除受影响用户的会员缓存，并记录每次运行的指标。
+请求中仍在缓存的会员快照上比较 end_date（不额外查询），任务运行前到期的会员也不会继续使用。
+
+任务可以由 cron 运行 scripts/expire_memberships.py，也可以在应用进程内按
+MEMBERSHIP_EXPIRY_INTERVAL_SECONDS 周期运行（多个进程同时运行不会重复处理）
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger('performance')
+
+# 每批处理的会员记录数
+EXPIRY_BATCH_SIZE = 1000
+
+_metrics = {
+    'runs': 0,
+    'total_expired': 0,
+    'last_run_at': None,
+    'last_expired': 0,
+    'last_batches': 0,
+    'last_duration_ms': 0,
+    'last_error': None,
+}
+_metrics_lock = threading.Lock()
+
+
+def expire_memberships(now=None, batch_size=EXPIRY_BATCH_SIZE):
+    """
+    把 end_date 已过的有效会员记录批量置为失效
+
+    Args:
+        now (datetime): 当前时间（UTC）
+        batch_size (int): 每批处理的记录数
+
+    Returns:
+        int: 失效的会员记录数
+    """
+    from models import db
+    from models_membership import UserMembership
+    from utils.membership_cache import invalidate_membership
+
+    now = now or datetime.utcnow()
+    started = time.monotonic()
+    expired = 0
+    batches = 0
+    try:
+        while True:
+            batch = db.session.query(UserMembership.id, UserMembership.user_id).filter(
+                UserMembership.is_active == True,
+                UserMembership.end_date <= now
+            ).order_by(UserMembership.id).limit(batch_size).all()
+            if not batch:
+                break
+
+            # 再次带上条件，其它进程已处理或刚续费的记录不会被改动
+            updated = UserMembership.query.filter(
+                UserMembership.id.in_([row.id for row in batch]),
+                UserMembership.is_active == True,
+                UserMembership.end_date <= now
+            ).update({UserMembership.is_active: False}, synchronize_session=False)
+            db.session.commit()
+            expired += updated
+            batches += 1
+
+            # 集合式更新不会触发 ORM 事件，逐个清除会员缓存
+            for user_id in {row.user_id for row in batch}:
+                invalidate_membership(user_id)
+            if len(batch) < batch_size:
+                break
+    except Exception as e:
+        db.session.rollback()
+        _record_run(now, expired, batches, started, error=str(e))
+        raise
+
+    _record_run(now, expired, batches, started)
+    return expired
+
+
+def _record_run(now, expired, batches, started, error=None):
+    duration_ms = int((time.monotonic() - started) * 1000)
+    with _metrics_lock:
+        _metrics['runs'] += 1
+        _metrics['total_expired'] += expired
+        _metrics['last_run_at'] = now.isoformat()
+        _metrics['last_expired'] = expired
+        _metrics['last_batches'] = batches
+        _metrics['last_duration_ms'] = duration_ms
+        _metrics['last_error'] = error
+    if error:
+        logger.error(f"会员到期处理失败 | 已处理 {expired} 条 | {error}")
+    elif expired:
+        logger.info(f"会员到期处理 | 失效 {expired} 条 | {batches} 批 | 耗时 {duration_ms}ms")
+
+
+def get_expiry_metrics():
+    """本进程内到期任务的运行指标"""
+    with _metrics_lock:
+        return dict(_metrics)
+
+
+class MembershipExpiryJob:
+    """在应用进程内周期运行到期处理的后台线程"""
+
+    def __init__(self):
+        self._app = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.interval = 0
+
+    def init_app(self, app):
+        """读取运行间隔（为 0 时不在进程内运行）；线程在第一个请求时启动（兼容多进程 fork）"""
+        self._app = app
+        self.interval = app.config.get('MEMBERSHIP_EXPIRY_INTERVAL_SECONDS', 60)
+        if self.interval > 0 and not app.config.get('TESTING', False):
+            app.before_request(self._ensure_thread)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='membership-expiry', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        from models import db
+
+        while True:
+            with self._app.app_context():
+                try:
+                    expire_memberships()
+                except Exception:
+                    logger.exception("会员到期处理失败")
+                finally:
+                    db.session.remove()
+            time.sleep(self.interval)
+
+
+expiry_job = MembershipExpiryJob()
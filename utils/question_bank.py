@@ -0,0 +1,183 @@
+"""
+题库复用模块
+对题干和选项归一化并在科目（或出题材料）范围内计算指纹，出题时优先从题库中选取用户未见过的题目，
+只对不足的数量调用AI生成，入库时拒绝重复题目
+"""
+
+import hashlib
+import re
+import unicodedata
+import uuid
+from datetime import datetime
+
+# 题干开头的编号，如 "1." "（2）" "第3题"
+_NUMBERING_RE = re.compile(r'^\s*(?:第?\s*\d+\s*题|[(（]?\d+[)）.．、])\s*')
+# 选项开头的字母，如 "A." "(B)" "C、"
+_OPTION_LABEL_RE = re.compile(r'^\s*[(（]?[A-Ha-h][)）.．、:：]\s*')
+# 归一化时去掉的字符：空白和不影响题意的文字标点（保留 + - * / = < > ^ % ( ) . 等运算符和数字）
+_IGNORED_CHARS_RE = re.compile(r'[\s,;:?!"\'`~，。、；：？！…—·「」『』【】《》〈〉“”‘’_]+')
+
+# 未指定科目时使用的默认值
+DEFAULT_SUBJECT = '未分类'
+
+
+def normalize_question_text(text):
+    """
+    题干归一化：去掉编号，全角转半角，忽略大小写、空白和文字标点；
+    运算符和数字保留（“2+3”与“2*3”是不同的题目）
+    """
+    text = unicodedata.normalize('NFKC', _NUMBERING_RE.sub('', text or '')).casefold()
+    return _IGNORED_CHARS_RE.sub('', text)
+
+
+def question_scope(subject, source_hash=None):
+    """题目所属范围：指定科目时按科目，未分类时按出题材料"""
+    if subject and subject != DEFAULT_SUBJECT:
+        return subject
+    return f"{DEFAULT_SUBJECT}:{source_hash or ''}"
+
+
+def question_fingerprint(text, options=None, scope=''):
+    """
+    计算题目指纹（题干 + 选项 + 范围），“下列说法正确的是（ ）”这类通用题干靠选项区分
+
+    Args:
+        text (str): 题干
+        options (list): 选项（顺序无关）
+        scope (str): question_scope 的返回值
+
+    Returns:
+        str: SHA-256，题干为空时返回 None
+    """
+    normalized = normalize_question_text(text)
+    if not normalized:
+        return None
+    normalized_options = sorted(
+        normalize_question_text(_OPTION_LABEL_RE.sub('', str(option))) for option in (options or [])
+    )
+    payload = '\x00'.join([scope or '', normalized] + normalized_options)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def source_fingerprint(text):
+    """计算出题材料的指纹"""
+    return hashlib.sha256(re.sub(r'\s+', '', text or '').encode('utf-8')).hexdigest()
+
+
+def select_unseen_questions(user_id, subject, difficulty, limit, question_types=None, source_hash=None):
+    """
+    从题库中选取用户未见过的题目
+
+    Args:
+        user_id (int): 用户ID
+        subject (str): 科目；为默认值时只复用同一份材料生成的题目
+        difficulty (str): 难度
+        limit (int): 最多选取数量
+        question_types (list): 限定题型
+        source_hash (str): 出题材料指纹
+
+    Returns:
+        list: QuestionBank 列表
+    """
+    from models import db, QuestionBank, QuestionExposure
+
+    if limit <= 0:
+        return []
+
+    query = QuestionBank.query.filter(QuestionBank.difficulty == difficulty)
+    if subject and subject != DEFAULT_SUBJECT:
+        query = query.filter(QuestionBank.subject == subject)
+    elif source_hash:
+        query = query.filter(QuestionBank.source_hash == source_hash)
+    else:
+        return []
+    if question_types:
+        query = query.filter(QuestionBank.question_type.in_(question_types))
+    if user_id:
+        seen = db.select(QuestionExposure.question_id).where(QuestionExposure.user_id == user_id)
+        query = query.filter(QuestionBank.question_id.not_in(seen))
+
+    return query.order_by(QuestionBank.id).limit(limit).all()
+
+
+def record_exposures(user_id, question_ids):
+    """记录题目已下发给用户（未提交），已记录过的跳过"""
+    from models import db, QuestionExposure
+
+    if not user_id or not question_ids:
+        return
+    existing = {
+        row.question_id for row in QuestionExposure.query.with_entities(QuestionExposure.question_id)
+        .filter(QuestionExposure.user_id == user_id, QuestionExposure.question_id.in_(question_ids))
+    }
+    now = datetime.utcnow()
+    db.session.add_all([
+        QuestionExposure(user_id=user_id, question_id=question_id, served_at=now)
+        for question_id in dict.fromkeys(question_ids) if question_id not in existing
+    ])
+
+
+def save_generated_questions(questions, question_set_id, subject, difficulty, source_hash=None):
+    """
+    保存AI生成的题目，与题库或本批次重复的题目不入库。
+    每道题在单独的保存点中写入，其它请求同时写入了相同指纹的题目时复用已入库的那一条
+
+    Args:
+        questions (list): AI 返回的题目字典列表
+        question_set_id (str): 题目集ID
+        subject (str): 科目
+        difficulty (str): 难度
+        source_hash (str): 出题材料指纹
+
+    Returns:
+        tuple: (新增的 QuestionBank 列表, 与已有题目重复的 QuestionBank 列表)
+    """
+    from sqlalchemy.exc import IntegrityError
+    from models import db, QuestionBank
+
+    scope = question_scope(subject, source_hash)
+    by_fingerprint = {}
+    for q in questions:
+        if not isinstance(q, dict) or not q.get('question'):
+            continue
+        options = q.get('options') if isinstance(q.get('options'), list) else []
+        fingerprint = question_fingerprint(q['question'], options, scope)
+        if fingerprint and fingerprint not in by_fingerprint:
+            by_fingerprint[fingerprint] = q
+
+    existing = {
+        q.fingerprint: q
+        for q in QuestionBank.query.filter(QuestionBank.fingerprint.in_(list(by_fingerprint.keys()))).all()
+    } if by_fingerprint else {}
+
+    created = []
+    duplicates = []
+    for fingerprint, q in by_fingerprint.items():
+        if fingerprint in existing:
+            duplicates.append(existing[fingerprint])
+            continue
+        new_question = QuestionBank(
+            question_id=str(uuid.uuid4()),
+            question_set_id=question_set_id,
+            question_text=q['question'],
+            question_type=q.get('type', ''),
+            subject=subject or DEFAULT_SUBJECT,
+            difficulty=difficulty,
+            fingerprint=fingerprint,
+            source_hash=source_hash,
+            options=q.get('options', []),
+            correct_answer=q.get('correct_answer', ''),
+            accepted_answers=q.get('accepted_answers') or None,
+            created_at=datetime.utcnow()
+        )
+        try:
+            with db.session.begin_nested():
+                db.session.add(new_question)
+        except IntegrityError:
+            concurrent = QuestionBank.query.filter_by(fingerprint=fingerprint).first()
+            if concurrent is not None:
+                duplicates.append(concurrent)
+            continue
+        created.append(new_question)
+
+    return created, duplicates
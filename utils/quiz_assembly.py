@@ -0,0 +1,265 @@
+"""
+组卷模块
+按科目、题型比例、难度分布和"用户未做过"等约束直接从题库组卷，无需调用AI。
+随机抽题在若干个随机主键起点各做一次有上限的索引范围扫描（到末尾时从头接着取），
+再从这些候选中随机抽取，不使用 ORDER BY random()，也不读取全部主键，题库很大时依然快速；
+自适应模式根据学生最近的答题正确率选择下一题的难度
+"""
+
+import math
+import random
+
+DIFFICULTY_LEVELS = ['easy', 'medium', 'hard']
+
+# 随机抽题：最多使用的随机起点数，以及候选数量相对需要数量的倍数
+PIVOT_ROUNDS = 10
+OVERSAMPLE = 3
+
+# 自适应模式：参考最近多少次答题
+ADAPTIVE_WINDOW = 20
+
+# 自适应模式：正确率区间对应的目标难度
+ADAPTIVE_THRESHOLDS = [
+    (0.8, 'hard'),
+    (0.5, 'medium'),
+    (0.0, 'easy'),
+]
+
+
+def normalize_mix(distribution):
+    """
+    校验题型比例/难度分布，转换为 {类别: 权重}（权重为 0 的类别去掉）
+
+    Raises:
+        ValueError: 格式不正确或权重不是非负数
+    """
+    if not isinstance(distribution, dict):
+        raise ValueError('题型比例和难度分布应为对象格式')
+    weights = {}
+    for key, value in distribution.items():
+        if isinstance(value, bool):
+            raise ValueError(f'{key} 的比例必须是数字')
+        try:
+            weight = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'{key} 的比例必须是数字')
+        if not math.isfinite(weight):
+            raise ValueError(f'{key} 的比例必须是数字')
+        if weight < 0:
+            raise ValueError(f'{key} 的比例不能为负数')
+        if weight > 0:
+            weights[key] = weight
+    return weights
+
+
+def allocate_counts(total, distribution):
+    """
+    按比例把总题数分配到各类别（最大余数法，保证总和不变）
+
+    Args:
+        total (int): 总题数
+        distribution (dict): {类别: 比例或权重}
+
+    Returns:
+        dict: {类别: 题数}
+
+    Raises:
+        ValueError: 比例格式不正确（见 normalize_mix）
+    """
+    weights = normalize_mix(distribution or {})
+    weight_sum = sum(weights.values())
+    if total <= 0 or weight_sum <= 0:
+        return {}
+    raw = {k: total * v / weight_sum for k, v in weights.items()}
+    counts = {k: int(v) for k, v in raw.items()}
+    remainder = total - sum(counts.values())
+    for k in sorted(raw, key=lambda k: raw[k] - counts[k], reverse=True)[:remainder]:
+        counts[k] += 1
+    return counts
+
+
+def _exclusion_filters(query, user_id=None, student_id=None, exclude_ids=None):
+    """排除用户已下发过、学生已作答过以及本次已选中的题目"""
+    from models import db, QuestionBank, QuestionExposure, QuestionSubmission
+
+    if user_id:
+        query = query.filter(QuestionBank.question_id.not_in(
+            db.select(QuestionExposure.question_id).where(QuestionExposure.user_id == user_id)
+        ))
+    if student_id:
+        query = query.filter(QuestionBank.question_id.not_in(
+            db.select(QuestionSubmission.question_id).where(QuestionSubmission.student_id == student_id)
+        ))
+    if exclude_ids:
+        query = query.filter(QuestionBank.question_id.not_in(list(exclude_ids)))
+    return query
+
+
+def _pick_random(query, count, rng):
+    """
+    从查询结果中随机取 count 条：在主键范围内随机选若干起点，每个起点按主键顺序
+    向后取一小段候选（不足时从头补齐），再从候选中随机抽取。
+    查询次数和读取的行数只与 count 有关，与题库大小无关
+
+    Args:
+        query: 已带过滤条件的 QuestionBank 查询
+        count (int): 需要的数量
+        rng (random.Random): 随机数生成器
+
+    Returns:
+        list: QuestionBank 列表
+    """
+    from models import db, QuestionBank
+
+    if count <= 0:
+        return []
+    min_id, max_id = db.session.query(db.func.min(QuestionBank.id), db.func.max(QuestionBank.id)).one()
+    if min_id is None:
+        return []
+
+    rounds = min(count, PIVOT_ROUNDS)
+    window = -(-count * OVERSAMPLE // rounds)
+    pool = {}
+    for _ in range(rounds):
+        pivot = rng.randint(min_id, max_id)
+        rows = query.filter(QuestionBank.id >= pivot).order_by(QuestionBank.id).limit(window).all()
+        if len(rows) < window:
+            rows += query.filter(QuestionBank.id < pivot).order_by(QuestionBank.id).limit(window - len(rows)).all()
+        for question in rows:
+            pool.setdefault(question.id, question)
+
+    if len(pool) < count:
+        # 各段候选有重叠时补足（满足条件的题目本来就不够时这里取不到新题）
+        rest = query.filter(QuestionBank.id.not_in(list(pool))) if pool else query
+        for question in rest.order_by(QuestionBank.id).limit(count - len(pool)).all():
+            pool[question.id] = question
+
+    # 按主键排序后抽样，固定随机种子时结果可以复现
+    return [pool[i] for i in rng.sample(sorted(pool), min(count, len(pool)))]
+
+
+def assemble_quiz(total, subject=None, type_mix=None, difficulty_mix=None, user_id=None, student_id=None,
+                  seed=None):
+    """
+    按约束组卷
+
+    Args:
+        total (int): 总题数
+        subject (str): 科目
+        type_mix (dict): 题型比例，如 {"choice": 0.6, "fill": 0.4}
+        difficulty_mix (dict): 难度分布，如 {"easy": 0.3, "medium": 0.5, "hard": 0.2}
+        user_id (int): 排除该用户已下发过的题
+        student_id (str): 排除该学生已作答过的题
+        seed (int): 随机种子（便于复现）
+
+    Returns:
+        tuple: (QuestionBank 列表, 缺口 {"题型/难度": 缺少数量})
+    """
+    from models import QuestionBank
+
+    rng = random.Random(seed)
+    base = QuestionBank.query
+    if subject:
+        base = base.filter(QuestionBank.subject == subject)
+
+    type_counts = allocate_counts(total, type_mix) if type_mix else {None: total}
+    selected = []
+    selected_ids = set()
+    shortfall = {}
+
+    for question_type, type_total in type_counts.items():
+        type_query = base if question_type is None else base.filter(QuestionBank.question_type == question_type)
+        cells = allocate_counts(type_total, difficulty_mix) if difficulty_mix else {None: type_total}
+
+        missing = 0
+        for difficulty, count in cells.items():
+            query = type_query if difficulty is None else type_query.filter(QuestionBank.difficulty == difficulty)
+            query = _exclusion_filters(query, user_id, student_id, selected_ids)
+            picked = _pick_random(query, count, rng)
+            selected.extend(picked)
+            selected_ids.update(q.question_id for q in picked)
+            missing += count - len(picked)
+
+        # 某个难度不够时，用同题型其它难度的题目补足
+        if missing and difficulty_mix:
+            query = _exclusion_filters(type_query, user_id, student_id, selected_ids)
+            picked = _pick_random(query, missing, rng)
+            selected.extend(picked)
+            selected_ids.update(q.question_id for q in picked)
+            missing -= len(picked)
+
+        if missing:
+            shortfall[question_type or 'any'] = missing
+
+    return selected, shortfall
+
+
+def recent_accuracy(student_id, subject=None, window=ADAPTIVE_WINDOW):
+    """
+    学生最近 window 次答题的正确率
+
+    Returns:
+        tuple: (正确率或 None, 统计的答题数)
+    """
+    from models import db, QuestionBank, QuestionSubmission
+
+    recent = db.select(QuestionSubmission.is_correct).where(QuestionSubmission.student_id == student_id)
+    if subject:
+        recent = recent.join(QuestionBank, QuestionBank.question_id == QuestionSubmission.question_id) \
+            .where(QuestionBank.subject == subject)
+    recent = recent.order_by(QuestionSubmission.submission_time.desc()).limit(window).subquery()
+
+    count, correct = db.session.execute(
+        db.select(db.func.count(), db.func.sum(db.case((recent.c.is_correct == True, 1), else_=0)))
+    ).one()
+    if not count:
+        return None, 0
+    return (correct or 0) / count, count
+
+
+def target_difficulty(accuracy):
+    """根据正确率确定目标难度，没有答题记录时从中等开始"""
+    if accuracy is None:
+        return 'medium'
+    for threshold, difficulty in ADAPTIVE_THRESHOLDS:
+        if accuracy >= threshold:
+            return difficulty
+    return 'easy'
+
+
+def next_adaptive_question(student_id, subject=None, question_type=None, user_id=None, seed=None):
+    """
+    自适应模式：按最近正确率选下一题，目标难度没有可用题目时依次尝试相邻难度
+
+    Returns:
+        dict: {question, accuracy, answered, target_difficulty}
+    """
+    from models import QuestionBank
+
+    rng = random.Random(seed)
+    accuracy, answered = recent_accuracy(student_id, subject)
+    target = target_difficulty(accuracy)
+
+    base = QuestionBank.query
+    if subject:
+        base = base.filter(QuestionBank.subject == subject)
+    if question_type:
+        base = base.filter(QuestionBank.question_type == question_type)
+
+    index = DIFFICULTY_LEVELS.index(target)
+    order = sorted(range(len(DIFFICULTY_LEVELS)), key=lambda i: (abs(i - index), -i))
+    question = None
+    for i in order:
+        query = _exclusion_filters(base.filter(QuestionBank.difficulty == DIFFICULTY_LEVELS[i]),
+                                   user_id, student_id)
+        picked = _pick_random(query, 1, rng)
+        if picked:
+            question = picked[0]
+            break
+
+    return {
+        'question': question,
+        'accuracy': accuracy,
+        'answered': answered,
+        'target_difficulty': target
+    }
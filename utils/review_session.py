@@ -0,0 +1,120 @@
+"""
+增量代码审查模块
+代码审查/调试帮助按会话保存上一版代码和审查结论，学生修改后再次提交时
+只把统一 diff 和上一轮要点摘要发给模型，而不是重新发送整份代码从零开始审查
+"""
+
+import difflib
+import re
+import uuid
+
+# diff 超过新代码长度的该比例时，直接发送完整代码更划算
+FULL_CODE_RATIO = 0.6
+
+# 要点摘要的最大条数和单条长度
+MAX_FINDINGS = 8
+MAX_FINDING_LENGTH = 150
+
+# 要求模型在回答末尾附带的要点摘要标题
+SUMMARY_HEADING = '要点摘要'
+SUMMARY_INSTRUCTION = f"\n\n最后请以“## {SUMMARY_HEADING}”为标题，用不超过5条、每条一行列出仍需关注的关键问题。"
+
+_BULLET_RE = re.compile(r'^\s*(?:[-*•]|\d+[.、)）])\s*')
+
+
+def unified_code_diff(previous, current, language='code'):
+    """生成上一版与当前版本之间的统一 diff 文本"""
+    diff = difflib.unified_diff(
+        (previous or '').splitlines(),
+        (current or '').splitlines(),
+        fromfile=f'previous.{language}',
+        tofile=f'current.{language}',
+        n=3,
+        lineterm=''
+    )
+    return '\n'.join(diff)
+
+
+def summarize_findings(review_text):
+    """
+    从审查结果中提取紧凑的要点摘要：优先取模型给出的“要点摘要”段落，
+    否则取列表项的前几条
+
+    Args:
+        review_text (str): 审查结果
+
+    Returns:
+        str: 每行一条要点
+    """
+    if not review_text:
+        return ''
+    section = review_text
+    match = re.search(rf'#+\s*{SUMMARY_HEADING}\s*\n(.*)', review_text, re.S)
+    if match:
+        section = match.group(1)
+
+    findings = []
+    for line in section.splitlines():
+        if not _BULLET_RE.match(line):
+            continue
+        item = _BULLET_RE.sub('', line).strip().strip('*').strip()
+        if item:
+            findings.append(item[:MAX_FINDING_LENGTH])
+        if len(findings) >= MAX_FINDINGS:
+            break
+    if not findings:
+        return review_text.strip()[:MAX_FINDING_LENGTH * 3]
+    return '\n'.join(f"- {item}" for item in findings)
+
+
+def load_session(mode, user_id, review_session_id):
+    """读取用户自己的审查会话，不存在时返回 None"""
+    from models import CodeReviewSession
+
+    if not review_session_id:
+        return None
+    return CodeReviewSession.query.filter_by(
+        session_id=review_session_id, user_id=user_id, mode=mode
+    ).first()
+
+
+def plan_review(session, code, language):
+    """
+    决定本轮发送给模型的内容
+
+    Args:
+        session (CodeReviewSession): 已有会话，可为 None
+        code (str): 当前代码
+        language (str): 编程语言
+
+    Returns:
+        dict: {mode: full/incremental/unchanged, diff}
+    """
+    if session is None or not session.current_code:
+        return {'mode': 'full', 'diff': None}
+    if session.current_code == code and session.language == language:
+        return {'mode': 'unchanged', 'diff': None}
+    diff = unified_code_diff(session.current_code, code, language)
+    if session.language != language or len(diff) > len(code) * FULL_CODE_RATIO:
+        return {'mode': 'full', 'diff': None}
+    return {'mode': 'incremental', 'diff': diff}
+
+
+def save_session(session, mode, user_id, language, code, review_text):
+    """保存本轮代码和审查结论（未存在时新建会话），返回会话对象（未提交）"""
+    from models import db, CodeReviewSession
+
+    if session is None:
+        session = CodeReviewSession(
+            session_id=str(uuid.uuid4()),
+            user_id=user_id,
+            mode=mode,
+            revision=0
+        )
+        db.session.add(session)
+    session.language = language
+    session.current_code = code
+    session.last_review = review_text
+    session.findings_summary = summarize_findings(review_text)
+    session.revision = (session.revision or 0) + 1
+    return session
@@ -0,0 +1,77 @@
+"""
+评测沙箱启动器（由 utils/autograder.py 作为独立脚本调用，不要导入）
+在 exec 学生程序之前设置资源限制，并在配置了低权限用户时切换到该用户。
+以单独进程执行，而不是在服务进程的线程里使用 preexec_fn
+
+用法:
+    python -I sandbox_exec.py '<limits json>' -- <command> [args...]
+"""
+
+import json
+import os
+import sys
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def _set_limit(name, value):
+    if value is None:
+        return
+    limit = getattr(resource, name)
+    resource.setrlimit(limit, (value, value))
+
+
+def _resolve(program):
+    """在 PATH 中查找程序（切换用户后可能无法再导入标准库模块，需提前完成）"""
+    if os.sep in program:
+        return program
+    for directory in os.environ.get('PATH', os.defpath).split(os.pathsep):
+        path = os.path.join(directory, program)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return program
+
+
+def main(argv):
+    if resource is None or len(argv) < 4 or argv[2] != '--':
+        sys.stderr.write('sandbox_exec: 当前系统不支持资源限制或参数错误\n')
+        return 126
+
+    limits = json.loads(argv[1])
+    command = argv[3:]
+    program = _resolve(command[0])
+
+    cpu = limits.get('cpu_seconds')
+    if cpu is not None:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+    _set_limit('RLIMIT_AS', limits.get('memory_bytes'))
+    _set_limit('RLIMIT_FSIZE', limits.get('file_size_bytes'))
+    _set_limit('RLIMIT_NPROC', limits.get('max_processes'))
+    _set_limit('RLIMIT_NOFILE', limits.get('max_open_files'))
+    _set_limit('RLIMIT_CORE', 0)
+
+    # 切换到低权限用户（服务进程需以 root 运行）；先降组再降用户
+    uid, gid = limits.get('uid'), limits.get('gid')
+    if uid is not None:
+        try:
+            os.setgroups([])
+            os.setgid(gid)
+            os.setuid(uid)
+        except OSError as e:
+            sys.stderr.write(f'sandbox_exec: 无法切换到评测用户: {e}\n')
+            return 126
+        if os.getuid() == 0 or os.geteuid() == 0:
+            return 126
+
+    try:
+        os.execve(program, command, os.environ)
+    except OSError as e:
+        sys.stderr.write(f'sandbox_exec: 无法启动 {command[0]}: {e}\n')
+        return 127
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -382,16 +382,111 @@ def add_security_headers(response):
 
 
 # ==================== 账户锁定机制 ====================
+# 失败次数按用户名和IP分别记录在 login_throttles 中（每个键一行），
+# 用“上一窗口 + 当前窗口”的滑动窗口计数估算最近 ATTEMPT_WINDOW 秒内的失败次数，
+# 判断锁定只按唯一键读一行；完整的 login_attempts 记录交给写入缓冲异步写入，仅用于审计。
+# 用户名达到上限时锁定该账户；IP 只做短时限流（校园网/代理后很多用户共用一个IP），
+# 不锁定任何账户，且该IP上的成功登录会抵扣一部分失败计数
 
 # 账户锁定配置常量
 MAX_LOGIN_ATTEMPTS = 5      # 最大失败尝试次数
+MAX_IP_ATTEMPTS = 100       # 同一IP（不区分用户名）的失败次数达到该值时短时限流
 LOCKOUT_DURATION = 120      # 锁定时长（秒），2分钟（进一步优化：更短的锁定时间）
+IP_THROTTLE_DURATION = 60   # IP 限流时长（秒）
+IP_SUCCESS_DECAY = 5        # 每次成功登录从该IP的失败计数中扣除的次数
 ATTEMPT_WINDOW = 300        # 统计窗口（秒），5分钟内的失败次数
 
 
+def _window_start(now):
+    """当前固定窗口的起点（按 ATTEMPT_WINDOW 对齐）"""
+    from datetime import datetime, timedelta
+    
+    epoch = datetime(1970, 1, 1)
+    seconds = int((now - epoch).total_seconds())
+    return epoch + timedelta(seconds=seconds - seconds % ATTEMPT_WINDOW)
+
+
+def _roll_window(row, now):
+    """窗口前进时把当前窗口计数移到上一窗口，间隔超过一个窗口时清零"""
+    from datetime import timedelta
+    
+    current = _window_start(now)
+    if row.window_start == current:
+        return
+    if row.window_start == current - timedelta(seconds=ATTEMPT_WINDOW):
+        row.prev_count = row.curr_count
+    else:
+        row.prev_count = 0
+    row.curr_count = 0
+    row.window_start = current
+
+
+def _sliding_count(row, now):
+    """滑动窗口内的失败次数估算：上一窗口按未过去的比例计入"""
+    from datetime import timedelta
+    
+    current = _window_start(now)
+    if row.window_start == current:
+        prev, curr = row.prev_count, row.curr_count
+    elif row.window_start == current - timedelta(seconds=ATTEMPT_WINDOW):
+        prev, curr = row.curr_count, 0
+    else:
+        return 0
+    elapsed = (now - current).total_seconds() / ATTEMPT_WINDOW
+    return int(prev * (1 - elapsed) + curr)
+
+
+def _get_throttles(username, ip_address=None, for_update=False):
+    """一次查询取出用户名和IP的计数行，返回 {(key_type, key): row}"""
+    from models import db, LoginThrottle
+    
+    conditions = []
+    if username:
+        conditions.append(db.and_(LoginThrottle.key_type == 'user', LoginThrottle.key == username[:80]))
+    if ip_address:
+        conditions.append(db.and_(LoginThrottle.key_type == 'ip', LoginThrottle.key == ip_address[:80]))
+    if not conditions:
+        return {}
+    query = LoginThrottle.query.filter(db.or_(*conditions)).order_by(LoginThrottle.key_type.desc())
+    if for_update:
+        query = query.with_for_update()
+    return {(row.key_type, row.key): row for row in query.all()}
+
+
+def _register_failure(throttles, key_type, key, limit, now, duration=LOCKOUT_DURATION):
+    """累加一次失败，达到上限时锁定 duration 秒并清零计数（锁定结束后重新计数）"""
+    from datetime import timedelta
+    from models import db, LoginThrottle
+    
+    row = throttles.get((key_type, key))
+    if row is None:
+        row = LoginThrottle(key_type=key_type, key=key, window_start=_window_start(now),
+                            prev_count=0, curr_count=0)
+        db.session.add(row)
+    else:
+        _roll_window(row, now)
+    row.curr_count += 1
+    
+    count = _sliding_count(row, now)
+    if count >= limit:
+        row.locked_until = now + timedelta(seconds=duration)
+        row.prev_count = 0
+        row.curr_count = 0
+    return row, count
+
+
+def _decay_ip_failures(row, now):
+    """成功登录后从IP的失败计数中扣除 IP_SUCCESS_DECAY 次（先扣当前窗口）"""
+    _roll_window(row, now)
+    decay = IP_SUCCESS_DECAY
+    taken = min(row.curr_count, decay)
+    row.curr_count -= taken
+    row.prev_count = max(0, row.prev_count - (decay - taken))
+
+
 def record_login_attempt(username, ip_address, user_agent, success, failure_reason=None):
     """
-    记录登录尝试
+    记录登录尝试：同步更新用户名/IP的失败计数，审计记录异步写入
     
     Args:
         username (str): 用户名
@@ -401,45 +496,70 @@ def record_login_attempt(username, ip_address, user_agent, success, failure_reas
         failure_reason (str): 失败原因（可选）
         
     Returns:
-        dict: 记录信息，包含是否触发锁定
+        dict: 记录信息，包含是否触发账户锁定、IP 是否被限流和剩余尝试次数
     """
-    from datetime import datetime, timedelta
+    from datetime import datetime
+    from sqlalchemy.exc import IntegrityError
     from models import db, LoginAttempt
+    from utils.write_behind import log_buffer
+    
+    now = datetime.utcnow()
+    username = (username or '')[:80]
+    ip_address = (ip_address or '')[:80]
+    locked_until = None
+    ip_throttled_until = None
+    remaining = MAX_LOGIN_ATTEMPTS
     
     try:
-        # 创建登录尝试记录
-        attempt = LoginAttempt(
-            username=username,
-            ip_address=ip_address,
-            user_agent=user_agent[:500] if user_agent else None,  # 限制长度
-            success=success,
-            failure_reason=failure_reason,
-            attempted_at=datetime.utcnow()
-        )
-        
-        # 如果登录失败，检查是否需要锁定账户
-        if not success:
-            # 查询最近ATTEMPT_WINDOW时间内的失败次数
-            window_start = datetime.utcnow() - timedelta(seconds=ATTEMPT_WINDOW)
-            recent_failures = LoginAttempt.query.filter(
-                LoginAttempt.username == username,
-                LoginAttempt.success == False,
-                LoginAttempt.attempted_at >= window_start
-            ).count()
-            
-            # 如果失败次数达到阈值，设置锁定时间
-            if recent_failures + 1 >= MAX_LOGIN_ATTEMPTS:
-                locked_until = datetime.utcnow() + timedelta(seconds=LOCKOUT_DURATION)
-                attempt.locked_until = locked_until
-        
-        # 保存到数据库
-        db.session.add(attempt)
-        db.session.commit()
+        # 首次失败时两个请求可能同时插入同一个键，冲突后重试一次
+        for attempt_no in range(2):
+            try:
+                throttles = _get_throttles(username, ip_address, for_update=True)
+                if success:
+                    # 登录成功后清零该用户名的失败计数，并抵扣该IP的一部分失败计数
+                    row = throttles.get(('user', username))
+                    if row is not None:
+                        row.prev_count = 0
+                        row.curr_count = 0
+                        row.locked_until = None
+                    ip_row = throttles.get(('ip', ip_address))
+                    if ip_row is not None:
+                        _decay_ip_failures(ip_row, now)
+                else:
+                    user_row, count = _register_failure(throttles, 'user', username, MAX_LOGIN_ATTEMPTS, now)
+                    remaining = max(0, MAX_LOGIN_ATTEMPTS - count)
+                    if user_row.locked_until and user_row.locked_until > now:
+                        locked_until = user_row.locked_until
+                    if ip_address:
+                        ip_row, _ = _register_failure(throttles, 'ip', ip_address, MAX_IP_ATTEMPTS, now,
+                                                      duration=IP_THROTTLE_DURATION)
+                        if ip_row.locked_until and ip_row.locked_until > now:
+                            ip_throttled_until = ip_row.locked_until
+                db.session.commit()
+                break
+            except IntegrityError:
+                db.session.rollback()
+                if attempt_no:
+                    raise
+        
+        # 审计记录
+        log_buffer.add(LoginAttempt, {
+            'username': username,
+            'ip_address': ip_address,
+            'user_agent': user_agent[:500] if user_agent else None,  # 限制长度
+            'success': success,
+            'failure_reason': failure_reason,
+            'attempted_at': now,
+            'locked_until': locked_until
+        })
         
         return {
             'success': True,
-            'locked': attempt.locked_until is not None,
-            'locked_until': attempt.locked_until.isoformat() if attempt.locked_until else None
+            'locked': locked_until is not None,
+            'locked_until': locked_until.isoformat() if locked_until else None,
+            'remaining_attempts': 0 if locked_until else remaining,
+            'ip_throttled': ip_throttled_until is not None,
+            'ip_throttled_until': ip_throttled_until.isoformat() if ip_throttled_until else None
         }
         
     except Exception as e:
@@ -453,7 +573,7 @@ def record_login_attempt(username, ip_address, user_agent, success, failure_reas
 
 def is_account_locked(username):
     """
-    检查账户是否被锁定
+    检查账户是否被锁定（只看用户名的计数，IP 限流见 get_ip_throttle）
     
     Args:
         username (str): 用户名
@@ -461,39 +581,48 @@ def is_account_locked(username):
     Returns:
         tuple: (is_locked: bool, locked_until: datetime, recent_attempts: int)
     """
-    from datetime import datetime, timedelta
-    from models import LoginAttempt
+    from datetime import datetime
     
     try:
-        # 查询最近ATTEMPT_WINDOW时间内的失败记录
-        window_start = datetime.utcnow() - timedelta(seconds=ATTEMPT_WINDOW)
-        recent_failures = LoginAttempt.query.filter(
-            LoginAttempt.username == username,
-            LoginAttempt.success == False,
-            LoginAttempt.attempted_at >= window_start
-        ).order_by(LoginAttempt.attempted_at.desc()).all()
-        
-        if not recent_failures:
+        now = datetime.utcnow()
+        username = (username or '')[:80]
+        user_row = _get_throttles(username).get(('user', username))
+        if user_row is None:
             return False, None, 0
-        
-        # 检查最近的锁定记录
-        latest_attempt = recent_failures[0]
-        if latest_attempt.locked_until:
-            # 如果锁定时间还未过期
-            if latest_attempt.locked_until > datetime.utcnow():
-                return True, latest_attempt.locked_until, len(recent_failures)
-        
-        # 检查是否达到锁定阈值
-        if len(recent_failures) >= MAX_LOGIN_ATTEMPTS:
-            return True, latest_attempt.locked_until, len(recent_failures)
-        
-        return False, None, len(recent_failures)
+        recent = _sliding_count(user_row, now)
+        if user_row.locked_until and user_row.locked_until > now:
+            return True, user_row.locked_until, recent
+        return False, None, recent
         
     except Exception as e:
         print(f"检查账户锁定状态失败: {str(e)}")
         return False, None, 0
 
 
+def get_ip_throttle(ip_address):
+    """
+    检查来源IP是否处于短时限流中
+    
+    Args:
+        ip_address (str): IP地址
+        
+    Returns:
+        datetime or None: 限流到期时间，未限流时为 None
+    """
+    from datetime import datetime
+    
+    try:
+        ip_address = (ip_address or '')[:80]
+        row = _get_throttles(None, ip_address).get(('ip', ip_address))
+        if row is not None and row.locked_until and row.locked_until > datetime.utcnow():
+            return row.locked_until
+        return None
+        
+    except Exception as e:
+        print(f"检查IP限流状态失败: {str(e)}")
+        return None
+
+
 def get_remaining_attempts(username):
     """
     获取剩余登录尝试次数
@@ -504,48 +633,49 @@ def get_remaining_attempts(username):
     Returns:
         int: 剩余尝试次数
     """
-    from datetime import datetime, timedelta
-    from models import LoginAttempt
+    from datetime import datetime
     
     try:
-        # 查询最近ATTEMPT_WINDOW时间内的失败次数
-        window_start = datetime.utcnow() - timedelta(seconds=ATTEMPT_WINDOW)
-        recent_failures = LoginAttempt.query.filter(
-            LoginAttempt.username == username,
-            LoginAttempt.success == False,
-            LoginAttempt.attempted_at >= window_start
-        ).count()
-        
-        remaining = MAX_LOGIN_ATTEMPTS - recent_failures
-        return max(0, remaining)
+        row = _get_throttles((username or '')[:80]).get(('user', (username or '')[:80]))
+        if row is None:
+            return MAX_LOGIN_ATTEMPTS
+        if row.locked_until and row.locked_until > datetime.utcnow():
+            return 0
+        return max(0, MAX_LOGIN_ATTEMPTS - _sliding_count(row, datetime.utcnow()))
         
     except Exception as e:
         print(f"获取剩余尝试次数失败: {str(e)}")
         return MAX_LOGIN_ATTEMPTS
 
 
-def unlock_account(username):
+def unlock_account(username, clear_ips=False):
     """
-    手动解锁账户（管理员功能）
+    手动解锁账户（管理员功能），清除该用户名的失败计数，审计记录保留
     
     Args:
         username (str): 用户名
+        clear_ips (bool): 同时清除最近对该用户名登录失败过的IP的计数和限流
         
     Returns:
         bool: 是否成功
     """
     from datetime import datetime, timedelta
-    from models import db, LoginAttempt
+    from models import db, LoginAttempt, LoginThrottle
     
     try:
-        # 删除最近的失败记录
-        window_start = datetime.utcnow() - timedelta(seconds=ATTEMPT_WINDOW)
-        LoginAttempt.query.filter(
-            LoginAttempt.username == username,
-            LoginAttempt.success == False,
-            LoginAttempt.attempted_at >= window_start
-        ).delete()
-        
+        username = (username or '')[:80]
+        LoginThrottle.query.filter_by(key_type='user', key=username).delete(synchronize_session=False)
+        if clear_ips:
+            since = datetime.utcnow() - timedelta(seconds=ATTEMPT_WINDOW + LOCKOUT_DURATION)
+            ips = [row.ip_address for row in db.session.query(LoginAttempt.ip_address).filter(
+                LoginAttempt.username == username,
+                LoginAttempt.success == False,
+                LoginAttempt.attempted_at >= since
+            ).distinct()]
+            if ips:
+                LoginThrottle.query.filter(
+                    LoginThrottle.key_type == 'ip', LoginThrottle.key.in_(ips)
+                ).delete(synchronize_session=False)
         db.session.commit()
         print(f"✅ 账户 {username} 已解锁")
         return True
@@ -555,3 +685,22 @@ def unlock_account(username):
         print(f"❌ 解锁账户失败: {str(e)}")
         return False
 
+
+def purge_login_throttles(idle_seconds=None):
+    """
+    删除长时间没有失败记录且未处于锁定期的计数行（定期清理用）
+    
+    Returns:
+        int: 删除的行数
+    """
+    from datetime import datetime, timedelta
+    from models import db, LoginThrottle
+    
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=idle_seconds or ATTEMPT_WINDOW * 2)
+    deleted = LoginThrottle.query.filter(
+        LoginThrottle.window_start < cutoff,
+        db.or_(LoginThrottle.locked_until.is_(None), LoginThrottle.locked_until < now)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
@@ -0,0 +1,214 @@
+"""
+作业相似度索引模块
+对提交的提取文本做字符 shingle + MinHash 签名，并按 LSH 分桶存储，
+用于在大量提交中快速找出近似重复（抄袭嫌疑）的作业，以及批量批改时复用成绩。
+每个 shingle 只哈希一次，128 个置换用 numpy 按矩阵批量计算（没有 numpy 时逐个计算，结果相同）
+"""
+
+import hashlib
+import json
+import random
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from utils.code_summary import is_code_file, strip_c_comments, strip_python_comments
+
+# 签名长度 = 分桶数 × 每桶行数；32×4 时相似度约 0.42 以上的提交大概率落入同一桶
+NUM_PERM = 128
+LSH_BANDS = 32
+LSH_ROWS = NUM_PERM // LSH_BANDS
+
+# 字符 shingle 长度
+SHINGLE_SIZE = 5
+
+# 文本太短时相似度没有意义，不建立索引
+MIN_TEXT_LENGTH = 50
+
+# shingle 哈希和置换参数都取 32 位，a * h + b 不会超出 uint64，numpy 计算结果与 Python 整数一致
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# 固定种子，保证不同进程、不同时间生成的签名可以互相比较（算法变化后用 scripts/rebuild_similarity_index.py 重建）
+_rng = random.Random(20261019)
+_PERMUTATIONS = [
+    (_rng.randint(1, _MAX_HASH), _rng.randint(0, _MAX_HASH))
+    for _ in range(NUM_PERM)
+]
+
+# numpy 每次处理的 shingle 数（控制中间矩阵的内存：128 × 4096 × 8 字节 = 4MB）
+_CHUNK_SIZE = 4096
+
+if np is not None:
+    _PERM_A = np.array([a for a, _ in _PERMUTATIONS], dtype=np.uint64).reshape(-1, 1)
+    _PERM_B = np.array([b for _, b in _PERMUTATIONS], dtype=np.uint64).reshape(-1, 1)
+
+
+def normalize_submission_text(file_contents):
+    """
+    归一化提交内容：代码去掉注释，所有文本去掉空白并转小写，
+    使改格式、改注释的抄袭仍能被识别
+
+    Args:
+        file_contents (dict): {文件名: 内容}
+
+    Returns:
+        str: 归一化后的文本
+    """
+    parts = []
+    for filename in sorted(file_contents):
+        content = file_contents[filename] or ''
+        if is_code_file(filename):
+            try:
+                content = strip_python_comments(content) if filename.lower().endswith('.py') \
+                    else strip_c_comments(content)
+            except Exception:
+                pass
+        parts.append(content)
+    return re.sub(r'\s+', '', '\n'.join(parts)).lower()
+
+
+def _hash32(data):
+    return int.from_bytes(hashlib.blake2b(data.encode('utf-8'), digest_size=4).digest(), 'big')
+
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """生成字符 shingle 的哈希集合（每个不同的 shingle 只哈希一次）"""
+    if len(text) <= size:
+        return {_hash32(text)} if text else set()
+    return {_hash32(shingle) for shingle in {text[i:i + size] for i in range(len(text) - size + 1)}}
+
+
+def compute_minhash(hashes):
+    """
+    计算 MinHash 签名
+
+    Args:
+        hashes (set): shingle 哈希集合（32 位整数）
+
+    Returns:
+        list: NUM_PERM 个整数
+    """
+    if np is not None:
+        return _minhash_numpy(hashes)
+    signature = []
+    for a, b in _PERMUTATIONS:
+        signature.append(min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes))
+    return signature
+
+
+def _minhash_numpy(hashes):
+    """所有置换一次算完：每块 shingle 得到 NUM_PERM × 块大小 的矩阵，按行取最小值"""
+    values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+    signature = np.full(NUM_PERM, _MAX_HASH, dtype=np.uint64)
+    for start in range(0, len(values), _CHUNK_SIZE):
+        chunk = values[start:start + _CHUNK_SIZE].reshape(1, -1)
+        permuted = ((_PERM_A * chunk + _PERM_B) % np.uint64(_MERSENNE_PRIME)) & np.uint64(_MAX_HASH)
+        np.minimum(signature, permuted.min(axis=1), out=signature)
+    return signature.tolist()
+
+
+def compute_signature(file_contents):
+    """
+    计算一份提交的签名，内容过短时返回 None
+
+    Args:
+        file_contents (dict): {文件名: 内容}
+
+    Returns:
+        list or None: MinHash 签名
+    """
+    text = normalize_submission_text(file_contents)
+    if len(text) < MIN_TEXT_LENGTH:
+        return None
+    return compute_minhash(shingle_hashes(text))
+
+
+def estimate_similarity(sig_a, sig_b):
+    """用签名中相同位置的比例估算 Jaccard 相似度"""
+    if not sig_a or not sig_b or len(sig_a) != len(sig_b):
+        return 0.0
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+def lsh_bucket_keys(signature):
+    """把签名切分为若干段，每段生成一个桶键（包含段号，不同段互不冲突）"""
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(','.join(map(str, rows)).encode(), digest_size=8).hexdigest()
+        keys.append(f"{band:02d}:{digest}")
+    return keys
+
+
+def index_artifact(artifact, file_contents=None):
+    """
+    为提交文件建立相似度索引（已建立时直接返回签名）
+
+    Args:
+        artifact (SubmissionArtifact): 提交文件记录（需已 flush 获得 id）
+        file_contents (dict): 提取文本，默认读取 artifact.extracted_text
+
+    Returns:
+        list or None: 签名
+    """
+    from models import db, SubmissionLSHBucket
+
+    if artifact.minhash_signature:
+        return json.loads(artifact.minhash_signature)
+
+    signature = compute_signature(file_contents if file_contents is not None else artifact.file_contents)
+    if signature is None:
+        return None
+
+    artifact.minhash_signature = json.dumps(signature)
+    db.session.add_all([
+        SubmissionLSHBucket(bucket_key=key, artifact_id=artifact.id)
+        for key in lsh_bucket_keys(signature)
+    ])
+    db.session.flush()
+    return signature
+
+
+def find_similar_artifacts(signature, threshold, exclude_ids=None, limit=20):
+    """
+    查询与签名相似的已索引提交：一次 IN 查询取出同桶候选，再用签名精确估算相似度
+
+    Args:
+        signature (list): MinHash 签名
+        threshold (float): 最低相似度
+        exclude_ids (iterable): 需要排除的 artifact id
+        limit (int): 最多返回数量
+
+    Returns:
+        list: [(artifact_id, similarity)]，按相似度降序
+    """
+    from models import SubmissionArtifact, SubmissionLSHBucket
+
+    if not signature:
+        return []
+    exclude_ids = set(exclude_ids or ())
+
+    candidate_ids = {
+        row.artifact_id for row in SubmissionLSHBucket.query.with_entities(SubmissionLSHBucket.artifact_id)
+        .filter(SubmissionLSHBucket.bucket_key.in_(lsh_bucket_keys(signature))).distinct()
+    } - exclude_ids
+    if not candidate_ids:
+        return []
+
+    matches = []
+    rows = SubmissionArtifact.query.with_entities(
+        SubmissionArtifact.id, SubmissionArtifact.minhash_signature
+    ).filter(SubmissionArtifact.id.in_(candidate_ids)).all()
+    for artifact_id, stored in rows:
+        if not stored:
+            continue
+        similarity = estimate_similarity(signature, json.loads(stored))
+        if similarity >= threshold:
+            matches.append((artifact_id, similarity))
+
+    matches.sort(key=lambda item: item[1], reverse=True)
+    return matches[:limit]
@@ -0,0 +1,133 @@
+"""
+套餐目录缓存模块
+定价页、早鸟状态和下单前检查都需要全部套餐及当前早鸟档位，
+这里一次查询载入所有套餐的只读快照，早鸟档位在内存中计算，目录按短时 TTL 刷新。
+后台增删改套餐时自动失效；名额占用/归还使某个套餐售罄或重新有名额时立即失效，
+其它已售数量的变化在所在事务提交后于本进程内累加到快照上（回滚时丢弃）
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models_membership import MembershipTier
+
+# 目录缓存的有效期（秒）：多进程部署时其它进程的修改最多延迟这么久生效
+TIER_CATALOG_TTL = 10
+
+EARLY_BIRD_CODES = ('early_bird_1', 'early_bird_2', 'early_bird_3')
+
+_catalog = None  # (过期时间, 目录)
+_lock = threading.Lock()
+
+
+class TierCatalog:
+    """全部套餐的快照及常用索引"""
+
+    def __init__(self, tiers):
+        self.tiers = sorted(tiers, key=lambda t: t.id)
+        self.by_id = {t.id: t for t in self.tiers}
+        self.by_code = {t.code: t for t in self.tiers}
+
+    def get(self, tier_id):
+        return self.by_id.get(tier_id)
+
+    def get_by_code(self, code):
+        return self.by_code.get(code)
+
+    def active_early_bird(self):
+        """上架的早鸟档位，按档位排序"""
+        return sorted((t for t in self.tiers if t.is_early_bird and t.is_active),
+                      key=lambda t: t.early_bird_tier or 0)
+
+    def standard_tiers(self):
+        """上架的非早鸟付费套餐，按排序字段排序"""
+        return sorted((t for t in self.tiers if not t.is_early_bird and t.is_active and t.code != 'free'),
+                      key=lambda t: t.sort_order or 0)
+
+    def paid_tiers(self):
+        """上架的付费套餐，按价格排序"""
+        return sorted((t for t in self.tiers if t.is_active and t.code != 'free'), key=lambda t: t.price or 0)
+
+
+def _snapshot(tier):
+    return SimpleNamespace(**{column.key: getattr(tier, column.key) for column in tier.__table__.columns})
+
+
+def tier_dict(tier):
+    """快照转为与 MembershipTier.to_dict 相同的字典"""
+    return MembershipTier.to_dict(tier)
+
+
+def get_tier_catalog():
+    """读取套餐目录，过期时重新载入（一次查询）"""
+    global _catalog
+    now = time.monotonic()
+    with _lock:
+        cached = _catalog
+    if cached and cached[0] > now:
+        return cached[1]
+
+    catalog = TierCatalog([_snapshot(t) for t in MembershipTier.query.all()])
+    with _lock:
+        _catalog = (now + TIER_CATALOG_TTL, catalog)
+    return catalog
+
+
+def invalidate_tier_catalog():
+    global _catalog
+    with _lock:
+        _catalog = None
+
+
+_PENDING_KEY = 'tier_sold_count_deltas'
+
+
+def note_sold_count_change(tier_id, delta):
+    """
+    名额占用（delta=1）或归还（delta<0）后调用。变化记在当前会话上，事务提交后才应用到快照：
+    售罄或重新有名额时目录立即失效（早鸟档位可能切换），否则只更新快照中的已售数量
+    """
+    from models import db
+
+    pending = db.session.info.setdefault(_PENDING_KEY, {})
+    pending[tier_id] = pending.get(tier_id, 0) + delta
+
+
+def _apply_sold_count_change(tier_id, delta):
+    global _catalog
+    with _lock:
+        tier = _catalog[1].get(tier_id) if _catalog else None
+        if tier is None:
+            return
+        quota = tier.total_quota or 0
+        before = tier.sold_count or 0
+        after = max(before + delta, 0)
+        if tier.is_limited and (before < quota) != (after < quota):
+            _catalog = None
+        else:
+            tier.sold_count = after
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending_changes(session):
+    for tier_id, delta in session.info.pop(_PENDING_KEY, {}).items():
+        if delta:
+            _apply_sold_count_change(tier_id, delta)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending_changes(session, previous_transaction):
+    # 只有整个事务回滚时才丢弃（保存点回滚不影响外层事务中的名额变化）
+    if previous_transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
+
+
+@event.listens_for(MembershipTier, 'after_insert')
+@event.listens_for(MembershipTier, 'after_update')
+@event.listens_for(MembershipTier, 'after_delete')
+def _tier_changed(mapper, connection, target):
+    invalidate_tier_catalog()
@@ -0,0 +1,181 @@
+"""
+限量套餐库存模块
+下单时用一条条件 UPDATE（sold_count < total_quota 时才 +1）原子地占用名额，
+并在订单上记录 inventory_reserved；订单取消、关闭或过期时同样用条件 UPDATE 释放，
+保证每个订单的名额只占用和释放一次，并发下单不会超卖。
+所有函数只在当前事务中执行，由调用方提交
+"""
+
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# 每批处理的过期订单数
+EXPIRE_BATCH_SIZE = 500
+
+
+def reserve_tier_slot(tier_id):
+    """
+    原子地占用限量套餐的一个名额
+
+    Returns:
+        bool: 是否占用成功（套餐不存在、不限量或已售罄时为 False）
+    """
+    from models_membership import MembershipTier
+    from utils.tier_catalog import note_sold_count_change, invalidate_tier_catalog
+
+    updated = MembershipTier.query.filter(
+        MembershipTier.id == tier_id,
+        MembershipTier.is_limited == True,
+        MembershipTier.sold_count < MembershipTier.total_quota
+    ).update({
+        MembershipTier.sold_count: MembershipTier.sold_count + 1,
+        MembershipTier.updated_at: datetime.utcnow()
+    }, synchronize_session=False)
+    if updated != 1:
+        # 目录缓存可能还认为有名额
+        invalidate_tier_catalog()
+        return False
+    note_sold_count_change(tier_id, 1)
+    return True
+
+
+def release_tier_slots(tier_id, count=1):
+    """原子地归还名额，已售数量不会减到 0 以下"""
+    from models import db
+    from models_membership import MembershipTier
+    from utils.tier_catalog import note_sold_count_change
+
+    if count <= 0:
+        return
+    MembershipTier.query.filter(MembershipTier.id == tier_id).update({
+        MembershipTier.sold_count: db.case(
+            (MembershipTier.sold_count > count, MembershipTier.sold_count - count), else_=0
+        ),
+        MembershipTier.updated_at: datetime.utcnow()
+    }, synchronize_session=False)
+    note_sold_count_change(tier_id, -count)
+
+
+def reserve_for_payment(payment, tier):
+    """
+    为待支付订单占用名额（不限量套餐直接返回 True）
+
+    Returns:
+        bool: 是否可以继续下单
+    """
+    if not tier.is_limited:
+        return True
+    if not reserve_tier_slot(tier.id):
+        return False
+    payment.inventory_reserved = True
+    return True
+
+
+def close_pending_payment(payment, status):
+    """
+    把待支付订单改为 cancelled/expired 并归还它占用的名额。
+    只有仍处于 pending 的订单会被修改，与支付回调、过期清理并发执行时名额只释放一次
+
+    Returns:
+        bool: 本次调用是否关闭了订单
+    """
+    from models import db
+    from models_membership import PaymentTransaction
+
+    pending = PaymentTransaction.query.filter(
+        PaymentTransaction.id == payment.id,
+        PaymentTransaction.status == 'pending'
+    )
+    released = pending.filter(PaymentTransaction.inventory_reserved == True).update({
+        PaymentTransaction.status: status,
+        PaymentTransaction.inventory_reserved: False
+    }, synchronize_session=False)
+    if released:
+        release_tier_slots(payment.tier_id)
+        closed = True
+    else:
+        closed = pending.update({PaymentTransaction.status: status}, synchronize_session=False) == 1
+    db.session.expire(payment, ['status', 'inventory_reserved'])
+    return closed
+
+
+def confirm_payment_slot(payment):
+    """
+    支付成功时确认订单占用的名额。订单已过期或取消后才到账时重新占用一个名额；
+    此时若已售罄仍计入已售数量（用户已付款），并记录警告以便人工处理
+    """
+    from models import db
+    from models_membership import MembershipTier, PaymentTransaction
+    from utils.tier_catalog import invalidate_tier_catalog
+
+    tier = db.session.get(MembershipTier, payment.tier_id)
+    if tier is None or not tier.is_limited:
+        return
+    # 锁定订单行，避免与过期清理同时修改
+    reserved = db.session.query(PaymentTransaction.inventory_reserved).filter(
+        PaymentTransaction.id == payment.id
+    ).with_for_update().scalar()
+    if reserved:
+        return
+
+    if not reserve_tier_slot(tier.id):
+        logger.warning(f"订单 {payment.transaction_id} 到账时 {tier.name} 已售罄，已售数量将超过总名额")
+        MembershipTier.query.filter(MembershipTier.id == tier.id).update(
+            {MembershipTier.sold_count: MembershipTier.sold_count + 1}, synchronize_session=False
+        )
+        invalidate_tier_catalog()
+    PaymentTransaction.query.filter(PaymentTransaction.id == payment.id).update(
+        {PaymentTransaction.inventory_reserved: True}, synchronize_session=False
+    )
+    db.session.expire(payment, ['inventory_reserved'])
+
+
+def expire_lapsed_payments(tier_id=None, now=None, batch_size=EXPIRE_BATCH_SIZE):
+    """
+    把已超过 expires_at 的待支付订单批量标记为 expired，并按套餐一次性归还名额（每批提交一次）
+
+    Args:
+        tier_id (int): 只处理该套餐的订单，为空时处理全部
+        now (datetime): 当前时间（UTC）
+        batch_size (int): 每批处理的订单数
+
+    Returns:
+        int: 过期的订单数
+    """
+    from models import db
+    from models_membership import PaymentTransaction
+
+    now = now or datetime.utcnow()
+    expired = 0
+    while True:
+        query = db.session.query(PaymentTransaction.id, PaymentTransaction.tier_id).filter(
+            PaymentTransaction.status == 'pending',
+            PaymentTransaction.expires_at < now
+        )
+        if tier_id is not None:
+            query = query.filter(PaymentTransaction.tier_id == tier_id)
+        batch = query.order_by(PaymentTransaction.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        by_tier = {}
+        for payment_id, payment_tier_id in batch:
+            by_tier.setdefault(payment_tier_id, []).append(payment_id)
+        for payment_tier_id, ids in by_tier.items():
+            pending = PaymentTransaction.query.filter(
+                PaymentTransaction.id.in_(ids), PaymentTransaction.status == 'pending'
+            )
+            released = pending.filter(PaymentTransaction.inventory_reserved == True).update({
+                PaymentTransaction.status: 'expired',
+                PaymentTransaction.inventory_reserved: False
+            }, synchronize_session=False)
+            release_tier_slots(payment_tier_id, released)
+            expired += released + pending.update(
+                {PaymentTransaction.status: 'expired'}, synchronize_session=False
+            )
+        db.session.commit()
+        if len(batch) < batch_size:
+            break
+    return expired
@@ -0,0 +1,219 @@
+"""
+功能使用计数模块
+每次使用时对 (用户, 功能, 周期, 周期起点) 计数行做原子 upsert，
+配额检查只按唯一键读取一行，不再对 usage_logs 做 COUNT；usage_logs 仅作审计记录
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+PERIODS = ('daily', 'weekly', 'monthly')
+
+# 用户使用概况的进程内缓存：{user_id: (过期时间, 概况)}，新的使用记录提交后失效
+SUMMARY_TTL_SECONDS = 10
+_summary_cache = {}
+_summary_lock = threading.Lock()
+
+
+def bucket_start(period, now=None):
+    """
+    周期起点：daily 为当天，weekly 为本周一，monthly 为本月1日（与原统计口径一致，使用服务器本地时间）
+
+    Returns:
+        date: 周期起点日期
+    """
+    now = now or datetime.now()
+    today = now.date() if isinstance(now, datetime) else now
+    if period == 'weekly':
+        return today - timedelta(days=today.weekday())
+    if period == 'monthly':
+        return today.replace(day=1)
+    return today
+
+
+def upsert_add_statement(model, rows, index_elements, dialect, column='count'):
+    """
+    按数据库方言生成 INSERT ... ON CONFLICT DO UPDATE 累加语句
+
+    Args:
+        model: 模型类
+        rows (list): 行数据
+        index_elements (list): 唯一约束的列
+        dialect (str): 数据库方言名称
+        column (str): 累加的列
+
+    Returns:
+        语句对象，数据库不支持时返回 None
+    """
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    stmt = insert(model).values(rows)
+    target = getattr(model, column)
+    set_ = {column: target + getattr(stmt.excluded, column)}
+    if 'updated_at' in rows[0]:
+        set_['updated_at'] = stmt.excluded.updated_at
+    return stmt.on_conflict_do_update(index_elements=index_elements, set_=set_)
+
+
+def increment_usage(user_id, feature_code, amount=1, now=None):
+    """
+    在当前事务中累加三个周期的计数（不提交）
+
+    Args:
+        user_id (int): 用户ID
+        feature_code (str): 功能代码
+        amount (int): 增加的次数
+        now (datetime): 使用时间，默认当前时间
+    """
+    increment_usage_bulk([(user_id, feature_code, now or datetime.now(), amount)])
+
+
+def increment_usage_bulk(events):
+    """
+    批量累加计数（不提交），同一计数行的多次使用先在内存中合并
+
+    Args:
+        events (iterable): [(user_id, feature_code, 使用时间, 次数)]
+    """
+    from models import db
+    from models_membership import UsageCounter
+
+    merged = {}
+    for user_id, feature_code, used_at, amount in events:
+        for period in PERIODS:
+            key = (user_id, feature_code, period, bucket_start(period, used_at))
+            merged[key] = merged.get(key, 0) + amount
+    if not merged:
+        return
+
+    updated_at = datetime.utcnow()
+    rows = [
+        {'user_id': k[0], 'feature_code': k[1], 'period': k[2], 'bucket_start': k[3],
+         'count': v, 'updated_at': updated_at}
+        for k, v in merged.items()
+    ]
+    stmt = upsert_add_statement(UsageCounter, rows, ['user_id', 'feature_code', 'period', 'bucket_start'],
+                                db.session.get_bind().dialect.name)
+    if stmt is not None:
+        db.session.execute(stmt)
+        return
+
+    # 其它数据库：先更新，没有命中的行再插入
+    for row in rows:
+        updated = UsageCounter.query.filter_by(
+            user_id=row['user_id'], feature_code=row['feature_code'],
+            period=row['period'], bucket_start=row['bucket_start']
+        ).update({UsageCounter.count: UsageCounter.count + row['count'], UsageCounter.updated_at: updated_at},
+                 synchronize_session=False)
+        if not updated:
+            db.session.add(UsageCounter(**row))
+
+
+def get_usage_count(user_id, feature_code, period='daily', now=None):
+    """读取当前周期的使用次数（唯一键查询）"""
+    from models import db
+    from models_membership import UsageCounter
+
+    if period not in PERIODS:
+        period = 'daily'
+    count = db.session.query(UsageCounter.count).filter_by(
+        user_id=user_id, feature_code=feature_code, period=period, bucket_start=bucket_start(period, now)
+    ).scalar()
+    return count or 0
+
+
+def get_usage_summary(user_id, now=None):
+    """
+    一次查询取出用户所有功能在当前日/周/月周期的使用次数，结果短暂缓存（页面展示用，配额检查不走缓存）
+
+    Returns:
+        dict: {feature_code: {'daily': n, 'weekly': n, 'monthly': n}}，没有使用过的功能不出现
+    """
+    from models import db
+    from models_membership import UsageCounter
+
+    if now is None:
+        with _summary_lock:
+            cached = _summary_cache.get(user_id)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+    current = {p: bucket_start(p, now) for p in PERIODS}
+    rows = db.session.query(UsageCounter.feature_code, UsageCounter.period, UsageCounter.count).filter(
+        UsageCounter.user_id == user_id,
+        db.or_(*[
+            db.and_(UsageCounter.period == period, UsageCounter.bucket_start == bucket)
+            for period, bucket in current.items()
+        ])
+    ).all()
+
+    summary = {}
+    for feature_code, period, count in rows:
+        summary.setdefault(feature_code, {p: 0 for p in PERIODS})[period] = count
+
+    if now is None:
+        with _summary_lock:
+            _summary_cache[user_id] = (time.monotonic() + SUMMARY_TTL_SECONDS, summary)
+    return summary
+
+
+def summary_count(summary, feature_code, period='daily'):
+    """从 get_usage_summary 的结果中取某个功能某个周期的次数（未知周期按 daily）"""
+    if period not in PERIODS:
+        period = 'daily'
+    return summary.get(feature_code, {}).get(period, 0)
+
+
+def invalidate_usage_summary(user_id=None):
+    """新的使用记录提交后清除缓存，user_id 为空时清除全部"""
+    with _summary_lock:
+        if user_id is None:
+            _summary_cache.clear()
+        else:
+            _summary_cache.pop(user_id, None)
+
+
+def rebuild_counters(now=None):
+    """
+    按 usage_logs 重建当前各周期的计数（上线计数表或修复数据时使用）
+
+    Returns:
+        int: 写入的计数行数
+    """
+    from models import db
+    from models_membership import UsageCounter, UsageLog
+
+    now = now or datetime.now()
+    current = {p: bucket_start(p, now) for p in PERIODS}
+    earliest = min(current.values())
+    UsageCounter.query.filter(UsageCounter.bucket_start >= earliest).delete(synchronize_session=False)
+
+    day = db.func.date(UsageLog.created_at)
+    grouped = db.session.query(
+        UsageLog.user_id, UsageLog.feature_code, day, db.func.count(UsageLog.id)
+    ).filter(
+        UsageLog.created_at >= datetime.combine(earliest, datetime.min.time())
+    ).group_by(UsageLog.user_id, UsageLog.feature_code, day).all()
+
+    merged = {}
+    for user_id, feature_code, used_on, count in grouped:
+        if isinstance(used_on, str):  # SQLite 的 date() 返回字符串
+            used_on = datetime.strptime(used_on, '%Y-%m-%d').date()
+        for period in PERIODS:
+            if bucket_start(period, used_on) != current[period]:
+                continue  # 已经过去的周期不会再被查询
+            key = (user_id, feature_code, period, current[period])
+            merged[key] = merged.get(key, 0) + count
+
+    for (user_id, feature_code, period, bucket), count in merged.items():
+        db.session.add(UsageCounter(
+            user_id=user_id, feature_code=feature_code, period=period, bucket_start=bucket, count=count
+        ))
+    db.session.commit()
+    invalidate_usage_summary()
+    return len(merged)
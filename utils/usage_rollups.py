@@ -0,0 +1,202 @@
+"""
+功能使用汇总模块
+usage_logs 批量写入时同步累加按小时/天、功能、会员等级、注册月份汇总的 usage_rollups，
+后台的使用量图表只读汇总表，不再在请求时对 usage_logs 做 GROUP BY；
+历史数据用 backfill_usage_rollups（scripts/backfill_usage_rollups.py）回填
+"""
+
+from datetime import datetime, timedelta
+
+from utils.usage_counters import upsert_add_statement
+
+GRANULARITIES = ('hour', 'day')
+GROUP_COLUMNS = ('feature_code', 'tier_code', 'cohort')
+
+ROLLUP_KEY = ['granularity', 'bucket_start', 'feature_code', 'tier_code', 'cohort']
+
+
+def truncate(moment, granularity):
+    """截断到整点或当天零点"""
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _user_dimensions(connection, user_ids):
+    """
+    一次查询取出用户的会员等级和注册月份
+
+    Returns:
+        dict: {user_id: (tier_code, cohort)}
+    """
+    from models import db
+    from models_membership import User, UserMembership, MembershipTier
+
+    if not user_ids:
+        return {}
+    rows = connection.execute(
+        db.select(User.id, User.created_at, MembershipTier.code, MembershipTier.level)
+        .select_from(User)
+        .outerjoin(UserMembership, db.and_(
+            UserMembership.user_id == User.id,
+            UserMembership.is_active == True,
+            UserMembership.end_date > datetime.utcnow()
+        ))
+        .outerjoin(MembershipTier, MembershipTier.id == UserMembership.tier_id)
+        .where(User.id.in_(list(user_ids)))
+    ).all()
+
+    dimensions = {}
+    levels = {}
+    for user_id, created_at, tier_code, level in rows:
+        cohort = created_at.strftime('%Y-%m') if created_at else 'unknown'
+        # 同时有多条有效会员时取等级最高的
+        if user_id not in dimensions or (level or 0) > levels[user_id]:
+            dimensions[user_id] = (tier_code or 'free', cohort)
+            levels[user_id] = level or 0
+    return dimensions
+
+
+def aggregate(usage_rows, dimensions):
+    """
+    把使用记录汇总为 {(granularity, bucket_start, feature_code, tier_code, cohort): 次数}
+
+    Args:
+        usage_rows (iterable): 含 user_id、feature_code、created_at 的 dict
+        dimensions (dict): _user_dimensions 的结果
+    """
+    totals = {}
+    for row in usage_rows:
+        created_at = row['created_at']
+        if created_at is None:
+            continue
+        tier_code, cohort = dimensions.get(row['user_id'], ('free', 'unknown'))
+        for granularity in GRANULARITIES:
+            key = (granularity, truncate(created_at, granularity), row['feature_code'], tier_code, cohort)
+            totals[key] = totals.get(key, 0) + 1
+    return totals
+
+
+def _apply_totals(connection, totals):
+    from models import db
+    from models_membership import UsageRollup
+
+    if not totals:
+        return
+    rows = [dict(zip(ROLLUP_KEY, key), count=count) for key, count in totals.items()]
+    stmt = upsert_add_statement(UsageRollup, rows, ROLLUP_KEY, connection.dialect.name)
+    if stmt is not None:
+        connection.execute(stmt)
+        return
+    # 其它数据库：先更新，没有命中的行再插入
+    table = UsageRollup.__table__
+    for row in rows:
+        result = connection.execute(
+            table.update().where(db.and_(*[table.c[k] == row[k] for k in ROLLUP_KEY]))
+            .values(count=table.c.count + row['count'])
+        )
+        if not result.rowcount:
+            connection.execute(table.insert().values(**row))
+
+
+def apply_usage_rollups(connection, usage_rows):
+    """写入缓冲批量插入 usage_logs 时调用，在同一事务中（先于 INSERT）累加汇总"""
+    usage_rows = list(usage_rows)
+    dimensions = _user_dimensions(connection, {row['user_id'] for row in usage_rows})
+    _apply_totals(connection, aggregate(usage_rows, dimensions))
+
+
+def backfill_usage_rollups(since=None, batch_size=5000):
+    """
+    从 usage_logs 重建汇总（since 为空时重建全部）。
+    锁住汇总表后在同一事务中先删除旧汇总、再读取日志最大 id：写入缓冲先累加汇总再插入日志，
+    此时已提交的日志一定 id 不大于最大 id、由回填计数，之后写入的日志等锁释放后自行累加，
+    每条日志只计数一次；历史日志按当前的会员等级归类
+
+    Returns:
+        int: 处理的日志条数
+    """
+    from models import db
+    from models_membership import UsageLog, UsageRollup
+
+    start = truncate(since, 'day') if since else None
+    if db.session.connection().dialect.name == 'postgresql':
+        # 阻塞写入缓冲的汇总累加，直到删除和读取最大 id 一起提交（SQLite 的写事务本身是串行的）
+        db.session.execute(db.text(f'LOCK TABLE {UsageRollup.__tablename__} IN EXCLUSIVE MODE'))
+
+    deleted = UsageRollup.query
+    if start is not None:
+        deleted = deleted.filter(UsageRollup.bucket_start >= start)
+    deleted.delete(synchronize_session=False)
+    max_id = db.session.query(db.func.max(UsageLog.id)).scalar() or 0
+    db.session.commit()
+
+    processed = 0
+    last_id = 0
+    while last_id < max_id:
+        query = db.session.query(UsageLog.id, UsageLog.user_id, UsageLog.feature_code, UsageLog.created_at).filter(
+            UsageLog.id > last_id, UsageLog.id <= max_id
+        )
+        if start is not None:
+            query = query.filter(UsageLog.created_at >= start)
+        batch = query.order_by(UsageLog.id).limit(batch_size).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+        apply_usage_rollups(db.session.connection(), [
+            {'user_id': row.user_id, 'feature_code': row.feature_code, 'created_at': row.created_at}
+            for row in batch
+        ])
+        db.session.commit()
+        processed += len(batch)
+    return processed
+
+
+def rollup_series(granularity, start, end, feature_codes=None, group_by='feature_code', filters=None):
+    """
+    读取汇总序列
+
+    Args:
+        granularity (str): hour/day
+        start (datetime): 开始时间（含）
+        end (datetime): 结束时间（含）
+        feature_codes (list): 只统计这些功能
+        group_by (str): feature_code/tier_code/cohort
+        filters (dict): 其它维度过滤，如 {'tier_code': 'monthly'}
+
+    Returns:
+        list: [(bucket_start, 分组值, 次数)]
+    """
+    from models import db
+    from models_membership import UsageRollup
+
+    if granularity not in GRANULARITIES:
+        granularity = 'day'
+    if group_by not in GROUP_COLUMNS:
+        group_by = 'feature_code'
+    group_column = getattr(UsageRollup, group_by)
+
+    query = db.session.query(
+        UsageRollup.bucket_start, group_column, db.func.sum(UsageRollup.count)
+    ).filter(
+        UsageRollup.granularity == granularity,
+        UsageRollup.bucket_start >= truncate(start, granularity),
+        UsageRollup.bucket_start <= end
+    )
+    if feature_codes:
+        query = query.filter(UsageRollup.feature_code.in_(list(feature_codes)))
+    for column, value in (filters or {}).items():
+        if column in GROUP_COLUMNS and value:
+            query = query.filter(getattr(UsageRollup, column) == value)
+    return query.group_by(UsageRollup.bucket_start, group_column).order_by(UsageRollup.bucket_start).all()
+
+
+def bucket_range(start, end, granularity):
+    """生成 start 到 end 之间的所有时间桶（图表补齐空白用）"""
+    step = timedelta(hours=1) if granularity == 'hour' else timedelta(days=1)
+    current = truncate(start, granularity)
+    buckets = []
+    while current <= end:
+        buckets.append(current)
+        current += step
+    return buckets
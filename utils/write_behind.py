@@ -0,0 +1,209 @@
+"""
+日志写入缓冲模块（write-behind）
+功能使用日志和管理员操作日志只用于审计和统计，不必在每个请求中单独提交事务：
+请求只把行数据放入有界队列，后台线程每隔一段时间或攒够一批后批量 INSERT。
+队列满时调用方等待一小段时间，仍然放不进去就在当前线程直接写入（反压），
+进程退出时会把队列中剩余的数据全部写入。
+
+配额计数（usage_counters）仍然同步写入，配额判断不依赖这里缓冲的数据
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """按模型分组批量写入的后台缓冲"""
+
+    def __init__(self, flush_interval_ms=500, max_batch=200, max_queue=10000, put_timeout_ms=50):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self.put_timeout = put_timeout_ms / 1000
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._app = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        self._after_insert = {}
+        self.enabled = False
+
+    def init_app(self, app):
+        """读取配置并注册退出时的刷新；后台线程在第一次写入时启动（兼容多进程 fork）"""
+        self._app = app
+        self.enabled = app.config.get('WRITE_BEHIND_ENABLED', True) and not app.config.get('TESTING', False)
+        self.flush_interval = app.config.get('WRITE_BEHIND_FLUSH_MS', 500) / 1000
+        self.max_batch = app.config.get('WRITE_BEHIND_MAX_BATCH', 200)
+        self._queue = queue.Queue(maxsize=app.config.get('WRITE_BEHIND_MAX_QUEUE', 10000))
+        atexit.register(self.shutdown)
+
+    def after_insert(self, model, callback):
+        """
+        注册某个模型写入时的回调 callback(connection, rows)。
+        回调与 INSERT 在同一事务中、先于 INSERT 执行，日志和回调的结果同时提交或回滚
+        （usage_rollups 回填依赖这一点，见 backfill_usage_rollups）
+        """
+        self._after_insert[model] = callback
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+
+    def add(self, model, values):
+        """
+        缓冲一行数据
+
+        Args:
+            model: SQLAlchemy 模型类
+            values (dict): 列值
+        """
+        if not self.enabled or self._app is None:
+            self._write([(model, values)])
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put((model, values), timeout=self.put_timeout)
+        except queue.Full:
+            # 反压：后台写入跟不上时由调用方同步写入
+            self._write([(model, values)])
+
+    def _drain(self):
+        batch = []
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopping.is_set():
+            deadline = time.monotonic() + self.flush_interval
+            batch = []
+            # 攒够一批或到达刷新间隔时写入
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+
+    def _write(self, items):
+        """按模型分组批量 INSERT；使用独立连接，不干扰请求自己的事务"""
+        from flask import has_app_context
+
+        grouped = {}
+        for model, values in items:
+            grouped.setdefault(model, []).append(values)
+        # executemany 要求每行的列相同，缺少的列补 None（有默认值的列由 record_* 函数预先填好）
+        for model, rows in grouped.items():
+            keys = set().union(*rows)
+            grouped[model] = [{key: row.get(key) for key in keys} for row in rows]
+
+        if has_app_context():
+            self._insert(grouped)
+        elif self._app is not None:
+            with self._app.app_context():
+                self._insert(grouped)
+        else:
+            logger.warning("写入缓冲未初始化，丢弃 %d 条日志", len(items))
+
+    def _insert(self, grouped):
+        """每个模型单独一个事务写入，互不影响"""
+        for model, rows in grouped.items():
+            self._insert_rows(model, rows)
+
+    def _insert_rows(self, model, rows):
+        """
+        批量写入一个模型的行（连同回调）；整批失败时（如某行的外键指向已删除的用户、回调出错）
+        改为逐行写入，只丢弃写不进去的行
+
+        Returns:
+            list: 成功写入的行
+        """
+        from models import db
+
+        try:
+            with db.engine.begin() as connection:
+                self._run_callback(connection, model, rows)
+                connection.execute(db.insert(model), rows)
+            return rows
+        except Exception:
+            if len(rows) == 1:
+                logger.exception("写入%s失败，丢弃 1 条", model.__name__)
+                return []
+            logger.warning("批量写入%s失败，改为逐行写入 %d 条", model.__name__, len(rows), exc_info=True)
+
+        inserted = []
+        for row in rows:
+            try:
+                with db.engine.begin() as connection:
+                    self._run_callback(connection, model, [row])
+                    connection.execute(db.insert(model), [row])
+                inserted.append(row)
+            except Exception as e:
+                logger.error("写入%s失败，丢弃 1 条: %s", model.__name__, e)
+        return inserted
+
+    def _run_callback(self, connection, model, rows):
+        """
+        执行回调；回调失败时异常向上抛出，与 INSERT 一起回滚并按逐行写入重试，
+        不会出现日志已写入而汇总缺失的情况
+        """
+        callback = self._after_insert.get(model)
+        if callback is not None:
+            callback(connection, rows)
+
+    def flush(self):
+        """把队列中的数据全部写入（测试或退出时使用）"""
+        while True:
+            batch = self._drain()
+            if not batch:
+                break
+            self._write(batch)
+
+    def shutdown(self):
+        """停止后台线程并写入剩余数据"""
+        self._stopping.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=self.flush_interval * 2 + 1)
+        self.flush()
+
+
+log_buffer = WriteBehindBuffer()
+
+
+def record_usage_log(user_id, feature_code, action='used', details=None, created_at=None):
+    """缓冲一条功能使用日志"""
+    from models_membership import UsageLog
+
+    log_buffer.add(UsageLog, {
+        'user_id': user_id,
+        'feature_code': feature_code,
+        'action': action,
+        'details': details,
+        'created_at': created_at or datetime.now()
+    })
+
+
+def record_admin_log(**values):
+    """缓冲一条管理员操作日志，参数与 AdminLog 的列相同"""
+    from models_admin import AdminLog
+
+    values.setdefault('created_at', datetime.utcnow())
+    values.setdefault('status', 'success')
+    log_buffer.add(AdminLog, values)